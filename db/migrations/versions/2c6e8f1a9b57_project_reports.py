@@ -0,0 +1,121 @@
+"""Denormalized per-project report snapshot kept current by triggers
+
+Revision ID: 2c6e8f1a9b57
+Revises: 7f2d9b4e8a16
+Create Date: 2026-10-18 21:14:05.318240
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2c6e8f1a9b57'
+down_revision: Union[str, Sequence[str], None] = '7f2d9b4e8a16'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(sa.text("""
+-- One row per project with its latest calculation, for the report download,
+-- availability and export paths (one primary-key lookup instead of two
+-- queries). Kept current by triggers on projects and calculations, so every
+-- service that writes them (calculation, payment, GDPR erasure) updates it.
+CREATE TABLE IF NOT EXISTS project_reports (
+    project_id UUID PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+    project_name VARCHAR(255),
+    status VARCHAR(50) NOT NULL,
+    cost_usd NUMERIC(10, 2),
+    location_lat NUMERIC(9, 6),
+    location_lon NUMERIC(9, 6),
+    lidar_geom GEOMETRY(Point, 4326),
+    metadata JSONB,
+    project_created_at TIMESTAMP WITH TIME ZONE,
+    calculation_id UUID,
+    annual_kwh NUMERIC(10, 2),
+    shading_loss_pct NUMERIC(5, 2),
+    financial_data JSONB,
+    calculation_created_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION refresh_project_report(report_project_id UUID) RETURNS void AS $$
+BEGIN
+    INSERT INTO project_reports (
+        project_id, project_name, status, cost_usd, location_lat, location_lon, lidar_geom, metadata,
+        project_created_at, calculation_id, annual_kwh, shading_loss_pct, financial_data, calculation_created_at,
+        updated_at
+    )
+    SELECT p.id, p.project_name, p.status, p.cost_usd, p.location_lat, p.location_lon, p.lidar_geom, p.metadata,
+           p.created_at, c.id, c.annual_kwh, c.shading_loss_pct, c.financial_data, c.created_at,
+           CURRENT_TIMESTAMP
+    FROM projects p
+    LEFT JOIN LATERAL (
+        SELECT id, annual_kwh, shading_loss_pct, financial_data, created_at
+        FROM calculations
+        WHERE project_id = p.id
+        ORDER BY created_at DESC
+        LIMIT 1
+    ) c ON true
+    WHERE p.id = report_project_id
+    ON CONFLICT (project_id) DO UPDATE SET
+        project_name = EXCLUDED.project_name,
+        status = EXCLUDED.status,
+        cost_usd = EXCLUDED.cost_usd,
+        location_lat = EXCLUDED.location_lat,
+        location_lon = EXCLUDED.location_lon,
+        lidar_geom = EXCLUDED.lidar_geom,
+        metadata = EXCLUDED.metadata,
+        project_created_at = EXCLUDED.project_created_at,
+        calculation_id = EXCLUDED.calculation_id,
+        annual_kwh = EXCLUDED.annual_kwh,
+        shading_loss_pct = EXCLUDED.shading_loss_pct,
+        financial_data = EXCLUDED.financial_data,
+        calculation_created_at = EXCLUDED.calculation_created_at,
+        updated_at = EXCLUDED.updated_at;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION project_reports_sync() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'projects' THEN
+        PERFORM refresh_project_report(NEW.id);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM refresh_project_report(OLD.project_id);
+    ELSE
+        PERFORM refresh_project_report(NEW.project_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER project_reports_on_project
+    AFTER INSERT OR UPDATE ON projects
+    FOR EACH ROW EXECUTE FUNCTION project_reports_sync();
+
+CREATE OR REPLACE TRIGGER project_reports_on_calculation
+    AFTER INSERT OR UPDATE OR DELETE ON calculations
+    FOR EACH ROW EXECUTE FUNCTION project_reports_sync();
+
+-- Latest calculation per project, for the snapshot refresh
+CREATE INDEX IF NOT EXISTS idx_calculations_project_latest ON calculations(project_id, created_at DESC);
+
+-- Backfill existing projects
+SELECT refresh_project_report(id) FROM projects;
+    """))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(sa.text("""
+DROP TRIGGER IF EXISTS project_reports_on_calculation ON calculations;
+DROP TRIGGER IF EXISTS project_reports_on_project ON projects;
+DROP FUNCTION IF EXISTS project_reports_sync();
+DROP FUNCTION IF EXISTS refresh_project_report(UUID);
+DROP INDEX IF EXISTS idx_calculations_project_latest;
+DROP TABLE IF EXISTS project_reports;
+    """))
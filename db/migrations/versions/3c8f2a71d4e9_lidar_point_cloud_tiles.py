@@ -0,0 +1,55 @@
+"""LIDAR point cloud tiles
+
+Revision ID: 3c8f2a71d4e9
+Revises: fab555928309
+Create Date: 2026-10-18 10:12:04.381552
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c8f2a71d4e9'
+down_revision: Union[str, Sequence[str], None] = 'fab555928309'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(sa.text("""
+-- Quantization of a project's stored point cloud (native CRS of the LIDAR file)
+CREATE TABLE IF NOT EXISTS lidar_clouds (
+    project_id UUID PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+    scales DOUBLE PRECISION[] NOT NULL,
+    offsets DOUBLE PRECISION[] NOT NULL,
+    tile_size_m REAL NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Point cloud tiles: zlib-compressed int32 x/y/z + uint8 classification per tile
+CREATE TABLE IF NOT EXISTS lidar_tiles (
+    id BIGSERIAL PRIMARY KEY,
+    project_id UUID NOT NULL REFERENCES lidar_clouds(project_id) ON DELETE CASCADE,
+    level SMALLINT NOT NULL DEFAULT 0,
+    tile_x INTEGER NOT NULL,
+    tile_y INTEGER NOT NULL,
+    point_count INTEGER NOT NULL,
+    z_min REAL,
+    z_max REAL,
+    extent GEOMETRY(Polygon) NOT NULL,
+    points BYTEA NOT NULL,
+    UNIQUE (project_id, level, tile_x, tile_y)
+);
+
+CREATE INDEX IF NOT EXISTS idx_lidar_tiles_extent ON lidar_tiles USING GIST (extent);
+    """))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(sa.text("DROP TABLE IF EXISTS lidar_tiles;"))
+    op.execute(sa.text("DROP TABLE IF EXISTS lidar_clouds;"))
@@ -0,0 +1,32 @@
+"""LIDAR point cloud pyramid levels
+
+Revision ID: 5b7e1d9a3c62
+Revises: 9d41b6e0c2a7
+Create Date: 2026-10-18 15:02:47.218904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7e1d9a3c62'
+down_revision: Union[str, Sequence[str], None] = '9d41b6e0c2a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(sa.text("""
+-- Voxel edge in metres of each stored pyramid level above full resolution
+ALTER TABLE lidar_clouds ADD COLUMN IF NOT EXISTS pyramid_voxels_m REAL[] NOT NULL DEFAULT '{}';
+    """))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(sa.text("DELETE FROM lidar_tiles WHERE level > 0;"))
+    op.execute(sa.text("ALTER TABLE lidar_clouds DROP COLUMN IF EXISTS pyramid_voxels_m;"))
@@ -0,0 +1,38 @@
+"""Hourly AC/DC/POA series per project for binary export
+
+Revision ID: 7f2d9b4e8a16
+Revises: e4a7c1f05b38
+Create Date: 2026-10-18 19:02:44.180561
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f2d9b4e8a16'
+down_revision: Union[str, Sequence[str], None] = 'e4a7c1f05b38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(sa.text("""
+-- Hourly series of a project's latest calculation: ac_w, dc_w and poa_w_m2
+-- back to back as little-endian float32, 8760 values each (uncompressed)
+CREATE TABLE IF NOT EXISTS project_profiles (
+    project_id UUID PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+    data BYTEA NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+-- Already float32 noise; skip TOAST compression so reads stream the bytes as stored
+ALTER TABLE project_profiles ALTER COLUMN data SET STORAGE EXTERNAL;
+    """))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(sa.text("DROP TABLE IF EXISTS project_profiles;"))
@@ -0,0 +1,39 @@
+"""Calculation result memo
+
+Revision ID: 9d41b6e0c2a7
+Revises: 3c8f2a71d4e9
+Create Date: 2026-10-18 13:47:21.905116
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d41b6e0c2a7'
+down_revision: Union[str, Sequence[str], None] = '3c8f2a71d4e9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(sa.text("""
+-- Results of earlier calculations keyed by a content hash of their inputs
+CREATE TABLE IF NOT EXISTS calculation_memo (
+    input_hash CHAR(64) PRIMARY KEY,
+    project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    result JSONB NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    last_used_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_calculation_memo_last_used_at ON calculation_memo(last_used_at);
+    """))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(sa.text("DROP TABLE IF EXISTS calculation_memo;"))
@@ -0,0 +1,34 @@
+"""Store the shading loss fraction to four decimal places
+
+Revision ID: b83d5f2e6a19
+Revises: 2c6e8f1a9b57
+Create Date: 2026-10-18 23:41:26.507183
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b83d5f2e6a19'
+down_revision: Union[str, Sequence[str], None] = '2c6e8f1a9b57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(sa.text("""
+-- shading_loss_pct holds the lost fraction (0.0347 for 3.47%); two decimal
+-- places rounded it to whole percent
+ALTER TABLE calculations ALTER COLUMN shading_loss_pct TYPE NUMERIC(5, 4);
+ALTER TABLE project_reports ALTER COLUMN shading_loss_pct TYPE NUMERIC(5, 4);
+    """))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(sa.text("ALTER TABLE project_reports ALTER COLUMN shading_loss_pct TYPE NUMERIC(5, 2);"))
+    op.execute(sa.text("ALTER TABLE calculations ALTER COLUMN shading_loss_pct TYPE NUMERIC(5, 2);"))
@@ -0,0 +1,37 @@
+"""Per-project stage outputs for incremental recalculation
+
+Revision ID: e4a7c1f05b38
+Revises: 5b7e1d9a3c62
+Create Date: 2026-10-18 17:41:09.532117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4a7c1f05b38'
+down_revision: Union[str, Sequence[str], None] = '5b7e1d9a3c62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(sa.text("""
+-- Stage outputs of a project's latest calculation: request and stage inputs
+-- as JSON, arrays (weather, solar position, shading mask, POA) as a compressed .npz
+CREATE TABLE IF NOT EXISTS project_intermediates (
+    project_id UUID PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+    inputs JSONB NOT NULL,
+    arrays BYTEA NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+    """))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(sa.text("DROP TABLE IF EXISTS project_intermediates;"))
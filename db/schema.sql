@@ -25,13 +25,151 @@ CREATE TABLE IF NOT EXISTS calculations (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
     annual_kwh NUMERIC(10, 2),
-    shading_loss_pct NUMERIC(5, 2),
+    -- Fraction of the open-sky yield lost to shading (0.0347 for 3.47%)
+    shading_loss_pct NUMERIC(5, 4),
     financial_data JSONB,
     -- Add other calculation results as needed
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Quantization of a project's stored point cloud (native CRS of the LIDAR file)
+CREATE TABLE IF NOT EXISTS lidar_clouds (
+    project_id UUID PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+    scales DOUBLE PRECISION[] NOT NULL,
+    offsets DOUBLE PRECISION[] NOT NULL,
+    tile_size_m REAL NOT NULL,
+    -- Voxel edge in metres of each stored pyramid level above full resolution
+    pyramid_voxels_m REAL[] NOT NULL DEFAULT '{}',
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Point cloud tiles: zlib-compressed int32 x/y/z + uint8 classification per tile
+CREATE TABLE IF NOT EXISTS lidar_tiles (
+    id BIGSERIAL PRIMARY KEY,
+    project_id UUID NOT NULL REFERENCES lidar_clouds(project_id) ON DELETE CASCADE,
+    level SMALLINT NOT NULL DEFAULT 0,
+    tile_x INTEGER NOT NULL,
+    tile_y INTEGER NOT NULL,
+    point_count INTEGER NOT NULL,
+    z_min REAL,
+    z_max REAL,
+    extent GEOMETRY(Polygon) NOT NULL,
+    points BYTEA NOT NULL,
+    UNIQUE (project_id, level, tile_x, tile_y)
+);
+
+-- Results of earlier calculations keyed by a content hash of their inputs
+CREATE TABLE IF NOT EXISTS calculation_memo (
+    input_hash CHAR(64) PRIMARY KEY,
+    project_id UUID NOT NULL REFERENCES projects(id) ON DELETE CASCADE,
+    result JSONB NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    last_used_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Stage outputs of a project's latest calculation: request and stage inputs
+-- as JSON, arrays (weather, solar position, shading mask, POA) as a compressed .npz
+CREATE TABLE IF NOT EXISTS project_intermediates (
+    project_id UUID PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+    inputs JSONB NOT NULL,
+    arrays BYTEA NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Hourly series of a project's latest calculation: ac_w, dc_w and poa_w_m2
+-- back to back as little-endian float32, 8760 values each (uncompressed)
+CREATE TABLE IF NOT EXISTS project_profiles (
+    project_id UUID PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+    data BYTEA NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+-- Already float32 noise; skip TOAST compression so reads stream the bytes as stored
+ALTER TABLE project_profiles ALTER COLUMN data SET STORAGE EXTERNAL;
+
+-- One row per project with its latest calculation, for the report download,
+-- availability and export paths (one primary-key lookup instead of two
+-- queries). Kept current by triggers on projects and calculations, so every
+-- service that writes them (calculation, payment, GDPR erasure) updates it.
+CREATE TABLE IF NOT EXISTS project_reports (
+    project_id UUID PRIMARY KEY REFERENCES projects(id) ON DELETE CASCADE,
+    project_name VARCHAR(255),
+    status VARCHAR(50) NOT NULL,
+    cost_usd NUMERIC(10, 2),
+    location_lat NUMERIC(9, 6),
+    location_lon NUMERIC(9, 6),
+    lidar_geom GEOMETRY(Point, 4326),
+    metadata JSONB,
+    project_created_at TIMESTAMP WITH TIME ZONE,
+    calculation_id UUID,
+    annual_kwh NUMERIC(10, 2),
+    shading_loss_pct NUMERIC(5, 4),
+    financial_data JSONB,
+    calculation_created_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION refresh_project_report(report_project_id UUID) RETURNS void AS $$
+BEGIN
+    INSERT INTO project_reports (
+        project_id, project_name, status, cost_usd, location_lat, location_lon, lidar_geom, metadata,
+        project_created_at, calculation_id, annual_kwh, shading_loss_pct, financial_data, calculation_created_at,
+        updated_at
+    )
+    SELECT p.id, p.project_name, p.status, p.cost_usd, p.location_lat, p.location_lon, p.lidar_geom, p.metadata,
+           p.created_at, c.id, c.annual_kwh, c.shading_loss_pct, c.financial_data, c.created_at,
+           CURRENT_TIMESTAMP
+    FROM projects p
+    LEFT JOIN LATERAL (
+        SELECT id, annual_kwh, shading_loss_pct, financial_data, created_at
+        FROM calculations
+        WHERE project_id = p.id
+        ORDER BY created_at DESC
+        LIMIT 1
+    ) c ON true
+    WHERE p.id = report_project_id
+    ON CONFLICT (project_id) DO UPDATE SET
+        project_name = EXCLUDED.project_name,
+        status = EXCLUDED.status,
+        cost_usd = EXCLUDED.cost_usd,
+        location_lat = EXCLUDED.location_lat,
+        location_lon = EXCLUDED.location_lon,
+        lidar_geom = EXCLUDED.lidar_geom,
+        metadata = EXCLUDED.metadata,
+        project_created_at = EXCLUDED.project_created_at,
+        calculation_id = EXCLUDED.calculation_id,
+        annual_kwh = EXCLUDED.annual_kwh,
+        shading_loss_pct = EXCLUDED.shading_loss_pct,
+        financial_data = EXCLUDED.financial_data,
+        calculation_created_at = EXCLUDED.calculation_created_at,
+        updated_at = EXCLUDED.updated_at;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION project_reports_sync() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'projects' THEN
+        PERFORM refresh_project_report(NEW.id);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM refresh_project_report(OLD.project_id);
+    ELSE
+        PERFORM refresh_project_report(NEW.project_id);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER project_reports_on_project
+    AFTER INSERT OR UPDATE ON projects
+    FOR EACH ROW EXECUTE FUNCTION project_reports_sync();
+
+CREATE OR REPLACE TRIGGER project_reports_on_calculation
+    AFTER INSERT OR UPDATE OR DELETE ON calculations
+    FOR EACH ROW EXECUTE FUNCTION project_reports_sync();
+
 -- Add indexes for performance
 CREATE INDEX IF NOT EXISTS idx_projects_status ON projects(status);
 CREATE INDEX IF NOT EXISTS idx_projects_created_at ON projects(created_at);
 CREATE INDEX IF NOT EXISTS idx_calculations_project_id ON calculations(project_id);
+CREATE INDEX IF NOT EXISTS idx_calculations_project_latest ON calculations(project_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_lidar_tiles_extent ON lidar_tiles USING GIST (extent);
+CREATE INDEX IF NOT EXISTS idx_calculation_memo_last_used_at ON calculation_memo(last_used_at);
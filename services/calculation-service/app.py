@@ -1,136 +1,1033 @@
 import os
-import io
-import base64
+import sys
+import json
+import time
+import uuid
+import hashlib
 import laspy
-import pvlib
+import numpy as np
 import psycopg2
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from dotenv import load_dotenv
 from shapely.geometry import Point
 from shapely import wkb
 
+# Modules shared by the services live in services/common (copied to /common in the images)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+from db_pool import ConnectionPool
+from lidar_ingest import ingest_lidar, spool_base64, spool_stream, LidarIngestError
+from weather_store import get_weather_store, WeatherStoreError
+from solar_cache import get_solar_position, solar_position_cache
+from jobs import Job, JobManager
+from shading import SurfaceModelBuilder, analyze_shading, horizontal_scale, SHADING_NEAR_M
+from point_cloud_store import TileWriter, save_point_cloud, replay_point_cloud
+from result_cache import calculation_key, make_result_store
+from metrics import registry, GaugeCallback, record_calculation, server_timing, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from time_series import parse_resolution, simulate_time_series
+from catalog import get_catalog, system_summary, CatalogError
+from financial import parse_financial, analyze as analyze_financials
+from intermediates import Intermediates, save_intermediates, load_intermediates, plan as plan_recalculation
+from profiles import (save_profile, parse_export, fetch_profiles, npy_header, write_npy, write_arrow, ProfileError,
+                      FORMATS, PROFILE_BYTES, PROFILE_COLUMNS, PROFILE_HOURS)
+from layout import (TerrainModelBuilder, parse_layout, place_rows, evaluate_layouts, load_terrain, LayoutError,
+                    LAYOUT_MAX_CANDIDATES)
+from simulation import simulate_configurations, site_arrays, optimize_orientation
+
 app = Flask(__name__)
 
 load_dotenv()
 
 DATABASE_URL = os.getenv('DATABASE_URL')
+BATCH_MAX_SCENARIOS = int(os.getenv('BATCH_MAX_SCENARIOS', '20000'))
+OPTIMIZE_MAX_GRID = int(os.getenv('OPTIMIZE_MAX_GRID', '5000'))
+
+calculation_jobs = JobManager()
+# Every job worker may hold a connection, plus room for sync requests and status polls
+db_pool = ConnectionPool(DATABASE_URL, minconn=1, maxconn=calculation_jobs.workers + 4)
 
 def get_db_connection():
-    conn = psycopg2.connect(DATABASE_URL)
-    return conn
+    """A pooled connection; ``close()`` returns it to the pool."""
+    return db_pool.getconn()
 
-@app.route('/api/calculate', methods=['POST'])
-def calculate():
-    data = request.get_json()
-    project_name = data.get('project_name')
-    location = data.get('location') # {"lat": 35.79, "lon": -78.78}
-    lidar_data_b64 = data.get('lidar_data') # base64 encoded .las or .laz
-    panel_specs = data.get('panel_specs')
-    ground_mount_config = data.get('ground_mount_config')
+# Identical resubmissions are answered from here instead of re-running the pipeline
+result_store = make_result_store(connect=lambda: get_db_connection())
 
-    if not all([project_name, location, lidar_data_b64, panel_specs]):
-        return jsonify({"error": "Missing required fields"}), 400
+registry.register(GaugeCallback(
+    'calculation_db_pool', 'Database connection pool', db_pool.stats,
+    ('size', 'idle', 'checked_out'), ('waits', 'wait_seconds_total', 'timeouts')
+))
+registry.register(GaugeCallback(
+    'calculation_jobs', 'Background calculation jobs', calculation_jobs.stats, ('queued', 'running', 'capacity')
+))
+
+def _json_field(value):
+    """Form fields carry nested objects as JSON strings."""
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return value
+    return value
+
+def parse_calculation_request():
+    """Return the request fields and a seekable LIDAR source.
+
+    Multipart uploads (``lidar_file`` part) are streamed to a spooled temp
+    file by Werkzeug as they arrive; the legacy JSON body with base64
+    ``lidar_data`` is decoded block-wise into a spooled file. Either way the
+    LIDAR bytes are hashed into ``lidar_digest`` while they are copied.
+    """
+    digest = hashlib.sha256()
+    if request.files.get('lidar_file'):
+        data = {key: _json_field(request.form.get(key)) for key in
+                ('project_name', 'location', 'panel_specs', 'ground_mount_config',
+                 'time_resolution', 'profile_resolution', 'financial')}
+        data['lidar_source'] = spool_stream(request.files['lidar_file'].stream, digest=digest)
+    else:
+        data = request.get_json(silent=True) or {}
+        lidar_data_b64 = data.get('lidar_data') # base64 encoded .las or .laz
+        data['lidar_source'] = spool_base64(lidar_data_b64, digest=digest) if lidar_data_b64 else None
+    data['lidar_digest'] = digest.hexdigest()
+    source = data['lidar_source']
+    if source is not None:
+        data['lidar_bytes'] = source.seek(0, os.SEEK_END)
+        source.seek(0)
+    return data
 
+def find_memoized(memo_key):
+    """Response for an earlier identical calculation whose project still exists, else None."""
     try:
-        # 1. Decode and parse LIDAR data
-        lidar_bytes = base64.b64decode(lidar_data_b64)
-        # Use io.BytesIO to treat bytes as a file
-        with io.BytesIO(lidar_bytes) as f:
-            las = laspy.read(f)
-
-        # For simplicity, let's just get the bounding box of the LIDAR data
-        # and store it as a PostGIS geometry (e.g., a Point representing the center)
-        # In a real app, you'd process the full point cloud.
-        min_x, min_y, min_z = las.header.mins
-        max_x, max_y, max_z = las.header.maxs
-        center_x = (min_x + max_x) / 2
-        center_y = (min_y + max_y) / 2
-        
+        entry = result_store.get(memo_key)
+        if entry is None:
+            return None
+        project_id, result = entry
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT status FROM projects WHERE id = %s", (project_id,))
+            row = cur.fetchone()
+            cur.close()
+        finally:
+            conn.close()
+    except psycopg2.Error as e:
+        app.logger.warning(f"Result memo lookup failed: {e}")
+        return None
+    if row is None or row[0] not in ('completed', 'paid'):
+        # Deleted or failed since it was memoized
+        result_store.discard(memo_key)
+        return None
+    return {"project_id": project_id, "status": row[0], **result, "memoized": True}
+
+def remember_result(memo_key, project_id, result):
+    if memo_key is None:
+        return
+    try:
+        result_store.put(memo_key, project_id, result)
+    except psycopg2.Error as e:
+        app.logger.warning(f"Could not memoize result for project {project_id}: {e}")
+
+def forget_results(project_id):
+    """Drop memoized results of a project whose latest calculation no longer matches them."""
+    if result_store is None:
+        return
+    try:
+        result_store.discard_project(project_id)
+    except psycopg2.Error as e:
+        app.logger.warning(f"Could not drop memoized results for project {project_id}: {e}")
+
+def create_project(cur, project_name, location):
+    """Insert the project row in the 'calculating' state and return its id."""
+    cur.execute(
+        "INSERT INTO projects (project_name, location_lat, location_lon, status) VALUES (%s, %s, %s, %s) RETURNING id",
+        (project_name, location['lat'], location['lon'], 'calculating')
+    )
+    return cur.fetchone()[0]
+
+def run_calculation(job, cur, project_id, location, lidar_source, system, ground_mount_config,
+                    resolution=None, financial=None, panel_specs=None):
+    """LIDAR ingest, pvlib simulation and persistence for one project.
+
+    ``system`` is the catalog resolution of ``panel_specs``
+    (:meth:`catalog.Catalog.resolve`). A ``ground_mount_config`` with
+    ``gcr`` or ``pitch_m`` lays rows out on the LIDAR terrain
+    (:mod:`layout`). Each step runs inside
+    ``job.stage(...)`` so progress can be polled while the job is in flight.
+    The caller owns the cursor's transaction. ``resolution`` (from
+    :func:`time_series.parse_resolution`) picks the time step; the default
+    is hourly. ``financial`` (from :func:`financial.parse_financial`) prices
+    the net yield; the defaults apply without it. The stage outputs are
+    kept with the request (``panel_specs`` included) for
+    :func:`run_recalculation`.
+    """
+    # 1. Stream the LIDAR points in budget-sized chunks
+    with job.stage('lidar'):
+        # The surface model for shading is rasterized as the chunks stream past,
+        # and the points are binned into tiles that are stored for later runs
+        surface_builder = SurfaceModelBuilder()
+        tile_writer = TileWriter()
+        consumers = [surface_builder, tile_writer]
+        mount = ground_mount_config or {}
+        layout = parse_layout(mount)
+        if layout is not None:
+            terrain_builder = TerrainModelBuilder()
+            consumers.append(terrain_builder)
+        with lidar_source:
+            lidar = ingest_lidar(lidar_source, consumers=consumers)
+        surface = surface_builder.build()
+        job.points = lidar['point_count']
+        app.logger.info(f"LIDAR ingest: {lidar['point_count']} points, {lidar['stats']}")
+
+        # For simplicity, store the center of the point cloud extent
+        # as a PostGIS geometry (e.g., a Point representing the center)
+        center_x, center_y = lidar['center']
+
         # Create a Shapely Point and convert to WKB for PostGIS
         lidar_geom = Point(center_x, center_y).wkb_hex # Assuming SRID 4326 for lat/lon
 
-        # 2. Store project details in the projects table
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Insert project and get its ID
+    # 2. Simulate the resolved module and inverter with pvlib
+    latitude = location['lat']
+    longitude = location['lon']
+
+    # Typical meteorological year (TMY) data from the nearest station in the
+    # local weather store; columns are zero-copy views over memory-mapped files
+    with job.stage('weather'):
+        weather = get_weather_store().site_weather(latitude, longitude)
+        times = weather.times
+
+    # Calculate solar position (cached per snapped location and year)
+    with job.stage('solar_position'):
+        solpos = get_solar_position(times, latitude, longitude)
+
+    # Rows follow the ground under them; their mutual shading is evaluated
+    # for every timestep inside the simulation
+    rows = terrain = None
+    if layout is not None:
+        with job.stage('layout'):
+            terrain = terrain_builder.build()
+            rows = place_rows(layout, terrain)
+
+    # Horizon profiles from the LIDAR surface model give an hourly beam mask
+    # for the array, assumed to sit at the center of the tile
+    with job.stage('shading'):
+        shading = analyze_shading(
+            surface, solpos, lidar['center'],
+            array_height_m=mount.get('array_height_m'), span_m=mount.get('array_span_m')
+        )
+
+    resolution = resolution or {"minutes": 60, "profile_minutes": None}
+    series, financial_data = simulate_and_price(job, location, weather, solpos, shading, rows, system, mount,
+                                                resolution, financial)
+
+    # 4. Store calculation results in the calculations table
+    with job.stage('persist'):
         cur.execute(
-            "INSERT INTO projects (project_name, location_lat, location_lon, lidar_geom, status) VALUES (%s, %s, %s, ST_GeomFromWKB(%s::bytea, 4326)) RETURNING id",
-            (project_name, location['lat'], location['lon'], lidar_geom)
+            "INSERT INTO calculations (project_id, annual_kwh, shading_loss_pct, financial_data) VALUES (%s, %s, %s, %s)",
+            (project_id, series['annual_kwh'], series['shading_loss_pct'], json.dumps(financial_data))
         )
-        project_id = cur.fetchone()[0]
-
-        # 3. Perform a basic solar simulation using pvlib
-        # This is a highly simplified example. A real simulation would be much more complex.
-        # It would involve detailed panel orientation, shading analysis from LIDAR, etc.
-        
-        # Dummy values for pvlib simulation
-        latitude = location['lat']
-        longitude = location['lon']
-        tz = 'Etc/GMT+8' # Example timezone, should be derived from location
-        system = {'module_type': 'cec', 'module': 'Canadian_Solar_CS5P_220M', 'inverter': 'ABB__PVI_5000_US__208V_'}
-        temperature_model_parameters = pvlib.temperature.TEMPERATURE_MODEL_PARAMETERS['sapm']['open_rack_glass_glass']
-
-        # Get typical meteorological year (TMY) data (placeholder)
-        # In a real scenario, you'd fetch actual weather data for the location
-        times = pvlib.data.get_tmy(latitude, longitude).index
-        weather = pvlib.data.get_tmy(latitude, longitude)[['ghi', 'dni', 'dhi', 'temp_air', 'wind_speed']]
-
-        # Calculate solar position
-        solpos = pvlib.solar.get_solarposition(times, latitude, longitude)
-
-        # Calculate angle of incidence
-        # Assuming a fixed tilt and azimuth for simplicity
-        surface_tilt = 30
-        surface_azimuth = 180 # South
-        aoi = pvlib.irradiance.aoi(surface_tilt, surface_azimuth, solpos['apparent_zenith'], solpos['azimuth'])
-
-        # Calculate plane of array irradiance
-        poa_irradiance = pvlib.irradiance.get_total_irradiance(
-            surface_tilt, surface_azimuth, solpos['apparent_zenith'], solpos['azimuth'],
-            weather['dni'], weather['ghi'], weather['dhi']
+        cur.execute(
+            "UPDATE projects SET lidar_geom = ST_GeomFromWKB(%s::bytea, 4326), status = %s, cost_usd = %s WHERE id = %s",
+            (lidar_geom, 'completed', financial_data['cost'], project_id)
         )
+        try:
+            tiles = save_point_cloud(cur, project_id, tile_writer)
+        finally:
+            tile_writer.close()
+        # Everything a spec-only recalculation can reuse
+        save_intermediates(cur, project_id, Intermediates.collect(
+            {"location": location, "panel_specs": panel_specs, "ground_mount_config": ground_mount_config,
+             "resolution": resolution, "financial": financial},
+            lidar, weather, solpos, shading, terrain, series['poa']
+        ))
+        save_profile(cur, project_id, series['hourly'])
 
-        # Calculate cell temperature
-        cell_temperature = pvlib.temperature.sapm(
-            poa_irradiance['poa_global'], weather['temp_air'], weather['wind_speed'],
-            temperature_model_parameters['a'], temperature_model_parameters['b'],
-            temperature_model_parameters['deltaT'], temperature_model_parameters['gamma_pdc']
-        )
+    result = calculation_result(series, shading, rows, system, financial_data)
+    result["lidar"] = {"point_count": lidar['point_count'], "tiles": tiles, "pyramid": tile_writer.pyramid_summary(),
+                       **lidar['stats']}
+    return result
 
-        # Calculate DC power
-        dc = pvlib.pvsystem.sapm(
-            system['module'], poa_irradiance['poa_direct'], poa_irradiance['poa_diffuse'], cell_temperature
-        )
+def simulate_and_price(job, location, weather, solpos, shading, rows, system, mount, resolution, financial,
+                       poa=None):
+    """Irradiance, cell temperature and power month by month, then the cash-flow analysis.
+
+    Gross production is reported alongside the shaded (net) production.
+    ``poa`` is stored hourly POA for the same orientation (see
+    :mod:`intermediates`). Returns the time series and ``financial_data``.
+    """
+    series = simulate_time_series(
+        weather, location['lat'], location['lon'],
+        minutes=resolution['minutes'], profile_minutes=resolution['profile_minutes'],
+        surface_tilt=float(mount.get('tilt', 30)), surface_azimuth=float(mount.get('azimuth', 180)),
+        shading=shading, solpos=solpos, stage=job.stage, system=system, rows=rows, poa=poa
+    )
+
+    # Cash flows over the project life, with a Monte Carlo spread
+    with job.stage('financial'):
+        financial_data = analyze_financials(series['net_annual_kwh'], system['pdc0'] / 1000,
+                                            financial or parse_financial(None))
+    return series, financial_data
+
+
+def calculation_result(series, shading, rows, system, financial_data):
+    """The response body shared by full calculations and recalculations."""
+    result = {
+        "annual_kwh": series['annual_kwh'],
+        "shading_loss_pct": series['shading_loss_pct'],
+        "net_annual_kwh": series['net_annual_kwh'],
+        "shading": shading.summary() if shading is not None else None,
+        "system": system_summary(system),
+        "financial": financial_data,
+        "layout": {**rows.summary(), "row_shading_loss_pct": series['row_shading_loss_pct']} if rows else None,
+        "time_series": {
+            "time_resolution_min": series['minutes'],
+            "timesteps": series['timesteps'],
+            "dc_kwh": series['dc_kwh'],
+            "clipping_loss_kwh": series['clipping_loss_kwh'],
+            "peak_ac_w": series['peak_ac_w'],
+            "poa_kwh_m2": series['poa_kwh_m2'],
+        },
+    }
+    profile = series['profile']
+    if profile is not None:
+        result["profile"] = {
+            "resolution_min": profile['minutes'],
+            "start": profile['start'],
+            "ac_w": np.round(profile['ac_w'].astype(float), 1).tolist(),
+        }
+    return result
+
+def run_recalculation(job, cur, project_id, stored, system, request):
+    """Re-run a project from its :class:`intermediates.Intermediates`, redoing only what changed.
+
+    ``request`` is the stored request with the caller's changes applied.
+    Weather and solar position always come from the store. The shading
+    mask and terrain are rebuilt from the stored point cloud only when the
+    observer height/span or a first row layout needs them, and POA only
+    when the orientation or time step changed. Temperature, power and the
+    financials always run. A new ``calculations`` row is added; the
+    project keeps its id and status.
+    """
+    mount = request['ground_mount_config'] or {}
+    resolution = request['resolution']
+    stages = plan_recalculation(stored, mount, resolution['minutes'])
+    lidar = stored.inputs['lidar']
+    job.points = lidar['point_count']
+
+    with job.stage('intermediates'):
+        weather = stored.weather()
+        solpos = stored.solar_position(weather.times)
+        reusable, shading = stored.shading_for(mount)
+        terrain = stored.terrain()
 
-        # Calculate AC power
-        ac = pvlib.inverter.sandia(system['inverter'], dc['p_mp'])
+    if 'shading' in stages or 'terrain' in stages:
+        # Full resolution around the array, the 2 m pyramid level elsewhere
+        with job.stage('lidar'):
+            surface_builder = SurfaceModelBuilder() if 'shading' in stages else None
+            terrain_builder = TerrainModelBuilder() if 'terrain' in stages else None
+            consumers = [c for c in (surface_builder, terrain_builder) if c is not None]
+            # The grids are laid out from the file's header extent, as at ingest; rows stored
+            # before it was recorded only have the point extent
+            header_mins = lidar.get('header_mins', lidar['mins'])
+            header_maxs = lidar.get('header_maxs', lidar['maxs'])
+            scale = horizontal_scale(header_mins, header_maxs)
+            near_x = SHADING_NEAR_M / scale[0]
+            near_y = SHADING_NEAR_M / scale[1]
+            center_x, center_y = lidar['center']
+            # Tiles stream through a server-side cursor on the recalculation's transaction
+            tiles_cur = cur.connection.cursor(name='lidar_replay')
+            replay_point_cloud(cur, project_id, consumers, header_mins, header_maxs, level=2,
+                               detail_bbox=(center_x - near_x, center_y - near_y, center_x + near_x, center_y + near_y),
+                               tiles_cur=tiles_cur)
+            tiles_cur.close()
+        if surface_builder is not None:
+            with job.stage('shading'):
+                shading = analyze_shading(
+                    surface_builder.build(), solpos, lidar['center'],
+                    array_height_m=mount.get('array_height_m'), span_m=mount.get('array_span_m')
+                )
+        if terrain_builder is not None:
+            terrain = terrain_builder.build()
 
-        # Calculate annual energy yield (example: sum of AC power, convert to kWh)
-        annual_kwh = ac.sum() / 1000 # Convert W to kW, then sum over hours
-        shading_loss_pct = 0.05 # Placeholder, would be derived from LIDAR analysis
+    rows = None
+    layout = parse_layout(mount)
+    if layout is not None:
+        with job.stage('layout'):
+            rows = place_rows(layout, terrain)
 
-        # 4. Store calculation results in the calculations table
+    series, financial_data = simulate_and_price(
+        job, request['location'], weather, solpos, shading, rows, system, mount, resolution, request['financial'],
+        poa=stored.poa_for(mount, resolution['minutes'])
+    )
+
+    with job.stage('persist'):
         cur.execute(
             "INSERT INTO calculations (project_id, annual_kwh, shading_loss_pct, financial_data) VALUES (%s, %s, %s, %s)",
-            (project_id, annual_kwh, shading_loss_pct, json.dumps({"cost": 10000, "roi": 0.15})) # Dummy financial data
+            (project_id, series['annual_kwh'], series['shading_loss_pct'], json.dumps(financial_data))
         )
+        cur.execute("UPDATE projects SET cost_usd = %s WHERE id = %s", (financial_data['cost'], project_id))
+        save_intermediates(cur, project_id, Intermediates.collect(
+            request, lidar, weather, solpos, shading, terrain, series['poa'] or stored.poa_for(mount, 60)
+        ))
+        save_profile(cur, project_id, series['hourly'])
+
+    result = calculation_result(series, shading, rows, system, financial_data)
+    result["recalculation"] = {
+        "recomputed": stages,
+        "reused": [name for name in ('weather', 'solar_position', 'shading', 'terrain', 'irradiance')
+                   if name not in stages and (name != 'terrain' or terrain is not None)],
+    }
+    return result
+
+
+def run_calculation_job(job, *args, memo_key=None, timings=None, payload_bytes=None):
+    """Worker-thread entry point: own connection, and 'error' status on failure.
+
+    ``timings`` holds the stages already run by the request (decode, project
+    insert) so the job's metrics cover the whole calculation.
+    """
+    project_id = job.project_id
+    outcome = 'error'
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        result = run_calculation(job, cur, project_id, *args)
         conn.commit()
         cur.close()
+        outcome = 'completed'
+        remember_result(memo_key, project_id, result)
+        return result
+    except Exception as e:
+        # Record the failure before the cleanup below, which can fail in turn
+        job.finish(error=str(e))
+        try:
+            conn.rollback()
+            cur = conn.cursor()
+            cur.execute("UPDATE projects SET status = %s WHERE id = %s", ('error', project_id))
+            conn.commit()
+            cur.close()
+        except psycopg2.Error as cleanup_error:
+            app.logger.error(f"Could not mark project {project_id} as failed: {cleanup_error}")
+        raise
+    finally:
         conn.close()
+        record_calculation({**(timings or {}), **job.timings()}, 'async', outcome, job.points, payload_bytes)
+
+def wants_async():
+    return request.args.get('async', '').lower() in ('1', 'true', 'yes')
+
+def with_server_timing(response, timings):
+    """Attach per-stage durations to a response (or ``(response, status)`` tuple)."""
+    target = response[0] if isinstance(response, tuple) else response
+    target.headers['Server-Timing'] = server_timing(timings)
+    return response
+
+def size_for_layout(system, panel_specs, ground_mount_config):
+    """Re-resolve ``system`` with as many modules as the row layout holds, unless a count was given."""
+    layout = parse_layout(ground_mount_config)
+    if layout is None or 'count' in panel_specs:
+        return system
+    count = place_rows(layout).modules(system['module']['area_m2'])
+    if count < 1:
+        raise LayoutError("The row layout holds no modules")
+    return get_catalog().resolve({**panel_specs, "count": count})
+
+@app.route('/api/calculate', methods=['POST'])
+def calculate():
+    start = time.perf_counter()
+    try:
+        data = parse_calculation_request()
+    except LidarIngestError as e:
+        return jsonify({"error": f"LIDAR data processing failed: {e}"}), 400
+    timings = {'decode': time.perf_counter() - start}
+    payload_bytes = data.get('lidar_bytes')
+    project_name = data.get('project_name')
+    location = data.get('location') # {"lat": 35.79, "lon": -78.78}
+    lidar_source = data.get('lidar_source')
+    panel_specs = data.get('panel_specs')
+    ground_mount_config = data.get('ground_mount_config')
+
+    # Closed on every early return below; the pipeline takes over closing it
+    unclaimed = lidar_source
+    try:
+        if not all([project_name, location, lidar_source, panel_specs]):
+            return jsonify({"error": "Missing required fields"}), 400
+        try:
+            resolution = parse_resolution(data.get('time_resolution'), data.get('profile_resolution'))
+            # Resolved up front so an unknown module is a 400 before any project row exists
+            system = get_catalog().resolve(panel_specs)
+            system = size_for_layout(system, panel_specs, ground_mount_config)
+            financial = parse_financial(data.get('financial'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        memo_key = None
+        if result_store is not None:
+            options = {**(resolution or {}), "financial": data['financial']} if data.get('financial') else resolution
+            memo_key = calculation_key(data['lidar_digest'], project_name, location, panel_specs, ground_mount_config,
+                                       options=options)
+            memo_start = time.perf_counter()
+            memoized = find_memoized(memo_key)
+            timings['memo_lookup'] = time.perf_counter() - memo_start
+            if memoized is not None:
+                record_calculation(timings, 'sync', 'memoized', memoized.get('lidar', {}).get('point_count'),
+                                   payload_bytes)
+                return with_server_timing(jsonify(memoized), timings)
 
-        return jsonify({"project_id": str(project_id), "status": "completed", "annual_kwh": annual_kwh})
+        unclaimed = None
+    finally:
+        if unclaimed is not None:
+            unclaimed.close()
+
+    if wants_async():
+        return with_server_timing(submit_calculation(
+            project_name, location, lidar_source, system, ground_mount_config, memo_key,
+            resolution=resolution, financial=financial, panel_specs=panel_specs, timings=timings,
+            payload_bytes=payload_bytes
+        ), timings)
+
+    conn = None
+    job = None
+    outcome = 'error'
+    try:
+        # Store project details in the projects table, then run the
+        # pipeline on the same transaction so a failure leaves no project behind
+        project_start = time.perf_counter()
+        conn = get_db_connection()
+        cur = conn.cursor()
+        project_id = create_project(cur, project_name, location)
+        timings['project'] = time.perf_counter() - project_start
+
+        job = Job(project_id)
+        result = run_calculation(job, cur, project_id, location, lidar_source, system, ground_mount_config,
+                                 resolution, financial, panel_specs)
+        conn.commit()
+        cur.close()
+        outcome = 'completed'
+        remember_result(memo_key, project_id, result)
+
+        response = jsonify({"project_id": str(project_id), "status": "completed", **result})
 
     except laspy.errors.LaspyError as e:
         app.logger.error(f"LIDAR parsing error: {e}")
-        return jsonify({"error": f"LIDAR data processing failed: {e}"}), 400
+        response = jsonify({"error": f"LIDAR data processing failed: {e}"}), 400
+    except WeatherStoreError as e:
+        app.logger.error(f"Weather lookup error: {e}")
+        response = jsonify({"error": f"Weather data unavailable: {e}"}), 503
     except psycopg2.Error as e:
         app.logger.error(f"Database error: {e}")
-        return jsonify({"error": f"Database operation failed: {e}"}), 500
+        response = jsonify({"error": f"Database operation failed: {e}"}), 500
     except Exception as e:
         app.logger.error(f"Calculation error: {e}")
+        response = jsonify({"error": f"An unexpected error occurred: {e}"}), 500
+    finally:
+        lidar_source.close()
+        if conn is not None:
+            conn.close()
+
+    if job is not None:
+        timings.update(job.timings())
+    record_calculation(timings, 'sync', outcome, job.points if job else None, payload_bytes)
+    return with_server_timing(response, timings)
+
+def submit_calculation(project_name, location, lidar_source, system, ground_mount_config, memo_key=None,
+                       resolution=None, financial=None, panel_specs=None, timings=None, payload_bytes=None):
+    """Create the project and hand the pipeline to the job pool (HTTP 202)."""
+    timings = {} if timings is None else timings
+    if not calculation_jobs.reserve():
+        lidar_source.close()
+        response = jsonify({"error": "Calculation queue is full, retry later"})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+
+    try:
+        project_start = time.perf_counter()
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            project_id = create_project(cur, project_name, location)
+            conn.commit()
+            cur.close()
+        finally:
+            conn.close()
+        timings['project'] = time.perf_counter() - project_start
+    except psycopg2.Error as e:
+        calculation_jobs.release()
+        lidar_source.close()
+        app.logger.error(f"Database error: {e}")
+        return jsonify({"error": f"Database operation failed: {e}"}), 500
+
+    calculation_jobs.submit(
+        project_id, run_calculation_job, location, lidar_source, system, ground_mount_config, resolution, financial,
+        panel_specs, memo_key=memo_key, timings=dict(timings), payload_bytes=payload_bytes
+    )
+    return jsonify({
+        "project_id": str(project_id),
+        "status": "calculating",
+        "status_url": f"/api/calculate/{project_id}/status",
+    }), 202
+
+@app.route('/api/calculate/<project_id>/recalculate', methods=['POST'])
+def recalculate(project_id):
+    """Re-run a finished project with changed inputs, reusing its stored stage outputs.
+
+    The body holds any of ``panel_specs``, ``ground_mount_config``,
+    ``financial``, ``time_resolution`` and ``profile_resolution``; omitted
+    fields keep the values the project was last calculated with. The LIDAR
+    is never re-parsed, and weather and solar position are never re-fetched.
+    """
+    try:
+        uuid.UUID(str(project_id))
+    except ValueError:
+        return jsonify({"error": "Invalid project ID format"}), 400
+    data = request.get_json(silent=True) or {}
+
+    timings = {}
+    conn = None
+    job = None
+    outcome = 'error'
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        load_start = time.perf_counter()
+        cur.execute("SELECT status FROM projects WHERE id = %s", (project_id,))
+        row = cur.fetchone()
+        if row is None:
+            return jsonify({"error": "Project not found"}), 404
+        if row[0] not in ('completed', 'paid'):
+            return jsonify({"error": f"Project is {row[0]}; only finished projects can be recalculated"}), 409
+        stored = load_intermediates(cur, project_id)
+        if stored is None:
+            return jsonify({"error": "No stored intermediates for this project; run a full calculation"}), 409
+        timings['load'] = time.perf_counter() - load_start
+
+        previous = stored.request
+        changes = {
+            "location": previous['location'],
+            "panel_specs": data.get('panel_specs', previous['panel_specs']),
+            "ground_mount_config": data.get('ground_mount_config', previous['ground_mount_config']),
+            "resolution": previous['resolution'],
+            "financial": previous['financial'],
+        }
+        try:
+            if 'time_resolution' in data or 'profile_resolution' in data:
+                changes['resolution'] = (parse_resolution(data.get('time_resolution'), data.get('profile_resolution'))
+                                        or {"minutes": 60, "profile_minutes": None})
+            if 'financial' in data:
+                changes['financial'] = parse_financial(data['financial'])
+            system = get_catalog().resolve(changes['panel_specs'])
+            system = size_for_layout(system, changes['panel_specs'], changes['ground_mount_config'])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        job = Job(project_id)
+        result = run_recalculation(job, cur, project_id, stored, system, changes)
+        conn.commit()
+        cur.close()
+        # Resubmitting the original inputs must not return the replaced results
+        forget_results(project_id)
+        outcome = 'completed'
+        response = jsonify({"project_id": str(project_id), "status": row[0], **result})
+    except WeatherStoreError as e:
+        app.logger.error(f"Weather lookup error: {e}")
+        response = jsonify({"error": f"Weather data unavailable: {e}"}), 503
+    except psycopg2.Error as e:
+        app.logger.error(f"Database error: {e}")
+        response = jsonify({"error": f"Database operation failed: {e}"}), 500
+    except Exception as e:
+        app.logger.error(f"Recalculation error: {e}")
+        response = jsonify({"error": f"An unexpected error occurred: {e}"}), 500
+    finally:
+        if conn is not None:
+            conn.close()
+
+    if job is not None:
+        timings.update(job.timings())
+    record_calculation(timings, 'recalculate', outcome, job.points if job else None, None)
+    return with_server_timing(response, timings)
+
+def profile_response(rows, count, fmt):
+    """Streamed ``.npy`` or Arrow body for ``(project_id, blob)`` rows."""
+    headers = {"X-Profile-Columns": ",".join(PROFILE_COLUMNS), "X-Profile-Hours": str(PROFILE_HOURS)}
+    if fmt == 'arrow':
+        return Response(write_arrow(rows), content_type=FORMATS[fmt], headers=headers)
+    headers["Content-Length"] = str(len(npy_header(count)) + count * PROFILE_BYTES)
+    return Response(write_npy(rows, count), content_type=FORMATS[fmt], headers=headers)
+
+
+@app.route('/api/calculate/<project_id>/profile', methods=['GET'])
+def project_profile(project_id):
+    """One project's hourly AC/DC/POA series as a ``(1, columns, hours)`` ``.npy`` or an Arrow stream."""
+    try:
+        uuid.UUID(str(project_id))
+    except ValueError:
+        return jsonify({"error": "Invalid project ID format"}), 400
+    try:
+        project_ids, fmt = parse_export([project_id], request.args.get('format'))
+    except ProfileError as e:
+        return jsonify({"error": str(e)}), 400
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT data FROM project_profiles WHERE project_id = %s", (project_ids[0],))
+        row = cur.fetchone()
+        cur.close()
+    except psycopg2.Error as e:
+        app.logger.error(f"Database error: {e}")
+        return jsonify({"error": f"Database operation failed: {e}"}), 500
+    finally:
+        if conn is not None:
+            conn.close()
+    if row is None:
+        return jsonify({"error": "No hourly profile for this project"}), 404
+    return profile_response([(project_ids[0], bytes(row[0]))], 1, fmt)
+
+
+@app.route('/api/calculate/profiles', methods=['POST'])
+def export_profiles():
+    """Hourly series for many projects in one streamed binary response.
+
+    The body is ``{"project_ids": [...], "format": "npy" | "arrow"}``.
+    Profiles are read through a server-side cursor and written out as they
+    arrive, so memory stays at ``PROFILE_FETCH_ROWS`` profiles however many
+    are requested.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        project_ids, fmt = parse_export(data.get('project_ids'), data.get('format'))
+    except ProfileError as e:
+        return jsonify({"error": str(e)}), 400
+    # Canonical form, as the database returns them, so rows match their requests
+    canonical = []
+    for project_id in project_ids:
+        try:
+            canonical.append(str(uuid.UUID(project_id)))
+        except ValueError:
+            return jsonify({"error": f"Invalid project ID format: {project_id}"}), 400
+    project_ids = canonical
+
+    conn = get_db_connection()
+
+    def rows():
+        try:
+            cur = conn.cursor(name='profile_export')
+            yield from fetch_profiles(cur, project_ids)
+            cur.close()
+        finally:
+            conn.close()
+
+    response = profile_response(rows(), len(project_ids), fmt)
+    # Also returns the connection if the client goes away before the body starts
+    response.call_on_close(conn.close)
+    return response
+
+
+@app.route('/api/calculate/<project_id>/status', methods=['GET'])
+def calculation_status(project_id):
+    try:
+        uuid.UUID(str(project_id))
+    except ValueError:
+        return jsonify({"error": "Invalid project ID format"}), 400
+
+    job = calculation_jobs.get(project_id)
+    if job is not None:
+        return jsonify(job.to_dict())
+
+    # Submitted to another worker or before a restart: report the durable status
+    try:
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT p.status, c.annual_kwh FROM projects p "
+                "LEFT JOIN calculations c ON c.project_id = p.id "
+                "WHERE p.id = %s ORDER BY c.created_at DESC NULLS LAST LIMIT 1",
+                (project_id,)
+            )
+            row = cur.fetchone()
+            cur.close()
+        finally:
+            conn.close()
+    except psycopg2.Error as e:
+        app.logger.error(f"Database error: {e}")
+        return jsonify({"error": f"Database operation failed: {e}"}), 500
+
+    if not row:
+        return jsonify({"error": "Project not found"}), 404
+    status, annual_kwh = row
+    return jsonify({
+        "project_id": project_id,
+        "status": status,
+        "result": {"annual_kwh": float(annual_kwh)} if annual_kwh is not None else None,
+    })
+
+# Numeric fields of a batch configuration, broadcast as one array each
+BATCH_COLUMNS = ('tilt', 'azimuth', 'pdc0', 'gamma_pdc', 'inverter_pdc0')
+
+def parse_batch_configurations(data):
+    """Expand the request into one dict per tilt/azimuth/panel configuration.
+
+    Either an explicit ``combinations`` list or the cross product of
+    ``orientations`` and ``panels`` is accepted.
+    """
+    combinations = data.get('combinations')
+    if combinations is None:
+        combinations = [
+            {**orientation, "panel": panel}
+            for orientation in data.get('orientations') or []
+            for panel in data.get('panels') or []
+        ]
+    if not combinations:
+        raise ValueError("Provide 'combinations' or both 'orientations' and 'panels'")
+
+    configurations = []
+    for combo in combinations:
+        # Same panel_specs as /api/calculate, resolved against the catalog
+        system = get_catalog().resolve(combo.get('panel') or {})
+        configurations.append({
+            "tilt": float(combo['tilt']),
+            "azimuth": float(combo['azimuth']),
+            "module": system['module']['name'],
+            "modules": system['modules'],
+            "pdc0": system['pdc0'],
+            "gamma_pdc": system['module']['gamma_pdc'],
+            "inverter_pdc0": system['pdc0'] / system['dc_ac_ratio'],
+        })
+    return configurations
+
+@app.route('/api/calculate/batch', methods=['POST'])
+def calculate_batch():
+    """What-if runs for N sites x M configurations, returned as result matrices.
+
+    Weather and solar position are loaded once per site and all M
+    configurations are evaluated together as broadcast arrays. Nothing is
+    persisted.
+    """
+    data = request.get_json(silent=True) or {}
+    sites = data.get('sites')
+    if not sites:
+        return jsonify({"error": "Missing required fields"}), 400
+    try:
+        configurations = parse_batch_configurations(data)
+        site_locations = [(float(site['lat']), float(site['lon'])) for site in sites]
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid batch request: {e}"}), 400
+    if len(sites) * len(configurations) > BATCH_MAX_SCENARIOS:
+        return jsonify({"error": f"Batch exceeds {BATCH_MAX_SCENARIOS} site/configuration scenarios"}), 400
+
+    columns = {name: np.array([c[name] for c in configurations]) for name in BATCH_COLUMNS}
+    metrics = ('annual_kwh', 'specific_yield_kwh_kwp', 'peak_ac_w', 'poa_kwh_m2')
+    results = {name: [] for name in metrics}
+    site_errors = []
+    try:
+        for latitude, longitude in site_locations:
+            try:
+                weather = get_weather_store().site_weather(latitude, longitude)
+            except WeatherStoreError as e:
+                site_errors.append(str(e))
+                for name in metrics:
+                    results[name].append(None)
+                continue
+            solpos = get_solar_position(weather.times, latitude, longitude)
+            site_result = simulate_configurations(
+                weather, solpos, columns['tilt'], columns['azimuth'], columns['pdc0'],
+                gamma_pdc=columns['gamma_pdc'], inverter_pdc0=columns['inverter_pdc0']
+            )
+            site_errors.append(None)
+            for name in metrics:
+                results[name].append(np.round(site_result[name], 3).tolist())
+    except Exception as e:
+        app.logger.error(f"Batch calculation error: {e}")
+        return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
+
+    return jsonify({
+        "sites": [{"lat": lat, "lon": lon} for lat, lon in site_locations],
+        "configurations": configurations,
+        "site_errors": site_errors,
+        # Each metric is a len(sites) x len(configurations) matrix
+        **results,
+    })
+
+@app.route('/api/calculate/optimize', methods=['POST'])
+def optimize():
+    """Best fixed tilt/azimuth for a site plus the yield surface over the grid.
+
+    Weather, solar position and the irradiance inputs are prepared once;
+    every orientation on the grid is then evaluated in batched arrays.
+    """
+    data = request.get_json(silent=True) or {}
+    location = data.get('location')
+    panel_specs = data.get('panel_specs')
+    if not all([location, panel_specs]):
+        return jsonify({"error": "Missing required fields"}), 400
+
+    try:
+        latitude, longitude = float(location['lat']), float(location['lon'])
+        system = get_catalog().resolve(panel_specs)
+        pdc0 = system['pdc0']
+        # Default to the equator-facing half of the compass
+        facing = 180 if latitude >= 0 else 0
+        tilt_range = [float(v) for v in data.get('tilt_range', (0, 60))]
+        azimuth_range = [float(v) for v in data.get('azimuth_range', (facing - 90, facing + 90))]
+        step = float(data.get('step', 5))
+        fine_step = float(data['fine_step']) if data.get('fine_step') else None
+        if step <= 0 or (fine_step is not None and fine_step <= 0):
+            raise ValueError("step and fine_step must be positive")
+        if not (0 <= tilt_range[0] <= tilt_range[1] <= 90) or azimuth_range[0] > azimuth_range[1]:
+            raise ValueError("tilt_range must lie within [0, 90] and ranges must be ascending")
+    except (KeyError, TypeError, ValueError, IndexError) as e:
+        return jsonify({"error": f"Invalid optimize request: {e}"}), 400
+
+    grid_size = (int((tilt_range[1] - tilt_range[0]) / step) + 1) * (int((azimuth_range[1] - azimuth_range[0]) / step) + 1)
+    if grid_size > OPTIMIZE_MAX_GRID:
+        return jsonify({"error": f"Orientation grid exceeds {OPTIMIZE_MAX_GRID} points, increase step"}), 400
+
+    try:
+        start = time.perf_counter()
+        weather = get_weather_store().site_weather(latitude, longitude)
+        solpos = get_solar_position(weather.times, latitude, longitude)
+        inputs = site_arrays(weather, solpos)
+        result = optimize_orientation(
+            inputs, pdc0, tilt_range=tilt_range, azimuth_range=azimuth_range, step=step, fine_step=fine_step,
+            gamma_pdc=system['module']['gamma_pdc'], inverter_pdc0=pdc0 / system['dc_ac_ratio'],
+        )
+        elapsed = time.perf_counter() - start
+    except WeatherStoreError as e:
+        app.logger.error(f"Weather lookup error: {e}")
+        return jsonify({"error": f"Weather data unavailable: {e}"}), 503
+    except Exception as e:
+        app.logger.error(f"Optimization error: {e}")
         return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
 
+    return jsonify({
+        "module": system['module']['name'],
+        "modules": system['modules'],
+        "optimum": {
+            "tilt": result['tilt'],
+            "azimuth": result['azimuth'],
+            "annual_kwh": round(result['annual_kwh'], 3),
+            "specific_yield_kwh_kwp": round(result['annual_kwh'] / (pdc0 / 1000), 3) if pdc0 > 0 else None,
+        },
+        # annual_kwh[i][j] is the yield at tilts[i], azimuths[j]
+        "surface": {
+            "tilts": result['tilts'].tolist(),
+            "azimuths": result['azimuths'].tolist(),
+            "annual_kwh": np.round(result['surface'], 3).tolist(),
+        },
+        "evaluations": result['evaluations'],
+        "seconds": round(elapsed, 4),
+    })
+
+LAYOUT_OBJECTIVES = ('annual_kwh', 'specific_yield_kwh_kwp', 'kwh_per_site_m2')
+
+@app.route('/api/calculate/layouts', methods=['POST'])
+def compare_layouts():
+    """Annual yield of candidate ground-mount row layouts at one site, in one batch.
+
+    Each candidate is a ``ground_mount_config``-style object (``gcr`` or
+    ``pitch_m``, plus optional ``tilt``, ``azimuth``, ``row_width_m``,
+    ``setback_m``, ``site_m``); ``ground_mount_config`` supplies shared
+    defaults. With ``project_id`` the rows sit on that project's stored
+    terrain, otherwise on flat ground. Nothing is persisted.
+    """
+    data = request.get_json(silent=True) or {}
+    location = data.get('location')
+    panel_specs = data.get('panel_specs')
+    candidates = data.get('candidates')
+    if not all([location, panel_specs, candidates]):
+        return jsonify({"error": "Missing required fields"}), 400
+
+    try:
+        latitude, longitude = float(location['lat']), float(location['lon'])
+        if not isinstance(candidates, list) or len(candidates) > LAYOUT_MAX_CANDIDATES:
+            raise LayoutError(f"candidates must be a list of at most {LAYOUT_MAX_CANDIDATES} layouts")
+        layouts = [parse_layout(candidate, data.get('ground_mount_config')) for candidate in candidates]
+        if any(layout is None for layout in layouts):
+            raise LayoutError("Every candidate needs gcr or pitch_m")
+        objective = data.get('objective', 'annual_kwh')
+        if objective not in LAYOUT_OBJECTIVES:
+            raise LayoutError(f"objective must be one of {', '.join(LAYOUT_OBJECTIVES)}")
+        module = get_catalog().resolve(panel_specs)['module']
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid layout request: {e}"}), 400
+
+    try:
+        start = time.perf_counter()
+        terrain = None
+        if data.get('project_id'):
+            conn = get_db_connection()
+            try:
+                cur = conn.cursor()
+                tiles_cur = conn.cursor(name='terrain_tiles')
+                terrain = load_terrain(cur, data['project_id'], tiles_cur=tiles_cur)
+                tiles_cur.close()
+                cur.close()
+            finally:
+                conn.close()
+        rows = [place_rows(layout, terrain) for layout in layouts]
+        weather = get_weather_store().site_weather(latitude, longitude)
+        solpos = get_solar_position(weather.times, latitude, longitude)
+        result = evaluate_layouts(site_arrays(weather, solpos), rows, module['stc_w'] / module['area_m2'],
+                                  gamma_pdc=module['gamma_pdc'])
+        elapsed = time.perf_counter() - start
+    except LayoutError as e:
+        return jsonify({"error": f"Invalid layout request: {e}"}), 400
+    except WeatherStoreError as e:
+        app.logger.error(f"Weather lookup error: {e}")
+        return jsonify({"error": f"Weather data unavailable: {e}"}), 503
+    except psycopg2.Error as e:
+        app.logger.error(f"Database error: {e}")
+        return jsonify({"error": f"Database operation failed: {e}"}), 500
+    except Exception as e:
+        app.logger.error(f"Layout comparison error: {e}")
+        return jsonify({"error": f"An unexpected error occurred: {e}"}), 500
+
+    best = int(np.argmax(result[objective]))
+    return jsonify({
+        "module": module['name'],
+        "terrain": terrain is not None,
+        "layouts": [r.summary() for r in rows],
+        # Each metric is a list with one value per candidate
+        **{name: np.round(values, 4).tolist() for name, values in result.items()},
+        "objective": objective,
+        "best": {"index": best, **rows[best].summary(),
+                 **{name: round(float(values[best]), 4) for name, values in result.items()}},
+        "seconds": round(elapsed, 4),
+    })
+
+@app.route('/api/catalog/<kind>', methods=['GET'])
+def catalog_search(kind):
+    """Modules or inverters by fuzzy name, manufacturer, type and nearest wattage."""
+    if kind not in ('modules', 'inverters'):
+        return jsonify({"error": "Catalog kind must be 'modules' or 'inverters'"}), 404
+    try:
+        power = request.args.get('power', type=float)
+        limit = min(request.args.get('limit', 10, type=int), 100)
+        results = get_catalog().search(
+            kind, name=request.args.get('q'), manufacturer=request.args.get('manufacturer'),
+            power=power, technology=request.args.get('type'), limit=limit
+        )
+    except CatalogError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"results": results})
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        "solar_position": solar_position_cache.stats(),
+        "results": result_store.stats() if result_store is not None else None,
+        "jobs": calculation_jobs.stats(),
+    })
+
+@app.route('/api/db/stats', methods=['GET'])
+def db_stats():
+    """Connection pool metrics: size, checked out, waits and wait time."""
+    return jsonify(db_pool.stats())
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition of stage timings, pool and job gauges."""
+    return Response(registry.render(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route("/health")
 def health():
     # Basic health check, could be extended to check DB connection
@@ -143,4 +1040,6 @@ def health():
         return "Database connection failed", 500
 
 if __name__ == '__main__':
+    # Parse the module/inverter libraries before the first request needs them
+    get_catalog()
     app.run(host='0.0.0.0', port=5001)
\ No newline at end of file
@@ -0,0 +1,317 @@
+"""Calculation pipeline benchmarks on synthetic tiles and pinned weather.
+
+Each stage of the hot path runs for real (laspy, pvlib, the ingest consumers
+and the tile encoder) on a deterministic tile and reports wall time,
+throughput and peak RSS growth while it ran. ``poa``, ``temperature`` and
+``dc_ac`` are the steps of :func:`time_series.simulate_time_series` for a
+catalog-resolved system, as a calculation runs them, summed over months. Results are compared with
+``baselines.json`` and the run exits non-zero when a stage regresses past
+the tolerances stored there.
+
+Run from the service directory::
+
+    python -m benchmarks.run --sizes 1M,10M --check
+    python -m benchmarks.run --sizes 1M,5M,10M,50M --update-baselines
+    python -m benchmarks.run --sizes 10M --laz --workers 1,2,4,8,16
+
+With several ``--workers`` counts every size is run once per count and
+the parse speedup over the first count is printed. Baselines are kept per
+worker count.
+
+Generated tiles and the weather fixture are cached in ``BENCH_DATA_DIR``.
+Persistence writes to a recording cursor unless ``BENCH_DATABASE_URL``
+points at a migrated database, in which case it runs inside a transaction
+that is rolled back.
+"""
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import platform
+import tempfile
+import threading
+from contextlib import contextmanager, nullcontext
+
+import pvlib
+
+from lidar_ingest import ingest_lidar, spool_base64, spool_stream, _current_rss_bytes
+from point_cloud_store import TileWriter, save_point_cloud
+from shading import SurfaceModelBuilder, analyze_shading
+from catalog import Catalog
+from time_series import simulate_time_series
+from weather_store import WeatherStore
+
+from benchmarks.synthetic_lidar import cached_tile, parse_size
+from benchmarks.weather_fixture import SITE, cached_fixture
+
+BENCH_DATA_DIR = os.getenv('BENCH_DATA_DIR', os.path.join(tempfile.gettempdir(), 'solar-bench'))
+BENCH_DATABASE_URL = os.getenv('BENCH_DATABASE_URL')
+# Larger tiles go through the multipart spool instead of a base64 body
+BENCH_BASE64_MAX_MB = int(os.getenv('BENCH_BASE64_MAX_MB', '256'))
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+DEFAULT_SIZES = '1M,5M,10M'
+STAGES = ('decode', 'parse', 'weather', 'solar_position', 'shading', 'poa', 'temperature', 'dc_ac', 'persist')
+
+SURFACE_TILT = 30
+SURFACE_AZIMUTH = 180
+# A 6 kW array of the catalog's default module
+SYSTEM_SPECS = {"power": 6000}
+# simulate_time_series stage names -> benchmark stages
+SIMULATION_STAGES = {'irradiance': 'poa', 'temperature': 'temperature', 'power': 'dc_ac'}
+
+
+class RssSampler:
+    """Background thread tracking the highest RSS seen while a stage runs."""
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start_rss = self.peak = _current_rss_bytes()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _current_rss_bytes())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _current_rss_bytes())
+
+    @property
+    def growth_mb(self):
+        return (self.peak - self.start_rss) / 2**20
+
+
+class StageRecorder:
+
+    def __init__(self):
+        self.stages = {}
+        self._totals = {}
+
+    @contextmanager
+    def stage(self, name, items=None, unit=None):
+        """Time the block; ``items`` (count of ``unit``) gives a throughput figure.
+
+        A stage entered again adds to its time, as the per-month steps of a
+        simulation do; ``items`` is then the stage's total.
+        """
+        with RssSampler() as sampler:
+            start = time.perf_counter()
+            yield
+            elapsed = time.perf_counter() - start
+        seconds, peak = self._totals.get(name, (0.0, 0.0))
+        seconds, peak = self._totals[name] = (seconds + elapsed, max(peak, sampler.growth_mb))
+        entry = {"seconds": round(seconds, 4), "peak_rss_mb": round(peak, 1)}
+        if items is not None and seconds > 0:
+            entry["throughput"] = round(items / seconds, 1)
+            entry["unit"] = f"{unit}/s"
+        self.stages[name] = entry
+
+
+class RecordingCursor:
+    """Stand-in cursor that keeps what would have been sent to PostgreSQL."""
+
+    def __init__(self):
+        self.statements = 0
+        self.bytes = 0
+
+    def execute(self, sql, params=()):
+        self.statements += 1
+        self.bytes += sum(len(p) for p in params if isinstance(p, (bytes, bytearray)))
+
+    def fetchone(self):
+        return None
+
+
+@contextmanager
+def persistence_cursor():
+    if not BENCH_DATABASE_URL:
+        yield RecordingCursor(), 'recording-cursor'
+        return
+    import psycopg2
+    conn = psycopg2.connect(BENCH_DATABASE_URL)
+    try:
+        yield conn.cursor(), 'postgres'
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def run_size(points, data_dir=BENCH_DATA_DIR, compressed=False, seed=42, workers=1):
+    """Benchmark every stage on one tile size; returns the per-stage report.
+
+    ``workers`` is handed to :func:`lidar_ingest.ingest_lidar` for the parse stage.
+    """
+    path = cached_tile(os.path.join(data_dir, 'tiles'), points, seed, compressed)
+    weather_path = cached_fixture(data_dir)
+    file_bytes = os.path.getsize(path)
+    recorder = StageRecorder()
+
+    if file_bytes <= BENCH_BASE64_MAX_MB * 2**20:
+        with open(path, 'rb') as f:
+            payload = base64.b64encode(f.read())
+        decode_mode = 'base64'
+        with recorder.stage('decode', file_bytes / 2**20, 'MB'):
+            source = spool_base64(payload)
+        del payload
+    else:
+        decode_mode = 'multipart'
+        with recorder.stage('decode', file_bytes / 2**20, 'MB'):
+            with open(path, 'rb') as f:
+                source = spool_stream(f)
+
+    surface_builder = SurfaceModelBuilder()
+    tile_writer = TileWriter()
+    with recorder.stage('parse', points, 'points'):
+        with source:
+            lidar = ingest_lidar(source, consumers=[surface_builder, tile_writer], workers=workers)
+        surface = surface_builder.build()
+
+    with recorder.stage('weather'):
+        weather = WeatherStore(weather_path).site_weather(SITE['lat'], SITE['lon'])
+        times = weather.times
+
+    with recorder.stage('solar_position', len(times), 'timesteps'):
+        solpos = pvlib.solarposition.get_solarposition(times, SITE['lat'], SITE['lon'])
+
+    with recorder.stage('shading', len(times), 'timesteps'):
+        shading = analyze_shading(surface, solpos, lidar['center'])
+
+    def simulation_stage(name):
+        if name not in SIMULATION_STAGES:
+            # Solar position was timed above and is only sliced here
+            return nullcontext()
+        return recorder.stage(SIMULATION_STAGES[name], len(times), 'timesteps')
+
+    system = Catalog.load().resolve(SYSTEM_SPECS)
+    series = simulate_time_series(weather, SITE['lat'], SITE['lon'], surface_tilt=SURFACE_TILT,
+                                  surface_azimuth=SURFACE_AZIMUTH, shading=shading, solpos=solpos,
+                                  stage=simulation_stage, system=system)
+    annual_kwh = series['net_annual_kwh']
+
+    with persistence_cursor() as (cur, persist_mode):
+        with recorder.stage('persist', points, 'points'):
+            project_id = '00000000-0000-0000-0000-00000000be7c'
+            if persist_mode == 'postgres':
+                cur.execute(
+                    "INSERT INTO projects (id, project_name, location_lat, location_lon, status) "
+                    "VALUES (%s, %s, %s, %s, %s)",
+                    (project_id, 'benchmark', SITE['lat'], SITE['lon'], 'calculating')
+                )
+            tiles = save_point_cloud(cur, project_id, tile_writer)
+            cur.execute(
+                "INSERT INTO calculations (project_id, annual_kwh, shading_loss_pct, financial_data) VALUES (%s, %s, %s, %s)",
+                (project_id, annual_kwh, 0.0, json.dumps({}))
+            )
+    tile_writer.close()
+
+    return {
+        "points": points,
+        "file_mb": round(file_bytes / 2**20, 1),
+        "format": 'laz' if compressed else 'las',
+        "decode_mode": decode_mode,
+        "workers": lidar['stats']['workers'],
+        "persist_mode": persist_mode,
+        "tiles": tiles,
+        "pyramid": tile_writer.pyramid_summary(),
+        "annual_kwh": round(annual_kwh, 1),
+        "total_seconds": round(sum(s['seconds'] for s in recorder.stages.values()), 4),
+        "stages": recorder.stages,
+    }
+
+
+def compare_to_baseline(report, baseline, tolerance):
+    """Regression messages for stages slower or hungrier than the baseline allows."""
+    problems = []
+    for stage, measured in report['stages'].items():
+        expected = baseline.get('stages', {}).get(stage)
+        if not expected:
+            continue
+        limit = expected['seconds'] * (1 + tolerance['seconds']) + tolerance['min_seconds']
+        if measured['seconds'] > limit:
+            problems.append(f"{report['points']} points, {stage}: {measured['seconds']:.3f}s "
+                            f"> {limit:.3f}s (baseline {expected['seconds']:.3f}s)")
+        limit = expected['peak_rss_mb'] * (1 + tolerance['peak_rss_mb']) + tolerance['min_peak_rss_mb']
+        if measured['peak_rss_mb'] > limit:
+            problems.append(f"{report['points']} points, {stage}: peak +{measured['peak_rss_mb']:.1f} MB "
+                            f"> {limit:.1f} MB (baseline +{expected['peak_rss_mb']:.1f} MB)")
+    return problems
+
+
+def baseline_key(prefix, points, workers=1):
+    """``las:1000000`` for serial ingest, ``las:1000000:w4`` for four workers."""
+    return f"{prefix}:{points}" + (f":w{workers}" if workers > 1 else '')
+
+
+def load_baselines(path=BASELINES_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='comma-separated point counts, e.g. 1M,10M,50M')
+    parser.add_argument('--laz', action='store_true', help='benchmark compressed LAZ tiles')
+    parser.add_argument('--workers', default='1', help='comma-separated ingest worker counts, e.g. 1,4,16')
+    parser.add_argument('--check', action='store_true', help='fail when a stage regresses past baselines.json')
+    parser.add_argument('--update-baselines', action='store_true', help='store this run as the new baselines')
+    parser.add_argument('--output', help='write the full JSON report here')
+    args = parser.parse_args(argv)
+
+    baselines = load_baselines()
+    key_prefix = 'laz' if args.laz else 'las'
+    reports = []
+    problems = []
+    worker_counts = [int(w) for w in args.workers.split(',')]
+    for size in args.sizes.split(','):
+        points = parse_size(size)
+        parse_seconds = {}
+        for workers in worker_counts:
+            report = run_size(points, compressed=args.laz, workers=workers)
+            reports.append(report)
+            print(f"{points:>12,d} points  {report['file_mb']:>8.1f} MB  {workers} worker(s)  "
+                  f"total {report['total_seconds']:.3f}s")
+            for stage, entry in report['stages'].items():
+                rate = f"  {entry['throughput']:>14,.1f} {entry['unit']}" if 'throughput' in entry else ''
+                print(f"    {stage:<15} {entry['seconds']:>8.3f}s  +{entry['peak_rss_mb']:>7.1f} MB{rate}")
+            parse_seconds[workers] = report['stages']['parse']['seconds']
+            baseline = baselines['sizes'].get(baseline_key(key_prefix, points, report['workers']))
+            if args.check and baseline:
+                problems.extend(compare_to_baseline(report, baseline, baselines['tolerance']))
+        if len(worker_counts) > 1:
+            first = worker_counts[0]
+            print("    parse scaling: " + ", ".join(
+                f"{w}: {parse_seconds[first] / parse_seconds[w]:.2f}x" for w in worker_counts))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"machine": platform.platform(), "reports": reports}, f, indent=2)
+
+    if args.update_baselines:
+        for report in reports:
+            baselines['sizes'][baseline_key(key_prefix, report['points'], report['workers'])] = {
+                "stages": {stage: {"seconds": e['seconds'], "peak_rss_mb": e['peak_rss_mb']}
+                           for stage, e in report['stages'].items()},
+            }
+        baselines['machine'] = f"{platform.machine()} {platform.processor() or ''}".strip()
+        baselines['python'] = platform.python_version()
+        with open(BASELINES_PATH, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    for problem in problems:
+        print(f"REGRESSION {problem}", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""Deterministic synthetic LAS/LAZ tiles for benchmarks.
+
+A tile is a square of gently rolling ground with box buildings, conical trees
+and a sprinkle of noise returns, sampled at ``DENSITY_PER_M2`` so the extent
+grows with the point count the way real survey tiles do. Points are written
+in chunks, each from its own seeded generator, so a 50M-point tile never sits
+in memory and the same ``(points, seed)`` always gives identical bytes.
+"""
+import os
+import datetime
+
+import laspy
+import numpy as np
+
+DENSITY_PER_M2 = 20.0
+CHUNK_POINTS = 1_000_000
+ORIGIN = (500000.0, 4000000.0)  # UTM-like metres
+SCALES = (0.01, 0.01, 0.01)
+
+# ASPRS classes
+GROUND, VEGETATION, BUILDING, NOISE = 2, 5, 6, 7
+
+
+def parse_size(text):
+    """'1M' -> 1_000_000, '500k' -> 500_000, '2500' -> 2500."""
+    text = str(text).strip().lower()
+    factor = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if factor > 1 else text) * factor)
+
+
+def tile_width_m(points):
+    return float(np.sqrt(points / DENSITY_PER_M2))
+
+
+def _features(width, seed):
+    """Building footprints and tree positions, fixed per tile."""
+    rng = np.random.default_rng([seed, 0])
+    n_buildings = max(int(width * width / 4000), 1)
+    n_trees = max(int(width * width / 400), 1)
+    buildings = np.column_stack((
+        rng.uniform(0, width, n_buildings), rng.uniform(0, width, n_buildings),  # centre
+        rng.uniform(8, 25, n_buildings), rng.uniform(8, 25, n_buildings),  # size
+        rng.uniform(4, 15, n_buildings),  # height
+    ))
+    trees = np.column_stack((
+        rng.uniform(0, width, n_trees), rng.uniform(0, width, n_trees),
+        rng.uniform(2, 5, n_trees), rng.uniform(5, 20, n_trees),  # crown radius, height
+    ))
+    return buildings, trees
+
+
+def _ground(x, y, width):
+    return 100 + 5 * np.sin(x / width * 2 * np.pi) * np.cos(y / width * np.pi) + 0.01 * x
+
+
+def _chunk(n, width, buildings, trees, rng):
+    x = rng.uniform(0, width, n)
+    y = rng.uniform(0, width, n)
+    z = _ground(x, y, width) + rng.normal(0, 0.05, n)
+    classification = np.full(n, GROUND, dtype=np.uint8)
+
+    # A quarter of the points land on features: roofs first, then tree crowns
+    on_feature = np.flatnonzero(rng.random(n) < 0.25)
+    split = len(on_feature) // 2
+    roof, crown = on_feature[:split], on_feature[split:]
+
+    b = buildings[rng.integers(0, len(buildings), len(roof))]
+    x[roof] = np.clip(b[:, 0] + rng.uniform(-0.5, 0.5, len(roof)) * b[:, 2], 0, width)
+    y[roof] = np.clip(b[:, 1] + rng.uniform(-0.5, 0.5, len(roof)) * b[:, 3], 0, width)
+    z[roof] = _ground(x[roof], y[roof], width) + b[:, 4]
+    classification[roof] = BUILDING
+
+    t = trees[rng.integers(0, len(trees), len(crown))]
+    radius = t[:, 2] * np.sqrt(rng.random(len(crown)))
+    angle = rng.uniform(0, 2 * np.pi, len(crown))
+    x[crown] = np.clip(t[:, 0] + radius * np.cos(angle), 0, width)
+    y[crown] = np.clip(t[:, 1] + radius * np.sin(angle), 0, width)
+    z[crown] = _ground(x[crown], y[crown], width) + t[:, 3] * (1 - radius / t[:, 2] * 0.6)
+    classification[crown] = VEGETATION
+
+    # Birds and multipath: high and low outliers flagged as noise
+    noise = rng.random(n) < 0.001
+    z[noise] += rng.choice([-30.0, 80.0], int(noise.sum()))
+    classification[noise] = NOISE
+    return x + ORIGIN[0], y + ORIGIN[1], z, classification
+
+
+def write_tile(path, points, seed=42, chunk_points=CHUNK_POINTS):
+    """Write a synthetic tile of ``points`` points; ``.laz`` paths are compressed."""
+    width = tile_width_m(points)
+    buildings, trees = _features(width, seed)
+    header = laspy.LasHeader(point_format=3, version='1.2')
+    header.scales = np.array(SCALES)
+    header.offsets = np.array([ORIGIN[0], ORIGIN[1], 0.0])
+    # Fixed so the file bytes do not depend on the day it was generated
+    header.creation_date = datetime.date(2020, 1, 1)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with laspy.open(tmp_path, mode='w', header=header, do_compress=path.lower().endswith('.laz')) as writer:
+        for index, start in enumerate(range(0, points, chunk_points)):
+            n = min(chunk_points, points - start)
+            rng = np.random.default_rng([seed, index + 1])
+            x, y, z, classification = _chunk(n, width, buildings, trees, rng)
+            record = laspy.ScaleAwarePointRecord.zeros(n, header=header)
+            record.x, record.y, record.z = x, y, z
+            record.classification = classification
+            writer.write_points(record)
+    os.replace(tmp_path, path)
+    return path
+
+
+def cached_tile(directory, points, seed=42, compressed=False):
+    """Path to the tile for ``(points, seed)``, generating it on first use."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'synthetic_{points}_{seed}.{"laz" if compressed else "las"}')
+    if not os.path.exists(path):
+        write_tile(path, points, seed)
+    return path
@@ -0,0 +1,51 @@
+"""Pinned typical-year weather for benchmarks.
+
+One station at ``SITE`` with clear-sky irradiance (Ineichen, fixed Linke
+turbidity) thinned by a seeded daily cloud index, a seasonal temperature
+cycle and seeded wind. Every value comes from fixed parameters, so the
+fixture is identical on every machine and needs no downloaded TMY files.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pvlib
+
+from weather_store import HOURS_PER_YEAR, write_store
+
+SITE = {"lat": 35.79, "lon": -78.78, "utc_offset": -5, "elevation": 100.0}
+SEED = 1990
+LINKE_TURBIDITY = 3.0
+
+
+def fixture_columns(site=SITE, seed=SEED):
+    times = pd.date_range('1990-01-01', periods=HOURS_PER_YEAR, freq='h', tz=f"Etc/GMT{-site['utc_offset']:+d}")
+    location = pvlib.location.Location(site['lat'], site['lon'], altitude=site['elevation'])
+    clearsky = location.get_clearsky(times, model='ineichen', linke_turbidity=LINKE_TURBIDITY)
+
+    rng = np.random.default_rng(seed)
+    cloud = np.repeat(rng.beta(4, 1.5, HOURS_PER_YEAR // 24), 24)  # fraction of clear-sky reaching ground
+    day_of_year = np.arange(HOURS_PER_YEAR) / 24
+    hour = np.arange(HOURS_PER_YEAR) % 24
+    return {
+        "ghi": clearsky['ghi'].to_numpy() * cloud,
+        "dni": clearsky['dni'].to_numpy() * cloud ** 2,
+        "dhi": clearsky['dhi'].to_numpy() * (2 - cloud),
+        "temp_air": 15 - 10 * np.cos(2 * np.pi * (day_of_year - 15) / 365) - 5 * np.cos(2 * np.pi * (hour - 3) / 24),
+        "wind_speed": rng.gamma(2.0, 1.5, HOURS_PER_YEAR),
+    }
+
+
+def write_fixture(path, site=SITE, seed=SEED):
+    """Write a one-station weather store for ``site`` to ``path``."""
+    columns = fixture_columns(site, seed)
+    station = dict(site, name='benchmark', source=f'synthetic seed {seed}')
+    write_store(path, [station], {name: values[np.newaxis, :] for name, values in columns.items()})
+    return path
+
+
+def cached_fixture(directory, site=SITE, seed=SEED):
+    path = os.path.join(directory, f'weather_{seed}')
+    if not os.path.exists(os.path.join(path, 'stations.json')):
+        write_fixture(path, site, seed)
+    return path
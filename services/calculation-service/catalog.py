@@ -0,0 +1,383 @@
+"""Module and inverter catalog resolving ``panel_specs`` to model parameters.
+
+The SAM CEC module and inverter libraries (the CSVs bundled with pvlib, or
+``CATALOG_DIR``) are parsed once per worker into a :class:`Table`: display
+names, one float64 matrix of model parameters, and three indexes built at
+load time -
+
+* a dict of normalized names (lowercase alphanumerics, so
+  ``Canadian_Solar_Inc__CS5P_220M`` and ``Canadian Solar Inc. CS5P-220M``
+  are the same key) for exact lookups,
+* the sorted normalized names, so a manufacturer is a bisected prefix range,
+* rows sorted by rating (module STC watts, inverter AC watts) for
+  nearest-wattage and smallest-that-fits searches,
+
+plus a token index that narrows fuzzy name matching to rows sharing a word
+with the query. :meth:`Catalog.resolve` turns ``panel_specs`` into a
+concrete system and remembers the answer per distinct spec, so repeated
+requests resolve in a few microseconds.
+"""
+import os
+import re
+import json
+import math
+import bisect
+import difflib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from simulation import DEFAULT_DC_AC_RATIO
+
+CATALOG_DIR = os.getenv('CATALOG_DIR')  # default: pvlib's bundled data directory
+CATALOG_MODULES_FILE = os.getenv('CATALOG_MODULES_FILE', 'sam-library-cec-modules-2019-03-05.csv')
+CATALOG_INVERTERS_FILE = os.getenv('CATALOG_INVERTERS_FILE', 'sam-library-cec-inverters-2019-03-05.csv')
+CATALOG_DEFAULT_MODULE = os.getenv('CATALOG_DEFAULT_MODULE', 'Canadian Solar Inc. CS5P-220M')
+CATALOG_RESOLVE_CACHE_SIZE = int(os.getenv('CATALOG_RESOLVE_CACHE_SIZE', '1024'))
+
+# Parameters of pvlib.pvsystem.calcparams_cec, and the rest kept for reporting
+CEC_PARAMS = ('alpha_sc', 'a_ref', 'I_L_ref', 'I_o_ref', 'R_sh_ref', 'R_s', 'Adjust')
+MODULE_FIELDS = ('STC', 'PTC', 'A_c', 'N_s', 'I_sc_ref', 'V_oc_ref', 'I_mp_ref', 'V_mp_ref',
+                 'beta_oc', 'gamma_r') + CEC_PARAMS
+# Parameters of pvlib.inverter.sandia, plus the MPPT window
+INVERTER_FIELDS = ('Paco', 'Pdco', 'Vdco', 'Pso', 'C0', 'C1', 'C2', 'C3', 'Pnt', 'Vac',
+                   'Vdcmax', 'Idcmax', 'Mppt_low', 'Mppt_high')
+SANDIA_PARAMS = ('Paco', 'Pdco', 'Vdco', 'Pso', 'C0', 'C1', 'C2', 'C3', 'Pnt')
+
+TECHNOLOGIES = {
+    'mono': ('Mono-c-Si',),
+    'poly': ('Multi-c-Si',),
+    'multi': ('Multi-c-Si',),
+    'thin film': ('Thin Film', 'CdTe', 'CIGS'),
+    'cdte': ('CdTe',),
+    'cigs': ('CIGS',),
+}
+
+FUZZY_CANDIDATES = 64
+FUZZY_MIN_COVERAGE = 0.8
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+class CatalogError(ValueError):
+    """panel_specs name a module or inverter the catalog cannot resolve."""
+
+
+def normalize_name(name):
+    """Lowercase alphanumerics only; pvlib's mangled names normalize the same."""
+    return _NON_ALNUM.sub('', str(name).lower())
+
+
+def name_tokens(name):
+    return [t for t in _NON_ALNUM.split(str(name).lower()) if t]
+
+
+class Table:
+    """One library: names, a parameter matrix and the lookup indexes."""
+
+    def __init__(self, names, fields, values, rating_field, labels=None):
+        self.names = list(names)
+        self.fields = tuple(fields)
+        self.values = np.ascontiguousarray(values, dtype=np.float64)
+        self.labels = list(labels) if labels is not None else None
+        self._column = {field: i for i, field in enumerate(self.fields)}
+
+        keys = [normalize_name(n) for n in self.names]
+        self.keys = keys
+        self._by_key = {}
+        for row, key in enumerate(keys):
+            self._by_key.setdefault(key, row)
+        self._key_order = np.argsort(np.array(keys, dtype=object), kind='stable')
+        self._sorted_keys = [keys[i] for i in self._key_order]
+
+        self.ratings = self.column(rating_field)
+        self._rating_order = np.argsort(self.ratings, kind='stable')
+        self._sorted_ratings = self.ratings[self._rating_order]
+
+        tokens = {}
+        for row, name in enumerate(self.names):
+            for token in set(name_tokens(name)):
+                tokens.setdefault(token, []).append(row)
+        self._tokens = {token: np.array(rows, dtype=np.int32) for token, rows in tokens.items()}
+
+    def __len__(self):
+        return len(self.names)
+
+    def column(self, field):
+        return self.values[:, self._column[field]]
+
+    def record(self, row, fields=None):
+        """Plain-float parameters of one row."""
+        fields = fields or self.fields
+        return {field: float(self.values[row, self._column[field]]) for field in fields}
+
+    def lookup(self, name):
+        """Row for an exact (normalized) name, else the closest fuzzy match, else None."""
+        row = self._by_key.get(normalize_name(name))
+        if row is not None:
+            return row
+        matches = self.fuzzy(name, limit=1)
+        return matches[0] if matches else None
+
+    def fuzzy(self, name, limit=5):
+        """Rows whose names resemble ``name``, best first.
+
+        Candidates are the rows sharing the most tokens with the query; only
+        those are scored with difflib, so a query touches a few dozen names
+        rather than the whole table.
+        """
+        key = normalize_name(name)
+        hits = [self._tokens[t] for t in set(name_tokens(name)) if t in self._tokens]
+        if not key:
+            return []
+        if hits:
+            counts = np.bincount(np.concatenate(hits), minlength=len(self.names))
+            candidates = np.argsort(-counts, kind='stable')[:FUZZY_CANDIDATES]
+            candidates = candidates[counts[candidates] > 0]
+        else:
+            candidates = self.prefix_rows(key[:3])[:FUZZY_CANDIDATES]
+        scored = []
+        for row in candidates:
+            matcher = difflib.SequenceMatcher(None, key, self.keys[row], autojunk=False)
+            # Share of the query found in order in the name, so a bare model
+            # number still matches; the overall ratio prefers the closest length
+            coverage = sum(block.size for block in matcher.get_matching_blocks()) / len(key)
+            if coverage >= FUZZY_MIN_COVERAGE:
+                scored.append((-coverage, -matcher.ratio(), int(row)))
+        scored.sort()
+        return [row for _, _, row in scored[:limit]]
+
+    def prefix_rows(self, prefix):
+        """Rows whose normalized name starts with ``prefix`` (e.g. a manufacturer)."""
+        prefix = normalize_name(prefix)
+        lo = bisect.bisect_left(self._sorted_keys, prefix)
+        hi = bisect.bisect_left(self._sorted_keys, prefix + '\x7f')
+        return np.sort(self._key_order[lo:hi])
+
+    def nearest_rating(self, target, rows=None):
+        """Row rated closest to ``target`` (lowest row on ties)."""
+        if rows is None:
+            i = bisect.bisect_left(self._sorted_ratings, target)
+            neighbours = self._rating_order[max(i - 1, 0):i + 1]
+            rows = np.sort(neighbours)
+        if len(rows) == 0:
+            return None
+        return int(rows[np.argmin(np.abs(self.ratings[rows] - target))])
+
+    def smallest_at_least(self, target, rows=None):
+        """Lowest-rated row with a rating of at least ``target``, else the highest rated."""
+        if rows is None:
+            i = bisect.bisect_left(self._sorted_ratings, target)
+            return int(self._rating_order[min(i, len(self) - 1)])
+        if len(rows) == 0:
+            return None
+        ratings = self.ratings[rows]
+        fits = np.flatnonzero(ratings >= target)
+        if len(fits) == 0:
+            return int(rows[np.argmax(ratings)])
+        return int(rows[fits[np.argmin(ratings[fits])]])
+
+
+def _read_sam_csv(path, fields):
+    # Row 1 holds units and row 2 the SAM variable names
+    frame = pd.read_csv(path, skiprows=[1, 2])
+    # A few entries carry ranges like '422-528'; those count as unknown (0)
+    values = np.column_stack([
+        pd.to_numeric(frame[field], errors='coerce').fillna(0).to_numpy(dtype=np.float64) for field in fields
+    ])
+    return frame, values
+
+
+def default_catalog_dir():
+    import pvlib
+    return os.path.join(os.path.dirname(pvlib.__file__), 'data')
+
+
+class Catalog:
+    """CEC modules and inverters, with ``panel_specs`` resolution."""
+
+    def __init__(self, modules, inverters):
+        self.modules = modules
+        self.inverters = inverters
+        self._resolved = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path=None):
+        path = path or CATALOG_DIR or default_catalog_dir()
+        frame, values = _read_sam_csv(os.path.join(path, CATALOG_MODULES_FILE), MODULE_FIELDS)
+        modules = Table(frame['Name'], MODULE_FIELDS, values, 'STC', labels=frame['Technology'])
+        frame, values = _read_sam_csv(os.path.join(path, CATALOG_INVERTERS_FILE), INVERTER_FIELDS)
+        inverters = Table(frame['Name'], INVERTER_FIELDS, values, 'Paco')
+        return cls(modules, inverters)
+
+    def search(self, kind, name=None, manufacturer=None, power=None, technology=None, limit=10):
+        """Catalog entries filtered by manufacturer/technology, ranked by name or wattage."""
+        table = self.modules if kind == 'modules' else self.inverters
+        rows = self._filter(table, manufacturer, technology)
+        if name:
+            allowed = set(rows.tolist())
+            ranked = [r for r in table.fuzzy(name, limit=FUZZY_CANDIDATES) if r in allowed]
+        elif power is not None:
+            ranked = rows[np.argsort(np.abs(table.ratings[rows] - float(power)), kind='stable')]
+        else:
+            ranked = rows
+        return [self._describe(table, int(row)) for row in ranked[:limit]]
+
+    def _describe(self, table, row):
+        entry = {"name": table.names[row], "rating_w": round(float(table.ratings[row]), 2)}
+        if table.labels is not None:
+            entry["technology"] = table.labels[row]
+        return entry
+
+    def _filter(self, table, manufacturer=None, technology=None):
+        rows = table.prefix_rows(manufacturer) if manufacturer else np.arange(len(table))
+        if technology and table.labels is not None:
+            wanted = TECHNOLOGIES.get(str(technology).lower())
+            if wanted is None:
+                raise CatalogError(f"Unknown module type {technology!r}; expected one of {', '.join(TECHNOLOGIES)}")
+            rows = rows[[table.labels[r] in wanted for r in rows]] if len(rows) else rows
+        return rows
+
+    def resolve(self, panel_specs):
+        """Concrete module, inverter and stringing for ``panel_specs``.
+
+        Recognized keys: ``module`` (name, fuzzy matched), ``manufacturer``,
+        ``type`` (mono/poly/thin film), ``power`` (target module W),
+        ``count``, ``inverter`` (name), ``inverter_manufacturer``,
+        ``inverter_count`` and ``dc_ac_ratio``. Results are cached per
+        distinct spec.
+        """
+        key = json.dumps(panel_specs, sort_keys=True, default=str)
+        with self._lock:
+            system = self._resolved.get(key)
+            if system is not None:
+                self._resolved.move_to_end(key)
+                self.hits += 1
+                return system
+            self.misses += 1
+        system = self._resolve(panel_specs)
+        with self._lock:
+            self._resolved[key] = system
+            while len(self._resolved) > CATALOG_RESOLVE_CACHE_SIZE:
+                self._resolved.popitem(last=False)
+        return system
+
+    def _resolve(self, specs):
+        if not isinstance(specs, dict):
+            raise CatalogError("panel_specs must be an object")
+        modules, inverters = self.modules, self.inverters
+        try:
+            count = int(specs.get('count', 1))
+            power = float(specs['power']) if specs.get('power') is not None else None
+            dc_ac_ratio = float(specs.get('dc_ac_ratio', DEFAULT_DC_AC_RATIO))
+        except (TypeError, ValueError) as e:
+            raise CatalogError(f"Invalid panel_specs: {e}")
+        if count < 1 or dc_ac_ratio <= 0:
+            raise CatalogError("panel_specs count and dc_ac_ratio must be positive")
+
+        if specs.get('module'):
+            module = modules.lookup(specs['module'])
+            if module is None:
+                raise CatalogError(f"Unknown module {specs['module']!r}")
+        elif specs.get('manufacturer') or specs.get('type') or power is not None:
+            rows = self._filter(modules, specs.get('manufacturer'), specs.get('type'))
+            if len(rows) == 0:
+                raise CatalogError(f"No {specs.get('type') or ''} modules from {specs.get('manufacturer')!r}".replace('  ', ' '))
+            target = power if power is not None else modules.ratings[modules.lookup(CATALOG_DEFAULT_MODULE)]
+            module = modules.nearest_rating(target, rows if len(rows) < len(modules) else None)
+        else:
+            module = modules.lookup(CATALOG_DEFAULT_MODULE)
+        module_record = modules.record(module)
+        pdc0 = module_record['STC'] * count
+
+        if specs.get('inverter'):
+            inverter = inverters.lookup(specs['inverter'])
+            if inverter is None:
+                raise CatalogError(f"Unknown inverter {specs['inverter']!r}")
+        else:
+            rows = self._filter(inverters, specs.get('inverter_manufacturer')) if specs.get('inverter_manufacturer') else None
+            if rows is not None and len(rows) == 0:
+                raise CatalogError(f"No inverters from {specs['inverter_manufacturer']!r}")
+            inverter = inverters.smallest_at_least(pdc0 / dc_ac_ratio, rows)
+        inverter_record = inverters.record(inverter)
+        paco = inverter_record['Paco']
+        inverter_count = int(specs.get('inverter_count') or max(1, math.ceil(pdc0 / dc_ac_ratio / paco - 1e-9)))
+
+        return {
+            "module": {
+                "name": modules.names[module],
+                "technology": modules.labels[module],
+                "stc_w": module_record['STC'],
+                "area_m2": module_record['A_c'],
+                "params": {name: module_record[name] for name in CEC_PARAMS},
+                "gamma_pdc": module_record['gamma_r'] / 100,
+            },
+            "inverter": {
+                "name": inverters.names[inverter],
+                "paco_w": paco,
+                "params": {name: inverter_record[name] for name in SANDIA_PARAMS},
+            },
+            "modules": count,
+            "inverters": inverter_count,
+            "modules_per_string": modules_per_string(module_record, inverter_record, count / inverter_count),
+            "pdc0": pdc0,
+            "dc_ac_ratio": pdc0 / (paco * inverter_count),
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "modules": len(self.modules),
+                "inverters": len(self.inverters),
+                "resolved": len(self._resolved),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def modules_per_string(module, inverter, modules_per_inverter):
+    """Series modules bringing the string's V_mp closest to the inverter's nominal DC voltage.
+
+    Bounded by the modules each inverter gets and, when the library gives
+    one, by its maximum DC voltage at V_oc.
+    """
+    limit = max(int(modules_per_inverter), 1)
+    if inverter['Vdcmax'] > 0 and module['V_oc_ref'] > 0:
+        limit = min(limit, max(int(inverter['Vdcmax'] // module['V_oc_ref']), 1))
+    if module['V_mp_ref'] <= 0:
+        return 1
+    return int(min(max(round(inverter['Vdco'] / module['V_mp_ref']), 1), limit))
+
+
+def system_summary(system):
+    """The resolved system without model parameters, for responses."""
+    return {
+        "module": system['module']['name'],
+        "module_stc_w": round(system['module']['stc_w'], 2),
+        "technology": system['module']['technology'],
+        "modules": system['modules'],
+        "inverter": system['inverter']['name'],
+        "inverter_paco_w": round(system['inverter']['paco_w'], 2),
+        "inverters": system['inverters'],
+        "modules_per_string": system['modules_per_string'],
+        "dc_kw": round(system['pdc0'] / 1000, 3),
+        "dc_ac_ratio": round(system['dc_ac_ratio'], 3),
+    }
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+def get_catalog():
+    """Load the catalog once per worker process."""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = Catalog.load()
+    return _catalog
@@ -0,0 +1,240 @@
+"""Project cash flows and their Monte Carlo spread, as NumPy batches.
+
+Every scenario is a row of ``(scenarios, years)`` arrays: yearly energy
+(degrading from the simulated first year), revenue at an escalating
+tariff, and escalating O&M. NPV and LCOE are one discounted dot product
+per row, payback a cumulative sum, and IRR a bisection that halves every
+row's bracket at once. The base case is just the one-row batch, so the
+deterministic figures and the sensitivity percentiles come from the same
+code.
+
+Percentiles are reported as ``p10``/``p50``/``p90``, the 10th, 50th and
+90th percentile of each metric across scenarios.
+"""
+import os
+import time
+
+import numpy as np
+
+FINANCE_YEARS = int(os.getenv('FINANCE_YEARS', '25'))
+FINANCE_SCENARIOS = int(os.getenv('FINANCE_SCENARIOS', '10000'))
+FINANCE_MAX_SCENARIOS = int(os.getenv('FINANCE_MAX_SCENARIOS', '100000'))
+FINANCE_SEED = int(os.getenv('FINANCE_SEED', '0'))
+FINANCE_COST_PER_W = float(os.getenv('FINANCE_COST_PER_W', '1.5'))
+FINANCE_TARIFF_USD_KWH = float(os.getenv('FINANCE_TARIFF_USD_KWH', '0.12'))
+FINANCE_DISCOUNT_RATE = float(os.getenv('FINANCE_DISCOUNT_RATE', '0.06'))
+FINANCE_OM_USD_KW_YEAR = float(os.getenv('FINANCE_OM_USD_KW_YEAR', '18'))
+
+DEFAULT_TARIFF_ESCALATION = 0.02
+DEFAULT_OM_ESCALATION = 0.025
+DEFAULT_DEGRADATION = 0.005
+# One standard deviation of each sampled input; yield and O&M are relative
+DEFAULT_UNCERTAINTY = {
+    "yield": 0.05,
+    "degradation": 0.0015,
+    "tariff_escalation": 0.01,
+    "om": 0.2,
+    "discount_rate": 0.01,
+}
+IRR_BRACKET = (-0.99, 1.0)
+IRR_ITERATIONS = 48
+PERCENTILES = {"p10": 0.1, "p50": 0.5, "p90": 0.9}
+
+
+class FinancialError(ValueError):
+    """Raised for financial inputs that cannot describe a project."""
+
+
+def _number(config, key, default, low=None, high=None):
+    value = config.get(key, default)
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise FinancialError(f"financial.{key} must be a number")
+    if not np.isfinite(value) or (low is not None and value < low) or (high is not None and value > high):
+        raise FinancialError(f"financial.{key} must be within [{low}, {high}]")
+    return value
+
+
+def parse_financial(config):
+    """Validated financial inputs from a request's ``financial`` object (all keys optional)."""
+    if config is None:
+        config = {}
+    if not isinstance(config, dict):
+        raise FinancialError("financial must be an object")
+    uncertainty = config.get('uncertainty') or {}
+    if not isinstance(uncertainty, dict) or set(uncertainty) - set(DEFAULT_UNCERTAINTY):
+        raise FinancialError(f"financial.uncertainty keys are {', '.join(DEFAULT_UNCERTAINTY)}")
+    inputs = {
+        "cost_usd": _number(config, 'cost_usd', None, 0) if config.get('cost_usd') is not None else None,
+        "cost_per_w": _number(config, 'cost_per_w', FINANCE_COST_PER_W, 0),
+        "tariff_usd_kwh": _number(config, 'tariff_usd_kwh', FINANCE_TARIFF_USD_KWH, 0),
+        "tariff_escalation": _number(config, 'tariff_escalation', DEFAULT_TARIFF_ESCALATION, -0.5, 0.5),
+        "degradation": _number(config, 'degradation', DEFAULT_DEGRADATION, 0, 0.2),
+        "om_usd_kw_year": _number(config, 'om_usd_kw_year', FINANCE_OM_USD_KW_YEAR, 0),
+        "om_escalation": _number(config, 'om_escalation', DEFAULT_OM_ESCALATION, -0.5, 0.5),
+        "discount_rate": _number(config, 'discount_rate', FINANCE_DISCOUNT_RATE, -0.5, 1),
+        "years": int(_number(config, 'years', FINANCE_YEARS, 1, 50)),
+        "scenarios": int(_number(config, 'scenarios', FINANCE_SCENARIOS, 0, FINANCE_MAX_SCENARIOS)),
+        "seed": int(_number(config, 'seed', FINANCE_SEED, 0)),
+        "uncertainty": {key: _number(uncertainty, key, default, 0, 1) for key, default in DEFAULT_UNCERTAINTY.items()},
+    }
+    return inputs
+
+
+def _column(values):
+    return np.asarray(values, dtype=float).reshape(-1, 1)
+
+
+def cash_flows(annual_kwh, capex, tariff, tariff_escalation, degradation, om_per_year, om_escalation, years):
+    """Yearly energy ``(S, years)`` and cash flows ``(S, years + 1)``, year 0 being ``-capex``.
+
+    Every argument but ``years`` is a scalar or a length-S array.
+    """
+    t = np.arange(years, dtype=float)
+    energy = _column(annual_kwh) * (1 - _column(degradation)) ** t
+    revenue = energy * _column(tariff) * (1 + _column(tariff_escalation)) ** t
+    om = _column(om_per_year) * (1 + _column(om_escalation)) ** t
+    rows = max(len(energy), len(revenue), len(om), np.size(capex))
+    flows = np.empty((rows, years + 1))
+    flows[:, 0] = -np.broadcast_to(np.asarray(capex, dtype=float), (rows,))
+    flows[:, 1:] = revenue - om
+    return np.broadcast_to(energy, (rows, years)), flows, np.broadcast_to(om, (rows, years))
+
+
+def _discount(rate, periods):
+    return (1 + _column(rate)) ** -np.arange(periods, dtype=float)
+
+
+def npv(flows, rate):
+    """Net present value of each row at its rate, by Horner's rule in ``1 / (1 + rate)``."""
+    x = 1 / (1 + np.broadcast_to(np.asarray(rate, dtype=float), (len(flows),)))
+    total = flows[:, -1].copy()
+    for column in range(flows.shape[1] - 2, -1, -1):
+        total *= x
+        total += flows[:, column]
+    return total
+
+
+def irr(flows):
+    """Internal rate of return per row by vectorized bisection; NaN where NPV never changes sign.
+
+    Project flows are one outlay followed by net income, so NPV falls
+    monotonically with the rate and the root in the bracket is unique.
+    """
+    low = np.full(len(flows), IRR_BRACKET[0])
+    high = np.full(len(flows), IRR_BRACKET[1])
+    npv_low = npv(flows, low)
+    bracketed = (npv_low > 0) & (npv(flows, high) < 0)
+    for _ in range(IRR_ITERATIONS):
+        mid = (low + high) / 2
+        npv_mid = npv(flows, mid)
+        above = (npv_mid > 0) == (npv_low > 0)
+        low = np.where(above, mid, low)
+        npv_low = np.where(above, npv_mid, npv_low)
+        high = np.where(above, high, mid)
+    return np.where(bracketed, (low + high) / 2, np.nan)
+
+
+def payback_years(flows):
+    """Years until cumulative cash turns positive, interpolated within the year; inf if never."""
+    cumulative = np.cumsum(flows, axis=1)
+    paid = cumulative >= 0
+    year = np.where(paid.any(axis=1), paid.argmax(axis=1), 0)
+    rows = np.arange(len(flows))
+    before = cumulative[rows, np.maximum(year - 1, 0)]
+    flow = flows[rows, year]
+    fraction = np.divide(-before, flow, out=np.zeros(len(flows)), where=flow > 0)
+    result = np.where(year > 0, year - 1 + fraction, 0.0)
+    return np.where(paid.any(axis=1), result, np.inf)
+
+
+def evaluate(annual_kwh, capex, tariff, tariff_escalation, degradation, om_per_year, om_escalation,
+             discount_rate, years):
+    """NPV, IRR, LCOE, payback and ROI for each scenario row."""
+    energy, flows, om = cash_flows(annual_kwh, capex, tariff, tariff_escalation, degradation, om_per_year,
+                                   om_escalation, years)
+    discount = _discount(discount_rate, years + 1)
+    discounted_energy = (energy * discount[:, 1:]).sum(axis=1)
+    capex = -flows[:, 0]
+    return {
+        "npv": (flows * discount).sum(axis=1),
+        "irr": irr(flows),
+        "lcoe": np.divide(capex + (om * discount[:, 1:]).sum(axis=1), discounted_energy,
+                          out=np.full(len(flows), np.inf), where=discounted_energy > 0),
+        "payback_years": payback_years(flows),
+        "roi": np.divide(flows[:, 1:].sum(axis=1) - capex, capex, out=np.zeros(len(flows)), where=capex > 0),
+        "flows": flows,
+    }
+
+
+def _json_number(value, digits):
+    value = float(value)
+    return round(value, digits) if np.isfinite(value) else None
+
+
+def _percentiles(values, digits):
+    # inverted_cdf picks observed values, so never-paid-back (inf) rows stay
+    # inf instead of poisoning the interpolation; an undefined IRR ranks lowest
+    quantiles = np.quantile(np.where(np.isnan(values), -np.inf, values), list(PERCENTILES.values()),
+                            method='inverted_cdf')
+    return {name: _json_number(q, digits) for name, q in zip(PERCENTILES, quantiles)}
+
+
+def monte_carlo(annual_kwh, capex, om_per_year, inputs):
+    """Metric rows for ``inputs['scenarios']`` sampled scenarios, drawn from a seeded generator."""
+    n = inputs['scenarios']
+    sd = inputs['uncertainty']
+    rng = np.random.default_rng(inputs['seed'])
+    return evaluate(
+        annual_kwh * np.clip(rng.normal(1, sd['yield'], n), 0, None),
+        capex,
+        inputs['tariff_usd_kwh'],
+        rng.normal(inputs['tariff_escalation'], sd['tariff_escalation'], n),
+        np.clip(rng.normal(inputs['degradation'], sd['degradation'], n), 0, 1),
+        om_per_year * np.clip(rng.normal(1, sd['om'], n), 0, None),
+        inputs['om_escalation'],
+        np.clip(rng.normal(inputs['discount_rate'], sd['discount_rate'], n), IRR_BRACKET[0], None),
+        inputs['years'],
+    )
+
+
+def analyze(annual_kwh, capacity_kw, inputs):
+    """``calculations.financial_data`` for a first-year yield and DC capacity.
+
+    The flat keys (``cost``, ``roi``, ``npv``, ...) are the base case and
+    what the PDF reports list; ``cash_flows``, ``inputs`` and
+    ``monte_carlo`` carry the detail.
+    """
+    capex = inputs['cost_usd'] if inputs['cost_usd'] is not None else inputs['cost_per_w'] * capacity_kw * 1000
+    om_per_year = inputs['om_usd_kw_year'] * capacity_kw
+    base = evaluate(annual_kwh, capex, inputs['tariff_usd_kwh'], inputs['tariff_escalation'], inputs['degradation'],
+                    om_per_year, inputs['om_escalation'], inputs['discount_rate'], inputs['years'])
+    result = {
+        "cost": round(capex, 2),
+        "roi": _json_number(base['roi'][0], 4),
+        "npv": _json_number(base['npv'][0], 2),
+        "irr": _json_number(base['irr'][0], 4),
+        "lcoe": _json_number(base['lcoe'][0], 4),
+        "payback_years": _json_number(base['payback_years'][0], 2),
+        "cash_flows": np.round(base['flows'][0], 2).tolist(),
+        "inputs": {**inputs, "capacity_kw": round(capacity_kw, 3), "annual_kwh": round(annual_kwh, 3)},
+    }
+    if inputs['scenarios']:
+        start = time.perf_counter()
+        scenarios = monte_carlo(annual_kwh, capex, om_per_year, inputs)
+        spread = {
+            "npv": _percentiles(scenarios['npv'], 2),
+            "irr": _percentiles(scenarios['irr'], 4),
+            "lcoe": _percentiles(scenarios['lcoe'], 4),
+            "payback_years": _percentiles(scenarios['payback_years'], 2),
+        }
+        result.update({f"npv_{name}": value for name, value in spread['npv'].items()})
+        result["monte_carlo"] = {
+            "scenarios": inputs['scenarios'],
+            "seed": inputs['seed'],
+            **spread,
+            "probability_positive_npv": round(float((scenarios['npv'] > 0).mean()), 4),
+            "seconds": round(time.perf_counter() - start, 4),
+        }
+    return result
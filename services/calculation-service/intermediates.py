@@ -0,0 +1,175 @@
+"""Stage outputs kept per project so a recalculation redoes only what changed.
+
+A calculation leaves one ``project_intermediates`` row behind. ``inputs``
+(JSON) records the request and what each stored stage was computed from;
+``arrays`` is a compressed ``.npz`` of the stage outputs:
+
+* weather: the station's hourly columns (the station and year in ``inputs``)
+* solar position: apparent zenith and azimuth for the same hours
+* shading: observer horizons, azimuths and the hourly beam factor
+* poa: open-field direct, sky-diffuse and ground-reflected POA, hourly
+* terrain: the ground raster used for row placement
+
+:func:`plan` compares a recalculation request against ``inputs`` and
+names the stages that must be recomputed; everything upstream of them is
+read back from here. About 0.2 MB per project compressed.
+"""
+import io
+import json
+
+import numpy as np
+import pandas as pd
+
+from weather_store import SiteWeather, WEATHER_COLUMNS
+from shading import ShadingResult, sky_view_factor
+from layout import Terrain, parse_layout
+
+INTERMEDIATES_VERSION = 1
+
+
+def _shading_key(mount):
+    return {"array_height_m": mount.get('array_height_m'), "array_span_m": mount.get('array_span_m')}
+
+
+def _orientation_key(mount, minutes):
+    # Only hourly POA is stored
+    if minutes != 60:
+        return None
+    return {"tilt": float(mount.get('tilt', 30)), "azimuth": float(mount.get('azimuth', 180))}
+
+
+class Intermediates:
+    """A project's stored stage outputs."""
+
+    def __init__(self, inputs, arrays):
+        self.inputs = inputs
+        self.arrays = arrays
+
+    @classmethod
+    def collect(cls, request, lidar, weather, solpos, shading, terrain, poa):
+        """Intermediates of a finished calculation.
+
+        ``request`` holds the ``location``, ``panel_specs``,
+        ``ground_mount_config``, ``resolution`` and parsed ``financial``
+        inputs it ran with. ``poa`` is hourly POA components for the
+        mount's orientation (:func:`time_series.simulate_time_series`
+        returns them from hourly runs), or None.
+        """
+        mount = request.get('ground_mount_config') or {}
+        arrays = {name: np.asarray(weather[name], dtype=np.float32) for name in WEATHER_COLUMNS}
+        arrays['apparent_zenith'] = solpos['apparent_zenith'].to_numpy(dtype=np.float32)
+        arrays['sun_azimuth'] = solpos['azimuth'].to_numpy(dtype=np.float32)
+        inputs = {
+            "version": INTERMEDIATES_VERSION,
+            "request": request,
+            "lidar": {"mins": list(lidar['mins']), "maxs": list(lidar['maxs']), "center": list(lidar['center']),
+                      "header_mins": list(lidar.get('header_mins', lidar['mins'])),
+                      "header_maxs": list(lidar.get('header_maxs', lidar['maxs'])),
+                      "point_count": lidar['point_count']},
+            "weather": {"station": weather.station, "distance_km": weather.distance_km,
+                        "year": int(weather.times[0].year)},
+            "shading": None,
+            "poa": None,
+            "terrain_cell_m": None,
+        }
+        if shading is not None:
+            arrays.update(horizon_azimuths=shading.azimuths, horizons=shading.horizons,
+                          beam_factor=np.asarray(shading.beam_factor, dtype=np.float32))
+            inputs["shading"] = {**_shading_key(mount), "surface": True, "seconds": shading.seconds,
+                                 "levels": shading.levels}
+        else:
+            inputs["shading"] = {**_shading_key(mount), "surface": False}
+        if poa is not None:
+            arrays.update(poa_direct=poa['direct'], poa_sky=poa['sky'], poa_ground=poa['ground'])
+            inputs["poa"] = _orientation_key(mount, 60)
+        if terrain is not None:
+            arrays['terrain'] = terrain.elevation
+            inputs["terrain_cell_m"] = terrain.cell_m
+        return cls(inputs, arrays)
+
+    @property
+    def request(self):
+        return self.inputs['request']
+
+    def weather(self):
+        info = self.inputs['weather']
+        columns = {name: self.arrays[name].astype(float) for name in WEATHER_COLUMNS}
+        return SiteWeather(info['station'], info['distance_km'], columns, info['year'])
+
+    def solar_position(self, times):
+        zenith = self.arrays['apparent_zenith'].astype(float)
+        return pd.DataFrame({
+            "apparent_zenith": zenith,
+            "apparent_elevation": 90 - zenith,
+            "azimuth": self.arrays['sun_azimuth'].astype(float),
+        }, index=times)
+
+    def shading_for(self, mount):
+        """``(reusable, ShadingResult or None)`` for a mount's observer height and span."""
+        stored = self.inputs['shading']
+        if stored is None or _shading_key(mount) != {k: stored.get(k) for k in ('array_height_m', 'array_span_m')}:
+            return False, None
+        if not stored['surface']:
+            return True, None
+        horizons = self.arrays['horizons']
+        return True, ShadingResult(self.arrays['horizon_azimuths'], horizons, self.arrays['beam_factor'],
+                                   sky_view_factor(horizons), stored['seconds'], stored.get('levels'))
+
+    def poa_for(self, mount, minutes):
+        """Stored hourly POA components if they were computed for this orientation, else None."""
+        key = _orientation_key(mount, minutes)
+        if key is None or self.inputs['poa'] != key:
+            return None
+        return {"direct": self.arrays['poa_direct'], "sky": self.arrays['poa_sky'], "ground": self.arrays['poa_ground']}
+
+    def terrain(self):
+        if 'terrain' not in self.arrays:
+            return None
+        return Terrain(self.arrays['terrain'], self.inputs['terrain_cell_m'])
+
+    def dumps(self):
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **self.arrays)
+        return buffer.getvalue()
+
+
+def plan(stored, mount, minutes):
+    """Stages a recalculation must recompute, given the new mount and time step.
+
+    Temperature, power and the financials always run, since they depend
+    on the system; the rest are listed only when their inputs changed.
+    """
+    stages = []
+    reusable, _ = stored.shading_for(mount)
+    if not reusable:
+        stages.append('shading')
+    if parse_layout(mount) is not None and stored.terrain() is None:
+        stages.append('terrain')
+    if stored.poa_for(mount, minutes) is None:
+        stages.append('irradiance')
+    return stages
+
+
+def save_intermediates(cur, project_id, intermediates):
+    cur.execute(
+        "INSERT INTO project_intermediates (project_id, inputs, arrays) VALUES (%s, %s, %s) "
+        "ON CONFLICT (project_id) DO UPDATE SET inputs = EXCLUDED.inputs, arrays = EXCLUDED.arrays, "
+        "updated_at = CURRENT_TIMESTAMP",
+        (project_id, json.dumps(intermediates.inputs), intermediates.dumps())
+    )
+
+
+def load_intermediates(cur, project_id):
+    """A project's :class:`Intermediates`, or None if it has none (or from another version)."""
+    cur.execute("SELECT inputs, arrays FROM project_intermediates WHERE project_id = %s", (project_id,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    inputs, blob = row
+    if isinstance(inputs, str):
+        inputs = json.loads(inputs)
+    if inputs.get('version') != INTERMEDIATES_VERSION:
+        return None
+    with np.load(io.BytesIO(bytes(blob))) as npz:
+        arrays = {name: npz[name] for name in npz.files}
+    return Intermediates(inputs, arrays)
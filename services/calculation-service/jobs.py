@@ -0,0 +1,143 @@
+"""Background calculation jobs with per-stage progress.
+
+Jobs run on a bounded thread pool. A slot is reserved before the project row
+is created so a saturated pool is rejected up front instead of leaving a
+project stuck in 'calculating'. Job state lives in this worker process; the
+``projects.status`` column is the durable record other workers fall back to.
+"""
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+CALC_WORKERS = int(os.getenv('CALC_WORKERS', '2'))
+CALC_QUEUE_SIZE = int(os.getenv('CALC_QUEUE_SIZE', '8'))
+JOB_RETENTION_SECONDS = int(os.getenv('JOB_RETENTION_SECONDS', '3600'))
+
+STAGES = ('lidar', 'weather', 'solar_position', 'shading', 'irradiance', 'temperature', 'power', 'financial',
+          'persist')
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """Progress of one calculation, stage by stage."""
+
+    def __init__(self, project_id, stages=STAGES):
+        self.project_id = str(project_id)
+        self.status = 'queued'
+        self.stages = {name: {"state": "pending", "seconds": None} for name in stages}
+        self.result = None
+        self.error = None
+        self.points = None  # LIDAR points, once ingested
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """Mark ``name`` running for the duration of the block and time it.
+
+        A stage entered more than once (e.g. per month chunk) accumulates
+        its time.
+        """
+        with self._lock:
+            self.status = 'calculating'
+            self.stages.setdefault(name, {"state": "pending", "seconds": None})["state"] = "running"
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            with self._lock:
+                self.stages[name]["state"] = "failed"
+            raise
+        finally:
+            with self._lock:
+                elapsed = time.perf_counter() - start + (self.stages[name]["seconds"] or 0)
+                self.stages[name]["seconds"] = round(elapsed, 4)
+        with self._lock:
+            self.stages[name]["state"] = "done"
+
+    def finish(self, result=None, error=None):
+        with self._lock:
+            self.result = result
+            self.error = error
+            self.status = 'error' if error else 'completed'
+            self.finished_at = time.time()
+
+    def timings(self):
+        """``{stage: seconds}`` for the stages that have run."""
+        with self._lock:
+            return {name: s["seconds"] for name, s in self.stages.items() if s["seconds"] is not None}
+
+    def to_dict(self):
+        with self._lock:
+            done = sum(1 for s in self.stages.values() if s["state"] == "done")
+            return {
+                "project_id": self.project_id,
+                "status": self.status,
+                "progress": round(done / len(self.stages), 3) if self.stages else None,
+                "stages": {name: dict(s) for name, s in self.stages.items()},
+                "result": self.result,
+                "error": self.error,
+            }
+
+
+class JobManager:
+
+    def __init__(self, workers=CALC_WORKERS, queue_size=CALC_QUEUE_SIZE, retention=JOB_RETENTION_SECONDS):
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='calc-job')
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Claim a slot for a job about to be submitted; False when saturated."""
+        return self._slots.acquire(blocking=False)
+
+    def release(self):
+        self._slots.release()
+
+    def submit(self, project_id, fn, *args, **kwargs):
+        """Run ``fn(job, *args, **kwargs)`` in the pool using a reserved slot."""
+        job = Job(project_id)
+        with self._lock:
+            self._prune()
+            self._jobs[job.project_id] = job
+
+        def run():
+            try:
+                job.finish(result=fn(job, *args, **kwargs))
+            except Exception as e:
+                logger.error(f"Calculation job {job.project_id} failed: {e}")
+                job.finish(error=str(e))
+            finally:
+                self.release()
+
+        self._executor.submit(run)
+        return job
+
+    def get(self, project_id):
+        with self._lock:
+            return self._jobs.get(str(project_id))
+
+    def stats(self):
+        with self._lock:
+            states = [job.status for job in self._jobs.values()]
+        return {
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "queued": states.count('queued'),
+            "running": states.count('calculating'),
+        }
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for project_id in [pid for pid, job in self._jobs.items()
+                           if job.finished_at and job.finished_at < cutoff]:
+            del self._jobs[project_id]
@@ -0,0 +1,363 @@
+"""Ground-mount row layout on LIDAR terrain, with row-to-row shading.
+
+Rows run perpendicular to the array azimuth across a rectangular site
+around the array center, ``pitch`` apart (or ``row_width / gcr``), inside
+a setback from the site edges. Each row sits on the terrain under it: its
+base height and along-row slope come from a ground model rasterized
+during ingest (lowest ground-class return per cell, lowest return where
+the cloud is unclassified).
+
+Inter-row beam shading is pvlib's 1-D shaded fraction
+(:func:`pvlib.shading.shaded_fraction1d`) for every front/back row pair,
+with the pair's terrain rise as the cross-axis slope, evaluated for all
+timesteps and pairs as one ``(timesteps, pairs)`` array. Pairs on similar
+ground are grouped first (slopes rounded to 0.1 degrees), so a flat site
+costs one column however many rows it has. Interior rows also lose the
+sky diffuse hidden behind the row in front (Passias masking at mid-row).
+"""
+import copy
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pvlib
+
+from point_cloud_store import load_point_cloud, stored_bounds
+from shading import Raster, horizontal_scale, NOISE_CLASSES
+from simulation import (temperature_model_parameters, DEFAULT_DC_AC_RATIO, DEFAULT_ETA_INV_NOM,
+                        DEFAULT_ALBEDO, DEFAULT_GAMMA_PDC)
+
+LAYOUT_ROW_WIDTH_M = float(os.getenv('LAYOUT_ROW_WIDTH_M', '4.0'))
+LAYOUT_SETBACK_M = float(os.getenv('LAYOUT_SETBACK_M', '5.0'))
+LAYOUT_SITE_M = float(os.getenv('LAYOUT_SITE_M', '100'))
+LAYOUT_MAX_SITE_M = float(os.getenv('LAYOUT_MAX_SITE_M', '400'))
+LAYOUT_MAX_ROWS = int(os.getenv('LAYOUT_MAX_ROWS', '500'))
+LAYOUT_MAX_CANDIDATES = int(os.getenv('LAYOUT_MAX_CANDIDATES', '64'))
+LAYOUT_TERRAIN_CELL_M = float(os.getenv('LAYOUT_TERRAIN_CELL_M', '2.0'))
+
+GROUND_CLASS = 2
+# Pairs whose slopes round to the same tenth of a degree share a shading column
+SLOPE_RESOLUTION_DEG = 0.1
+
+
+class LayoutError(ValueError):
+    """Raised for layout parameters that cannot describe a row layout."""
+
+
+def _positive(config, key, default=None, upper=None):
+    value = config.get(key, default)
+    if value is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise LayoutError(f"{key} must be a number")
+    if not np.isfinite(value) or value <= 0 or (upper is not None and value > upper):
+        raise LayoutError(f"{key} must be positive" + (f" and at most {upper:g}" if upper is not None else ''))
+    return value
+
+
+def parse_layout(config, defaults=None):
+    """Layout parameters from a ``ground_mount_config``-style dict, or None without ``gcr``/``pitch_m``.
+
+    ``defaults`` fills keys the config leaves out (e.g. a batch's shared
+    ``site_m``).
+    """
+    if not isinstance(config or {}, dict) or not isinstance(defaults or {}, dict):
+        raise LayoutError("ground_mount_config must be an object")
+    config = {**(defaults or {}), **(config or {})}
+    if config.get('gcr') is None and config.get('pitch_m') is None:
+        return None
+    row_width = _positive(config, 'row_width_m', LAYOUT_ROW_WIDTH_M)
+    gcr = _positive(config, 'gcr', upper=1)
+    pitch = _positive(config, 'pitch_m')
+    if pitch is None:
+        pitch = row_width / gcr
+    if pitch < row_width:
+        raise LayoutError("pitch_m must be at least row_width_m (gcr at most 1)")
+    setback = config.get('setback_m', LAYOUT_SETBACK_M)
+    try:
+        setback = float(setback)
+        tilt = float(config.get('tilt', 30))
+        azimuth = float(config.get('azimuth', 180)) % 360
+        site = config.get('site_m', LAYOUT_SITE_M)
+        width, depth = (site, site) if np.isscalar(site) else site
+        width, depth = float(width), float(depth)
+    except (TypeError, ValueError):
+        raise LayoutError("setback_m, tilt, azimuth and site_m must be numbers (site_m may be [width, depth])")
+    if setback < 0 or not 0 <= tilt < 90:
+        raise LayoutError("setback_m must be non-negative and tilt within [0, 90)")
+    if not (0 < width <= LAYOUT_MAX_SITE_M and 0 < depth <= LAYOUT_MAX_SITE_M):
+        raise LayoutError(f"site_m must be positive and at most {LAYOUT_MAX_SITE_M:g} m")
+    return {
+        "tilt": tilt, "azimuth": azimuth, "row_width_m": row_width, "pitch_m": pitch,
+        "gcr": row_width / pitch, "setback_m": setback, "site_m": (width, depth),
+    }
+
+
+class TerrainModelBuilder:
+    """Ingest consumer rasterizing bare ground around the tile center for row placement."""
+
+    def __init__(self, cell_m=None, size_m=None, units=None):
+        self.cell_m = cell_m or LAYOUT_TERRAIN_CELL_M
+        self.size_m = size_m or LAYOUT_MAX_SITE_M
+        self.units = units
+        self.grids = []
+
+    def start(self, header):
+        mins = np.asarray(header.mins, dtype=float)
+        maxs = np.asarray(header.maxs, dtype=float)
+        self.scale = horizontal_scale(mins, maxs, self.units)
+        self.center = ((mins[0] + maxs[0]) / 2, (mins[1] + maxs[1]) / 2)
+        half_x = self.size_m / 2 / self.scale[0]
+        half_y = self.size_m / 2 / self.scale[1]
+        window = (self.center[0] - half_x, self.center[1] - half_y, self.center[0] + half_x, self.center[1] + half_y)
+        # Ground-classified returns, and every return for unclassified clouds
+        self.grids = [Raster(window[:2], self.cell_m, self.size_m, self.size_m, self.scale, window, np.minimum)
+                      for _ in range(2)]
+
+    def __call__(self, points, x, y, z):
+        if not self.grids or not len(x):
+            return
+        classes = getattr(points, 'classification', None)
+        try:
+            classes = np.asarray(classes)
+            if classes.shape != x.shape or classes.dtype.kind not in 'iu':
+                raise TypeError
+        except (TypeError, ValueError):
+            self.grids[1].add(x, y, z)
+            return
+        ground = classes == GROUND_CLASS
+        self.grids[0].add(x[ground], y[ground], z[ground])
+        keep = ~np.isin(classes, NOISE_CLASSES)
+        self.grids[1].add(x[keep], y[keep], z[keep])
+
+    def split(self):
+        """An empty copy for a parallel ingest worker (see :func:`lidar_ingest.ingest_lidar`)."""
+        part = copy.copy(self)
+        part.grids = [grid.empty() for grid in self.grids]
+        return part
+
+    def merge(self, part):
+        """Fold a worker's copy back in; the lowest return wins."""
+        for grid, other in zip(self.grids, part.grids):
+            grid.merge(other)
+
+    def build(self):
+        """The :class:`Terrain` around the tile center, or None without points."""
+        if not self.grids:
+            return None
+        ground, lowest = (grid.grid() for grid in self.grids)
+        elevation = np.where(np.isnan(ground), lowest, ground)
+        if np.isnan(elevation).all():
+            return None
+        return Terrain(elevation, self.cell_m)
+
+
+def load_terrain(cur, project_id, level=2, units=None, tiles_cur=None):
+    """The :class:`Terrain` of a stored point cloud, read at pyramid ``level``.
+
+    The coarse levels keep the highest point per 3-D voxel, so ground
+    returns under canopy survive at the 2 m level. The grid is placed from
+    the stored tile envelopes, then the tiles stream through the builder in
+    one pass. None without a stored cloud. ``tiles_cur`` is as for
+    :func:`point_cloud_store.load_point_cloud`.
+    """
+    bounds = stored_bounds(cur, project_id, level)
+    if bounds is None:
+        return None
+    builder = TerrainModelBuilder(units=units)
+    builder.start(SimpleNamespace(mins=bounds[0], maxs=bounds[1]))
+    for x, y, z, classification in load_point_cloud(cur, project_id, level=level, tiles_cur=tiles_cur):
+        builder(SimpleNamespace(classification=classification), x, y, z)
+    return builder.build()
+
+
+class Terrain:
+    """Ground elevations on a square grid, addressed in metres east/north of its center."""
+
+    def __init__(self, elevation, cell_m):
+        self.elevation = elevation
+        self.cell_m = cell_m
+        self.fill = float(np.nanmedian(elevation))
+
+    def sample(self, east_m, north_m):
+        """Elevation at local offsets; cells without returns take the site median."""
+        n_rows, n_cols = self.elevation.shape
+        col = np.rint(np.asarray(east_m) / self.cell_m + (n_cols - 1) / 2).astype(np.int64)
+        row = np.rint(np.asarray(north_m) / self.cell_m + (n_rows - 1) / 2).astype(np.int64)
+        inside = (row >= 0) & (row < n_rows) & (col >= 0) & (col < n_cols)
+        values = np.full(np.shape(col), self.fill)
+        values[inside] = self.elevation[row[inside], col[inside]]
+        return np.where(np.isnan(values), self.fill, values)
+
+
+class RowLayout:
+    """Rows placed on a site, with their terrain and row-to-row shading."""
+
+    def __init__(self, layout, base_m, axis_tilt, row_length_m):
+        self.tilt = layout['tilt']
+        self.azimuth = layout['azimuth']
+        self.row_width_m = layout['row_width_m']
+        self.pitch_m = layout['pitch_m']
+        self.gcr = layout['gcr']
+        self.setback_m = layout['setback_m']
+        self.site_m = layout['site_m']
+        self.row_length_m = row_length_m
+        self.base_m = base_m  # terrain height under each row, front row first
+        self.axis_tilt = axis_tilt  # along-row slope, pvlib sign convention
+        self.axis_azimuth = (self.azimuth - 90) % 360
+        # Rise from each row to the one behind it, as the pair's cross-axis slope
+        cross = np.degrees(np.arctan2(np.diff(base_m), self.pitch_m))
+        pair_tilt = (axis_tilt[:-1] + axis_tilt[1:]) / 2
+        keys = np.round(np.column_stack((pair_tilt, cross)) / SLOPE_RESOLUTION_DEG) * SLOPE_RESOLUTION_DEG
+        if len(keys):
+            self._pairs, self._weights = np.unique(keys, axis=0, return_counts=True)
+        else:
+            self._pairs, self._weights = np.empty((0, 2)), np.empty(0, dtype=int)
+        self.cross_slope = cross
+
+    @property
+    def rows(self):
+        return len(self.base_m)
+
+    @property
+    def collector_area_m2(self):
+        return self.rows * self.row_length_m * self.row_width_m
+
+    def modules(self, module_area_m2):
+        """Modules of ``module_area_m2`` that fit on the rows."""
+        return int(self.collector_area_m2 // module_area_m2) if module_area_m2 > 0 else 0
+
+    def shaded_fraction(self, sun_azimuth, sun_elevation):
+        """Mean shaded fraction of the back rows' collector width, ``(timesteps,)``.
+
+        The front row is never shaded by another row, so the array-wide
+        beam loss is this times ``(rows - 1) / rows``.
+        """
+        sun_azimuth = np.asarray(sun_azimuth, dtype=float)
+        sun_elevation = np.asarray(sun_elevation, dtype=float)
+        if not len(self._weights):
+            return np.zeros(sun_azimuth.shape, dtype=np.float32)
+        fraction = pvlib.shading.shaded_fraction1d(
+            90 - sun_elevation[..., None], sun_azimuth[..., None], self.axis_azimuth, self.tilt,
+            collector_width=self.row_width_m, pitch=self.pitch_m,
+            axis_tilt=self._pairs[:, 0], cross_axis_slope=self._pairs[:, 1],
+        )
+        fraction = np.where(sun_elevation[..., None] > 0, np.nan_to_num(fraction), 0.0)
+        return (fraction @ self._weights / self._weights.sum()).astype(np.float32)
+
+    def beam_factor_at(self, sun_azimuth, sun_elevation):
+        """Array-wide fraction of the beam reaching the collectors at each timestep."""
+        shaded = self.shaded_fraction(sun_azimuth, sun_elevation)
+        return 1 - shaded * np.float32((self.rows - 1) / self.rows) if self.rows else np.ones_like(shaded)
+
+    @property
+    def sky_factor(self):
+        """Share of sky diffuse the rows keep, with interior rows masked by the row in front."""
+        if self.rows < 2:
+            return 1.0
+        masking = pvlib.shading.masking_angle(self.tilt, self.gcr, 0.5)
+        lost = float(pvlib.shading.sky_diffuse_passias(masking))
+        return 1 - lost * (self.rows - 1) / self.rows
+
+    def summary(self):
+        return {
+            "rows": self.rows,
+            "row_length_m": round(self.row_length_m, 2),
+            "row_width_m": round(self.row_width_m, 2),
+            "pitch_m": round(self.pitch_m, 3),
+            "gcr": round(self.gcr, 4),
+            "setback_m": self.setback_m,
+            "site_m": list(self.site_m),
+            "collector_area_m2": round(self.collector_area_m2, 1),
+            "terrain_relief_m": round(float(np.ptp(self.base_m)), 2) if self.rows else 0.0,
+            "max_cross_slope_deg": round(float(np.abs(self.cross_slope).max(initial=0)), 2),
+            "max_axis_slope_deg": round(float(np.abs(self.axis_tilt).max(initial=0)), 2),
+            "sky_factor": round(self.sky_factor, 4),
+        }
+
+
+def place_rows(layout, terrain=None):
+    """A :class:`RowLayout` for parsed ``layout`` parameters on ``terrain`` (flat without one)."""
+    width, depth = layout['site_m']
+    setback = layout['setback_m']
+    tilt = np.radians(layout['tilt'])
+    depth_h = layout['row_width_m'] * np.cos(tilt)
+    row_length = width - 2 * setback
+    usable = depth - 2 * setback - depth_h
+    if row_length <= 0 or usable < 0:
+        raise LayoutError("site_m leaves no room for a row inside the setback")
+    rows = min(int(usable // layout['pitch_m']) + 1, LAYOUT_MAX_ROWS)
+
+    az = np.radians(layout['azimuth'])
+    facing = np.array([np.sin(az), np.cos(az)])  # east, north
+    axis = np.array([-np.cos(az), np.sin(az)])  # along the row, towards axis_azimuth
+    # Row centers from the front (facing) edge of the site backwards
+    offsets = depth / 2 - setback - depth_h / 2 - np.arange(rows) * layout['pitch_m']
+    along = np.linspace(-row_length / 2, row_length / 2, max(int(row_length // LAYOUT_TERRAIN_CELL_M) + 1, 2))
+    if terrain is None:
+        base = np.zeros(rows)
+        axis_tilt = np.zeros(rows)
+    else:
+        east = offsets[:, None] * facing[0] + along[None, :] * axis[0]
+        north = offsets[:, None] * facing[1] + along[None, :] * axis[1]
+        heights = terrain.sample(east, north)
+        base = np.median(heights, axis=1)
+        # Least-squares rise per metre along each row; pvlib tilts the axis
+        # positive when its axis_azimuth end is lower
+        centered = along - along.mean()
+        rise = (heights - heights.mean(axis=1, keepdims=True)) @ centered / (centered @ centered)
+        axis_tilt = -np.degrees(np.arctan(rise))
+    return RowLayout(layout, base, axis_tilt, row_length)
+
+
+def evaluate_layouts(inputs, layouts, power_density_w_m2, gamma_pdc=DEFAULT_GAMMA_PDC,
+                     eta_inv_nom=DEFAULT_ETA_INV_NOM, albedo=DEFAULT_ALBEDO, temperature_params=None,
+                     beam_factor=None, sky_view_factor=None):
+    """Annual yield of each :class:`RowLayout` over :func:`simulation.site_arrays` inputs.
+
+    Capacity is collector area times ``power_density_w_m2`` (module STC
+    watts per m²). All layouts run through POA, row shading, cell
+    temperature and PVWatts DC/AC as ``(layouts, timesteps)`` arrays.
+    ``beam_factor``/``sky_view_factor`` add a LIDAR horizon on top.
+    """
+    params = temperature_params or temperature_model_parameters()
+    hours = inputs['hours']
+    elevation = 90 - inputs['zenith']
+    tilt = np.array([[layout.tilt] for layout in layouts], dtype=float)
+    azimuth = np.array([[layout.azimuth] for layout in layouts], dtype=float)
+    pdc0 = np.array([[layout.collector_area_m2 * power_density_w_m2] for layout in layouts], dtype=float)
+
+    poa = pvlib.irradiance.get_total_irradiance(
+        tilt, azimuth, inputs['zenith'], inputs['azimuth'], inputs['dni'], inputs['ghi'], inputs['dhi'], albedo=albedo
+    )
+    poa_direct = np.nan_to_num(poa['poa_direct'])
+    poa_sky = np.nan_to_num(poa['poa_sky_diffuse'])
+    poa_ground = np.nan_to_num(poa['poa_ground_diffuse'])
+    row_beam = np.stack([layout.beam_factor_at(inputs['azimuth'], elevation) for layout in layouts])
+    sky = np.array([[layout.sky_factor] for layout in layouts])
+    insolation_open = (poa_direct + poa_sky + poa_ground).sum(axis=1)
+    insolation_rows = (poa_direct * row_beam + poa_sky * sky + poa_ground).sum(axis=1)
+    if beam_factor is not None:
+        row_beam = row_beam * np.asarray(beam_factor, dtype=float)
+    if sky_view_factor is not None:
+        sky = sky * sky_view_factor
+    poa_global = poa_direct * row_beam + poa_sky * sky + poa_ground
+
+    cell_temperature = pvlib.temperature.sapm_cell(
+        poa_global, inputs['temp_air'], inputs['wind_speed'], params['a'], params['b'], params['deltaT']
+    )
+    dc = pvlib.pvsystem.pvwatts_dc(poa_global, cell_temperature, pdc0, gamma_pdc)
+    ac = np.clip(np.nan_to_num(pvlib.inverter.pvwatts(dc, pdc0 / DEFAULT_DC_AC_RATIO, eta_inv_nom)), 0, None)
+    annual_kwh = ac.sum(axis=1) * hours / 1000
+    pdc0 = pdc0[:, 0]
+    site_area = np.array([layout.site_m[0] * layout.site_m[1] for layout in layouts])
+    return {
+        "capacity_kw": pdc0 / 1000,
+        "annual_kwh": annual_kwh,
+        "specific_yield_kwh_kwp": np.divide(annual_kwh, pdc0 / 1000, out=np.zeros(len(layouts)), where=pdc0 > 0),
+        "kwh_per_site_m2": annual_kwh / site_area,
+        "row_shading_loss_pct": np.divide(insolation_open - insolation_rows, insolation_open,
+                                          out=np.zeros(len(layouts)), where=insolation_open > 0),
+    }
@@ -0,0 +1,285 @@
+import os
+import time
+import shutil
+import base64
+import binascii
+import resource
+import tempfile
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import laspy
+import numpy as np
+
+# Memory budget for the decoded point chunks held at any one time. The upload
+# itself is spooled to disk, so peak memory does not grow with tile size.
+LIDAR_MEMORY_BUDGET_MB = int(os.getenv('LIDAR_MEMORY_BUDGET_MB', '64'))
+# Uploads smaller than this stay in memory; larger ones roll over to a temp file.
+LIDAR_SPOOL_MAX_BYTES = int(os.getenv('LIDAR_SPOOL_MAX_BYTES', str(8 * 1024 * 1024)))
+COPY_BLOCK_BYTES = 1024 * 1024
+# Processes that decode and transform point ranges in parallel; 1 keeps
+# ingest in the calling process, 0 uses every core
+LIDAR_INGEST_WORKERS = int(os.getenv('LIDAR_INGEST_WORKERS', '1'))
+# Smaller clouds are ingested in-process; the worker round trips would dominate
+LIDAR_PARALLEL_MIN_POINTS = int(os.getenv('LIDAR_PARALLEL_MIN_POINTS', '2000000'))
+# LASzip's default chunk size; parallel jobs start on chunk boundaries so no
+# compressed chunk is decoded twice
+LAZ_CHUNK_POINTS = 50_000
+# Each decoded chunk is expanded to float64 x/y/z plus the raw record.
+_SCALED_BYTES_PER_POINT = 3 * 8
+
+
+class LidarIngestError(ValueError):
+    """Raised when an upload cannot be decoded into a LAS/LAZ stream."""
+
+
+def _current_rss_bytes():
+    """Resident set size of this process, or 0 where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _peak_rss_bytes():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def spool_stream(stream, block_size=COPY_BLOCK_BYTES, digest=None):
+    """Copy a file-like upload into a seekable spooled temp file block by block.
+
+    ``digest`` (a hashlib object) is fed every block on the way through.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=LIDAR_SPOOL_MAX_BYTES)
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        if digest is not None:
+            digest.update(block)
+        spool.write(block)
+    spool.seek(0)
+    return spool
+
+
+def spool_base64(b64_text, block_size=COPY_BLOCK_BYTES, digest=None):
+    """Decode base64 text into a spooled temp file, one block at a time.
+
+    Only a block of the text is encoded and decoded at once, so memory
+    beyond the request body itself stays within ``block_size``. ``digest``
+    is fed the decoded bytes, as in :func:`spool_stream`.
+    """
+    block_size -= block_size % 4
+    spool = tempfile.SpooledTemporaryFile(max_size=LIDAR_SPOOL_MAX_BYTES)
+    carry = b''
+    try:
+        for start in range(0, len(b64_text), block_size):
+            text = b64_text[start:start + block_size]
+            if isinstance(text, str):
+                text = text.encode('ascii')
+            # Whitespace shifts the 4-character alignment; carry the unaligned tail to the next block
+            text = carry + text.translate(None, b' \t\r\n')
+            aligned = len(text) - len(text) % 4
+            block = base64.b64decode(text[:aligned], validate=True)
+            carry = text[aligned:]
+            if digest is not None:
+                digest.update(block)
+            spool.write(block)
+        if carry:
+            raise ValueError("Incorrect padding")
+    except (binascii.Error, ValueError) as e:
+        spool.close()
+        raise LidarIngestError(f"Invalid base64 LIDAR payload: {e}")
+    spool.seek(0)
+    return spool
+
+
+def chunk_points_for_budget(point_record_size, budget_bytes=None):
+    """Number of points per chunk that keeps decoded chunks within the budget."""
+    if budget_bytes is None:
+        budget_bytes = LIDAR_MEMORY_BUDGET_MB * 1024 * 1024
+    per_point = max(int(point_record_size), 1) + _SCALED_BYTES_PER_POINT
+    return max(budget_bytes // per_point, 1024)
+
+
+def ingest_workers(workers=None):
+    """Worker processes for ``workers`` (default ``LIDAR_INGEST_WORKERS``; 0 means every core)."""
+    workers = LIDAR_INGEST_WORKERS if workers is None else int(workers)
+    return workers if workers > 0 else os.cpu_count() or 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _ingest_pool(workers):
+    """Process pool kept per worker count for the life of the process.
+
+    Workers are forked where the platform allows, so they start with the
+    service's modules already imported.
+    """
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+            pool = _pools[workers] = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(method))
+        return pool
+
+
+def _source_path(source):
+    """A filesystem path worker processes can open, copying in-memory or unnamed sources.
+
+    Returns ``(path, temporary)``; a temporary copy is the caller's to delete.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source), False
+    name = getattr(source, 'name', None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return name, False
+    source.seek(0)
+    with tempfile.NamedTemporaryFile(suffix='.las', delete=False) as copy:
+        shutil.copyfileobj(source, copy, COPY_BLOCK_BYTES)
+    return copy.name, True
+
+
+def _bounds(x, y, z):
+    return (x.min(), y.min(), z.min()), (x.max(), y.max(), z.max())
+
+
+def _ingest_range(path, start, stop, parts):
+    """Worker side of parallel ingest: decode points ``[start, stop)`` and run them through ``parts``."""
+    with laspy.open(path) as reader:
+        reader.seek(start)
+        points = reader.read_points(stop - start)
+    x = np.asarray(points.x)
+    y = np.asarray(points.y)
+    z = np.asarray(points.z)
+    bounds = _bounds(x, y, z) if len(x) else None
+    for part in parts:
+        part(points, x, y, z)
+    return len(x), bounds, parts, _current_rss_bytes()
+
+
+def _parallel_ranges(point_count, chunk_points, workers):
+    """``(start, stop)`` jobs: a few per worker, each within the chunk budget, on LAZ chunk boundaries."""
+    per_job = min(chunk_points, -(-point_count // (4 * workers)))
+    per_job = max(-(-per_job // LAZ_CHUNK_POINTS) * LAZ_CHUNK_POINTS, LAZ_CHUNK_POINTS)
+    return [(start, min(start + per_job, point_count)) for start in range(0, point_count, per_job)]
+
+
+def ingest_lidar(source, budget_bytes=None, consumers=(), workers=None):
+    """Stream a LAS/LAZ file chunk by chunk and summarize the point cloud.
+
+    ``consumers`` are callables invoked with every ``(points, x, y, z)``
+    chunk, so downstream analyses can accumulate what they need without
+    the full cloud ever being materialized. Consumers with a ``start``
+    method are first handed the file header.
+
+    With more than one worker, clouds of at least
+    ``LIDAR_PARALLEL_MIN_POINTS`` are decoded in point ranges on a process
+    pool. Every consumer must then offer ``split()``, a picklable empty
+    copy that a worker feeds one range, and ``merge(part)`` to fold that
+    copy back in. Ranges are merged in file order, so consumers see the
+    same points in the same order as a serial run. The memory budget
+    applies to each worker.
+    """
+    start = time.perf_counter()
+    rss_start = _current_rss_bytes()
+    rss_peak = rss_start
+    workers = ingest_workers(workers)
+
+    mins = np.full(3, np.inf)
+    maxs = np.full(3, -np.inf)
+    point_count = 0
+    chunk_count = 0
+    worker_rss_peak = 0
+
+    def add_bounds(bounds):
+        np.minimum(mins, bounds[0], out=mins)
+        np.maximum(maxs, bounds[1], out=maxs)
+
+    # Decode LAZ chunks on several threads when more than one core is allowed
+    backend = laspy.LazBackend.LazrsParallel if workers > 1 else None
+    if backend is not None and not backend.is_available():
+        backend = None
+    with laspy.open(source, laz_backend=backend) as reader:
+        header = reader.header
+        chunk_points = chunk_points_for_budget(header.point_format.size, budget_bytes)
+        for consumer in consumers:
+            if hasattr(consumer, 'start'):
+                consumer.start(header)
+        parallel = (workers > 1 and header.point_count >= LIDAR_PARALLEL_MIN_POINTS
+                    and all(hasattr(c, 'split') and hasattr(c, 'merge') for c in consumers))
+        if parallel:
+            path, temporary = _source_path(source)
+            try:
+                pool = _ingest_pool(workers)
+                pending = deque()
+                ranges = iter(_parallel_ranges(header.point_count, chunk_points, workers))
+                while True:
+                    # Keep two jobs per worker in flight; finished ranges wait for
+                    # their turn so merges happen in file order
+                    for job in ranges:
+                        pending.append(pool.submit(_ingest_range, path, *job, [c.split() for c in consumers]))
+                        if len(pending) >= 2 * workers:
+                            break
+                    if not pending:
+                        break
+                    count, bounds, parts, worker_rss = pending.popleft().result()
+                    if bounds is not None:
+                        add_bounds(bounds)
+                    for consumer, part in zip(consumers, parts):
+                        consumer.merge(part)
+                    point_count += count
+                    chunk_count += 1
+                    worker_rss_peak = max(worker_rss_peak, worker_rss)
+                    rss_peak = max(rss_peak, _current_rss_bytes())
+            finally:
+                for future in pending:
+                    future.cancel()
+                if temporary:
+                    os.unlink(path)
+        else:
+            workers = 1
+            for points in reader.chunk_iterator(chunk_points):
+                x = np.asarray(points.x)
+                y = np.asarray(points.y)
+                z = np.asarray(points.z)
+                if len(x):
+                    add_bounds(_bounds(x, y, z))
+                for consumer in consumers:
+                    consumer(points, x, y, z)
+                point_count += len(x)
+                chunk_count += 1
+                rss_peak = max(rss_peak, _current_rss_bytes())
+
+    # Consumers laid out their grids from the header extent, which may be wider than the points
+    header_mins = np.asarray(header.mins, dtype=float)
+    header_maxs = np.asarray(header.maxs, dtype=float)
+    if point_count == 0:
+        # Fall back to the header extent for empty or header-only files
+        mins, maxs = header_mins, header_maxs
+
+    elapsed = time.perf_counter() - start
+    return {
+        "point_count": point_count,
+        "mins": mins.tolist(),
+        "maxs": maxs.tolist(),
+        "center": [(mins[0] + maxs[0]) / 2, (mins[1] + maxs[1]) / 2],
+        "header_mins": header_mins.tolist(),
+        "header_maxs": header_maxs.tolist(),
+        "stats": {
+            "chunks": chunk_count,
+            "workers": workers,
+            "chunk_points": chunk_points,
+            "seconds": round(elapsed, 4),
+            "points_per_sec": round(point_count / elapsed, 1) if elapsed > 0 else None,
+            "rss_start_mb": round(rss_start / 2**20, 1),
+            "peak_rss_mb": round(max(rss_peak, rss_start) / 2**20, 1),
+            "process_peak_rss_mb": round(_peak_rss_bytes() / 2**20, 1),
+            "worker_peak_rss_mb": round(worker_rss_peak / 2**20, 1) if worker_rss_peak else None,
+        },
+    }
@@ -0,0 +1,196 @@
+"""Hourly AC/DC/POA series per project, stored and served as raw float32.
+
+Each project's latest calculation keeps one ``project_profiles`` row whose
+``data`` is the three columns back to back as little-endian float32
+(``PROFILE_COLUMNS`` order, 8760 hours each, about 105 KB). Hour 0 is
+January 1 00:00 local standard time of the station's typical year; runs
+finer than hourly store their hourly means.
+
+That layout is already the body of a ``(projects, columns, hours)`` ``.npy``
+array, so a bulk export writes one header and then each stored blob as it
+comes off the cursor, with no decoding or per-value boxing. The Arrow IPC
+stream (pyarrow, optional) gathers the same bytes into ``fixed_size_list``
+columns, one record batch per fetch, again without converting values.
+"""
+import collections
+import io
+import os
+import struct
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow output is optional; NumPy is always available
+    pa = None
+
+PROFILE_COLUMNS = ('ac_w', 'dc_w', 'poa_w_m2')
+PROFILE_HOURS = 8760
+PROFILE_DTYPE = np.dtype('<f4')
+PROFILE_BYTES = len(PROFILE_COLUMNS) * PROFILE_HOURS * PROFILE_DTYPE.itemsize
+PROFILE_BULK_MAX = int(os.getenv('PROFILE_BULK_MAX', '20000'))
+PROFILE_FETCH_ROWS = int(os.getenv('PROFILE_FETCH_ROWS', '256'))
+NPY_CONTENT_TYPE = 'application/x-npy'
+ARROW_CONTENT_TYPE = 'application/vnd.apache.arrow.stream'
+FORMATS = {"npy": NPY_CONTENT_TYPE, "arrow": ARROW_CONTENT_TYPE}
+MISSING_PROFILE = np.full(PROFILE_BYTES // PROFILE_DTYPE.itemsize, np.nan, dtype=PROFILE_DTYPE).tobytes()
+
+
+class ProfileError(ValueError):
+    """Raised for export requests that cannot be served."""
+
+
+def pack_profile(hourly):
+    """The stored blob for ``simulate_time_series(...)['hourly']``."""
+    data = np.empty((len(PROFILE_COLUMNS), PROFILE_HOURS), dtype=PROFILE_DTYPE)
+    for row, name in enumerate(PROFILE_COLUMNS):
+        data[row] = hourly[name]
+    return data.tobytes()
+
+
+def unpack_profile(blob):
+    """``{column: float32 array}`` viewing a stored blob (no copy)."""
+    data = np.frombuffer(blob, dtype=PROFILE_DTYPE).reshape(len(PROFILE_COLUMNS), PROFILE_HOURS)
+    return dict(zip(PROFILE_COLUMNS, data))
+
+
+def save_profile(cur, project_id, hourly):
+    cur.execute(
+        "INSERT INTO project_profiles (project_id, data) VALUES (%s, %s) "
+        "ON CONFLICT (project_id) DO UPDATE SET data = EXCLUDED.data, updated_at = CURRENT_TIMESTAMP",
+        (project_id, pack_profile(hourly))
+    )
+
+
+def parse_export(project_ids, fmt):
+    """Validated ``(project_ids, format)`` for an export request."""
+    if not isinstance(project_ids, list) or not project_ids:
+        raise ProfileError("project_ids must be a non-empty list")
+    if len(project_ids) > PROFILE_BULK_MAX:
+        raise ProfileError(f"At most {PROFILE_BULK_MAX} projects per export")
+    fmt = fmt or 'npy'
+    if fmt not in FORMATS:
+        raise ProfileError(f"format must be one of {', '.join(FORMATS)}")
+    if fmt == 'arrow' and pa is None:
+        raise ProfileError("Arrow output needs pyarrow, which is not installed; use format=npy")
+    return [str(project_id) for project_id in project_ids], fmt
+
+
+def fetch_profiles(cur, project_ids):
+    """``(project_id, blob or None)`` for every requested id, in request order.
+
+    ``project_ids`` must be canonical (``str(uuid.UUID(...))``), the form
+    ``project_id::text`` comes back in; an id may repeat. ``cur`` should be a
+    named (server-side) cursor so only ``PROFILE_FETCH_ROWS`` blobs are held
+    at a time. Rows come back in first-request order, so besides the
+    cursor's batch only one row read ahead and blobs still wanted by a later
+    duplicate are kept.
+    """
+    first = {}
+    for position, project_id in enumerate(project_ids):
+        first.setdefault(project_id, position)
+    distinct = list(first)
+    remaining = collections.Counter(project_ids)
+    cur.itersize = PROFILE_FETCH_ROWS
+    cur.execute(
+        "SELECT project_id::text, data FROM project_profiles WHERE project_id = ANY(%s::uuid[]) "
+        "ORDER BY array_position(%s::uuid[], project_id)",
+        (distinct, distinct)
+    )
+    rows = iter(cur)
+    received = {}
+    exhausted = False
+    for project_id in project_ids:
+        # Read until this id's row arrives or a row for a later id shows it is missing
+        while project_id not in received and not exhausted:
+            row = next(rows, None)
+            if row is None:
+                exhausted = True
+                break
+            received[row[0]] = row[1]
+            if first.get(row[0], -1) > first[project_id]:
+                break
+        remaining[project_id] -= 1
+        blob = received.get(project_id) if remaining[project_id] else received.pop(project_id, None)
+        yield project_id, blob
+
+
+def npy_header(count):
+    """``.npy`` (version 1.0) header for a C-order ``(count, columns, hours)`` float32 array."""
+    header = repr({"descr": PROFILE_DTYPE.str, "fortran_order": False,
+                   "shape": (count, len(PROFILE_COLUMNS), PROFILE_HOURS)})
+    # Magic, version and length take 10 bytes; the header pads to a 64-byte boundary
+    header += ' ' * (-(10 + len(header) + 1) % 64) + '\n'
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+
+def write_npy(rows, count):
+    """Chunks of one ``.npy`` holding ``count`` profiles; projects without one are all NaN."""
+    yield npy_header(count)
+    for project_id, blob in rows:
+        if blob is None:
+            yield MISSING_PROFILE
+        elif len(blob) != PROFILE_BYTES:
+            raise ProfileError(f"Stored profile for {project_id} holds {len(blob)} bytes, expected {PROFILE_BYTES}")
+        else:
+            yield blob if isinstance(blob, bytes) else bytes(blob)
+
+
+def arrow_schema():
+    return pa.schema([("project_id", pa.string())] +
+                     [(name, pa.list_(pa.float32(), PROFILE_HOURS)) for name in PROFILE_COLUMNS])
+
+
+def _arrow_batch(ids, blobs):
+    columns = [pa.array(ids, pa.string())]
+    count = len(ids)
+    column_bytes = PROFILE_HOURS * PROFILE_DTYPE.itemsize
+    for index in range(len(PROFILE_COLUMNS)):
+        # One buffer per column over the blobs' slices: the values are copied
+        # once into Arrow's contiguous buffer and never converted
+        values = pa.py_buffer(b''.join(memoryview(blob)[index * column_bytes:(index + 1) * column_bytes]
+                                       for blob in blobs))
+        flat = pa.Array.from_buffers(pa.float32(), count * PROFILE_HOURS, [None, values])
+        columns.append(pa.FixedSizeListArray.from_arrays(flat, PROFILE_HOURS))
+    return pa.RecordBatch.from_arrays(columns, schema=arrow_schema())
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write target that hands Arrow's output back to the response as it is written."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+def write_arrow(rows, batch_rows=PROFILE_FETCH_ROWS):
+    """Chunks of an Arrow IPC stream, one record batch per ``batch_rows`` stored profiles.
+
+    Projects without a stored profile are left out; ``project_id`` says which rows are present.
+    """
+    sink = _ChunkSink()
+    writer = pa.ipc.new_stream(sink, arrow_schema())
+    ids, blobs = [], []
+    for project_id, blob in rows:
+        if blob is None:
+            continue
+        ids.append(project_id)
+        blobs.append(blob)
+        if len(ids) == batch_rows:
+            writer.write_batch(_arrow_batch(ids, blobs))
+            ids, blobs = [], []
+            yield from sink.drain()
+    if ids:
+        writer.write_batch(_arrow_batch(ids, blobs))
+    writer.close()
+    yield from sink.drain()
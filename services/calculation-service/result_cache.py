@@ -0,0 +1,232 @@
+"""Memoized calculation results keyed by a content hash of the inputs.
+
+Resubmitting the same LIDAR file with the same project name, location, panel
+specs and ground-mount config (page reloads, client retries) returns the
+project that already holds the result instead of re-running the pipeline and
+inserting a duplicate ``projects`` row.
+
+The key is a SHA-256 over the LIDAR bytes (hashed while the upload is
+spooled) and the canonical JSON of the other inputs, so key order and
+``30`` vs ``30.0`` do not matter. ``RESULT_MEMO_VERSION`` is mixed in;
+bump it when a model change should invalidate earlier results.
+
+``RESULT_MEMO_STORE`` selects the store: ``memory`` (per-process LRU, the
+default), ``postgres`` (the ``calculation_memo`` table, shared by every
+worker) or ``off``. Entries expire after ``RESULT_MEMO_TTL_SECONDS`` and the
+least recently used are evicted beyond ``RESULT_MEMO_MAX_ENTRIES``.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+RESULT_MEMO_STORE = os.getenv('RESULT_MEMO_STORE', 'memory')
+RESULT_MEMO_MAX_ENTRIES = int(os.getenv('RESULT_MEMO_MAX_ENTRIES', '1024'))
+RESULT_MEMO_TTL_SECONDS = int(os.getenv('RESULT_MEMO_TTL_SECONDS', str(7 * 24 * 3600)))
+RESULT_MEMO_VERSION = os.getenv('RESULT_MEMO_VERSION', '1')
+
+# Coordinates are stored as NUMERIC(9, 6)
+LOCATION_DECIMALS = 6
+
+
+def _normalize(value):
+    """Canonical form for hashing: numbers as floats, nested containers recursively."""
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return str(value)
+
+
+def calculation_key(lidar_digest, project_name, location, panel_specs, ground_mount_config, options=None):
+    """Hex SHA-256 identifying one calculation request.
+
+    ``options`` holds further inputs that change the result (e.g. the time
+    resolution); it only enters the key when set, so earlier keys stay valid.
+    """
+    location = {k: round(float(v), LOCATION_DECIMALS) if isinstance(v, (int, float)) else v
+                for k, v in (location or {}).items()}
+    payload = {
+        "version": RESULT_MEMO_VERSION,
+        "lidar": lidar_digest,
+        "project_name": project_name,
+        "location": _normalize(location),
+        "panel_specs": _normalize(panel_specs),
+        "ground_mount_config": _normalize(ground_mount_config or {}),
+    }
+    if options:
+        payload["options"] = _normalize(options)
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class MemoryResultStore:
+    """Per-process LRU of ``key -> (project_id, result)`` with a TTL."""
+
+    def __init__(self, max_entries=RESULT_MEMO_MAX_ENTRIES, ttl=RESULT_MEMO_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        # Keys by project, so a recalculated project's entries can be dropped
+        self._project_keys = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, key, project_id, result):
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.time(), str(project_id), result)
+            self._project_keys.setdefault(str(project_id), set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def discard(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def discard_project(self, project_id):
+        """Drop every entry pointing at a project, e.g. after it was recalculated."""
+        with self._lock:
+            for key in self._project_keys.pop(str(project_id), ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._project_keys.clear()
+            self.hits = self.misses = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._project_keys.get(entry[1])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._project_keys[entry[1]]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "store": "memory",
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+class PostgresResultStore:
+    """``calculation_memo`` table shared by every worker.
+
+    Rows cascade away with their project, so a deleted project is never
+    returned. Expired rows and the least recently used rows beyond
+    ``max_entries`` are pruned on write.
+    """
+
+    def __init__(self, connect, max_entries=RESULT_MEMO_MAX_ENTRIES, ttl=RESULT_MEMO_TTL_SECONDS):
+        self.connect = connect
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _run(self, sql, params, fetch=False):
+        conn = self.connect()
+        try:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            row = cur.fetchone() if fetch else None
+            conn.commit()
+            cur.close()
+            return row
+        finally:
+            conn.close()
+
+    def get(self, key):
+        row = self._run(
+            "UPDATE calculation_memo SET last_used_at = CURRENT_TIMESTAMP "
+            "WHERE input_hash = %s AND created_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 second' "
+            "RETURNING project_id, result",
+            (key, self.ttl), fetch=True
+        )
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        project_id, result = row
+        if isinstance(result, str):
+            result = json.loads(result)
+        return str(project_id), result
+
+    def put(self, key, project_id, result):
+        self._run(
+            "INSERT INTO calculation_memo (input_hash, project_id, result) VALUES (%s, %s, %s) "
+            "ON CONFLICT (input_hash) DO UPDATE SET project_id = EXCLUDED.project_id, result = EXCLUDED.result, "
+            "created_at = CURRENT_TIMESTAMP, last_used_at = CURRENT_TIMESTAMP",
+            (key, str(project_id), json.dumps(result))
+        )
+        self._run(
+            "DELETE FROM calculation_memo WHERE created_at <= CURRENT_TIMESTAMP - %s * INTERVAL '1 second' "
+            "OR input_hash IN (SELECT input_hash FROM calculation_memo ORDER BY last_used_at DESC OFFSET %s)",
+            (self.ttl, self.max_entries)
+        )
+
+    def discard(self, key):
+        self._run("DELETE FROM calculation_memo WHERE input_hash = %s", (key,))
+
+    def discard_project(self, project_id):
+        """Drop every entry pointing at a project, e.g. after it was recalculated."""
+        self._run("DELETE FROM calculation_memo WHERE project_id = %s", (str(project_id),))
+
+    def clear(self):
+        self._run("DELETE FROM calculation_memo", ())
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "store": "postgres",
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+def make_result_store(kind=None, connect=None):
+    """The store selected by ``RESULT_MEMO_STORE``, or None when memoization is off."""
+    kind = kind or RESULT_MEMO_STORE
+    if kind == 'off':
+        return None
+    if kind == 'postgres':
+        return PostgresResultStore(connect)
+    if kind == 'memory':
+        return MemoryResultStore()
+    raise ValueError(f"Unknown RESULT_MEMO_STORE {kind!r}; expected memory, postgres or off")
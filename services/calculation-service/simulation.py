@@ -0,0 +1,193 @@
+"""Vectorized PV simulation over many array configurations at one site.
+
+Weather and solar position are shared; every configuration is a row in
+``(configurations, timesteps)`` arrays that pvlib broadcasts through the
+POA, cell-temperature, DC and AC steps in a single pass. Rows are processed
+in blocks of ``BATCH_CHUNK_SIZE`` so memory stays bounded for large batches.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pvlib
+
+BATCH_CHUNK_SIZE = int(os.getenv('BATCH_CHUNK_SIZE', '256'))
+
+DEFAULT_GAMMA_PDC = -0.004 # 1/C, typical crystalline silicon
+DEFAULT_DC_AC_RATIO = 1.2
+DEFAULT_ETA_INV_NOM = 0.96
+DEFAULT_ALBEDO = 0.25
+DEFAULT_TEMPERATURE_MODEL = ('sapm', 'open_rack_glass_glass')
+
+
+def temperature_model_parameters(model=DEFAULT_TEMPERATURE_MODEL):
+    family, mount = model
+    return pvlib.temperature.TEMPERATURE_MODEL_PARAMETERS[family][mount]
+
+
+def step_hours(index):
+    """Hours per timestep, for integrating power into energy."""
+    if len(index) < 2:
+        return 1.0
+    return (index[1:] - index[:-1]).median() / pd.Timedelta(hours=1)
+
+
+def _column(values, dtype=float):
+    """Configurations as a column so they broadcast against timesteps."""
+    return np.asarray(values, dtype=dtype).reshape(-1, 1)
+
+
+def site_arrays(weather, solpos):
+    """Plain float arrays of the per-timestep inputs shared by every configuration.
+
+    Extract these once per site when evaluating many configuration sets
+    (e.g. successive optimizer refinements) and pass them to
+    :func:`simulate_arrays`.
+    """
+    return {
+        "zenith": solpos['apparent_zenith'].to_numpy(dtype=float),
+        "azimuth": solpos['azimuth'].to_numpy(dtype=float),
+        "dni": weather['dni'].to_numpy(dtype=float),
+        "ghi": weather['ghi'].to_numpy(dtype=float),
+        "dhi": weather['dhi'].to_numpy(dtype=float),
+        "temp_air": weather['temp_air'].to_numpy(dtype=float),
+        "wind_speed": weather['wind_speed'].to_numpy(dtype=float),
+        "hours": step_hours(solpos.index),
+    }
+
+
+def simulate_configurations(weather, solpos, surface_tilt, surface_azimuth, pdc0, **kwargs):
+    """Annual results for each configuration row at one site.
+
+    ``surface_tilt``, ``surface_azimuth``, ``pdc0`` (system DC W),
+    ``gamma_pdc`` and ``inverter_pdc0`` (inverter DC input limit W) are
+    scalars or length-M sequences. Returns a dict of length-M arrays.
+    """
+    return simulate_arrays(site_arrays(weather, solpos), surface_tilt, surface_azimuth, pdc0, **kwargs)
+
+
+def simulate_arrays(inputs, surface_tilt, surface_azimuth, pdc0,
+                    gamma_pdc=DEFAULT_GAMMA_PDC, inverter_pdc0=None,
+                    eta_inv_nom=DEFAULT_ETA_INV_NOM, albedo=DEFAULT_ALBEDO,
+                    temperature_params=None, beam_factor=None, sky_view_factor=None,
+                    chunk_size=None):
+    """:func:`simulate_configurations` over precomputed :func:`site_arrays`.
+
+    ``beam_factor`` (per timestep) and ``sky_view_factor`` apply a shading
+    result to every configuration.
+    """
+    chunk_size = chunk_size or BATCH_CHUNK_SIZE
+    params = temperature_params or temperature_model_parameters()
+    hours = inputs['hours']
+
+    count = max(np.size(surface_tilt), np.size(surface_azimuth), np.size(pdc0),
+                np.size(gamma_pdc), np.size(inverter_pdc0) if inverter_pdc0 is not None else 1)
+    tilt = np.broadcast_to(np.asarray(surface_tilt, dtype=float), (count,))
+    surface_az = np.broadcast_to(np.asarray(surface_azimuth, dtype=float), (count,))
+    pdc0 = np.broadcast_to(np.asarray(pdc0, dtype=float), (count,))
+    gamma = np.broadcast_to(np.asarray(gamma_pdc, dtype=float), (count,))
+    if inverter_pdc0 is None:
+        inverter_pdc0 = pdc0 / DEFAULT_DC_AC_RATIO
+    inverter_pdc0 = np.broadcast_to(np.asarray(inverter_pdc0, dtype=float), (count,))
+
+    # POA only depends on orientation, so evaluate each distinct one once
+    orientations, orientation_index = np.unique(np.column_stack((tilt, surface_az)), axis=0, return_inverse=True)
+    orientation_index = orientation_index.reshape(-1)
+
+    annual_kwh = np.empty(count)
+    dc_kwh = np.empty(count)
+    peak_ac_w = np.empty(count)
+    poa_kwh_m2 = np.empty(count)
+
+    for start in range(0, len(orientations), chunk_size):
+        block = orientations[start:start + chunk_size]
+        poa = pvlib.irradiance.get_total_irradiance(
+            _column(block[:, 0]), _column(block[:, 1]), inputs['zenith'], inputs['azimuth'],
+            inputs['dni'], inputs['ghi'], inputs['dhi'], albedo=albedo
+        )
+        if beam_factor is None and sky_view_factor is None:
+            poa_global = np.nan_to_num(poa['poa_global'])
+        else:
+            poa_direct = np.nan_to_num(poa['poa_direct'])
+            poa_sky = np.nan_to_num(poa['poa_sky_diffuse'])
+            if beam_factor is not None:
+                poa_direct = poa_direct * np.asarray(beam_factor, dtype=float)
+            if sky_view_factor is not None:
+                poa_sky = poa_sky * sky_view_factor
+            poa_global = poa_direct + poa_sky + np.nan_to_num(poa['poa_ground_diffuse'])
+        cell_temperature = pvlib.temperature.sapm_cell(
+            poa_global, inputs['temp_air'], inputs['wind_speed'], params['a'], params['b'], params['deltaT']
+        )
+
+        rows = np.flatnonzero((orientation_index >= start) & (orientation_index < start + len(block)))
+        local = orientation_index[rows] - start
+        insolation = poa_global.sum(axis=1) * hours / 1000
+        for row_start in range(0, len(rows), chunk_size):
+            sel = rows[row_start:row_start + chunk_size]
+            idx = local[row_start:row_start + chunk_size]
+            dc = pvlib.pvsystem.pvwatts_dc(
+                poa_global[idx], cell_temperature[idx], _column(pdc0[sel]), _column(gamma[sel])
+            )
+            ac = pvlib.inverter.pvwatts(dc, _column(inverter_pdc0[sel]), eta_inv_nom)
+            ac = np.clip(np.nan_to_num(ac), 0, None)
+            annual_kwh[sel] = ac.sum(axis=1) * hours / 1000
+            dc_kwh[sel] = np.nan_to_num(dc).sum(axis=1) * hours / 1000
+            peak_ac_w[sel] = ac.max(axis=1)
+            poa_kwh_m2[sel] = insolation[idx]
+
+    return {
+        "annual_kwh": annual_kwh,
+        "dc_kwh": dc_kwh,
+        "specific_yield_kwh_kwp": np.divide(annual_kwh, pdc0 / 1000, out=np.zeros(count), where=pdc0 > 0),
+        "peak_ac_w": peak_ac_w,
+        "poa_kwh_m2": poa_kwh_m2,
+    }
+
+
+def _orientation_grid(tilts, azimuths):
+    tilt_grid, azimuth_grid = np.meshgrid(tilts, azimuths, indexing='ij')
+    return tilt_grid.ravel(), azimuth_grid.ravel()
+
+
+def optimize_orientation(inputs, pdc0, tilt_range=(0, 60), azimuth_range=(90, 270),
+                         step=5.0, fine_step=None, **kwargs):
+    """Best fixed tilt/azimuth by energy yield over :func:`site_arrays` inputs.
+
+    The whole ``tilt_range`` x ``azimuth_range`` grid at ``step`` degrees is
+    evaluated in one batched call and returned as the yield surface. With
+    ``fine_step``, the optimum is then refined coarse-to-fine: a 5 x 5 grid
+    around the current best, halving the spacing until it reaches
+    ``fine_step``.
+    """
+    tilts = np.arange(tilt_range[0], tilt_range[1] + step / 2, step)
+    azimuths = np.arange(azimuth_range[0], azimuth_range[1] + step / 2, step)
+    grid_tilt, grid_azimuth = _orientation_grid(tilts, azimuths)
+    surface = simulate_arrays(inputs, grid_tilt, grid_azimuth, pdc0, **kwargs)['annual_kwh']
+    evaluations = len(surface)
+
+    best = int(np.argmax(surface))
+    best_tilt, best_azimuth, best_kwh = grid_tilt[best], grid_azimuth[best], surface[best]
+
+    spacing = step
+    while fine_step and spacing > fine_step:
+        spacing = max(spacing / 2, fine_step)
+        offsets = np.arange(-2, 3) * spacing
+        candidate_tilt, candidate_azimuth = _orientation_grid(
+            np.clip(best_tilt + offsets, tilt_range[0], tilt_range[1]),
+            np.clip(best_azimuth + offsets, azimuth_range[0], azimuth_range[1])
+        )
+        energy = simulate_arrays(inputs, candidate_tilt, candidate_azimuth, pdc0, **kwargs)['annual_kwh']
+        evaluations += len(energy)
+        i = int(np.argmax(energy))
+        if energy[i] > best_kwh:
+            best_tilt, best_azimuth, best_kwh = candidate_tilt[i], candidate_azimuth[i], energy[i]
+
+    return {
+        "tilt": float(best_tilt),
+        "azimuth": float(best_azimuth % 360),
+        "annual_kwh": float(best_kwh),
+        "tilts": tilts,
+        "azimuths": azimuths % 360,
+        "surface": surface.reshape(len(tilts), len(azimuths)),
+        "evaluations": evaluations,
+    }
@@ -0,0 +1,137 @@
+"""Solar-position cache keyed by snapped location and year.
+
+Solar position over a year of timestamps is the most expensive vectorized step
+in the simulation, yet most projects cluster around a few metros. Positions
+are computed at the centre of a ``SOLPOS_GRID_DEG`` grid cell and kept in an
+in-process LRU; when ``SOLPOS_CACHE_DIR`` is set, they are also shared between
+workers as ``.npz`` files on disk.
+"""
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pvlib
+
+# 0.01 degrees is roughly 1 km, well below the resolution that matters for sun angles
+SOLPOS_GRID_DEG = float(os.getenv('SOLPOS_GRID_DEG', '0.01'))
+SOLPOS_CACHE_SIZE = int(os.getenv('SOLPOS_CACHE_SIZE', '128'))
+SOLPOS_CACHE_DIR = os.getenv('SOLPOS_CACHE_DIR')
+
+SOLPOS_COLUMNS = ('apparent_zenith', 'zenith', 'apparent_elevation', 'elevation', 'azimuth')
+
+
+def snap(value, grid_deg=None):
+    """Snap a coordinate to the centre of its grid cell."""
+    grid_deg = grid_deg or SOLPOS_GRID_DEG
+    return round((np.floor(value / grid_deg) + 0.5) * grid_deg, 6)
+
+
+class SolarPositionCache:
+    """Thread-safe LRU of solar-position frames with an optional disk tier."""
+
+    def __init__(self, maxsize=SOLPOS_CACHE_SIZE, cache_dir=SOLPOS_CACHE_DIR, grid_deg=SOLPOS_GRID_DEG):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.grid_deg = grid_deg
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, times, latitude, longitude):
+        """Snapped location, year, timezone and resolution of ``times``."""
+        return (
+            snap(latitude, self.grid_deg), snap(longitude, self.grid_deg),
+            times[0].year, str(times.tz), len(times), times.freqstr,
+        )
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'solpos_{digest}.npz')
+
+    def _load_from_disk(self, key, times):
+        path = self._disk_path(key)
+        try:
+            with np.load(path) as stored:
+                return pd.DataFrame({name: stored[name] for name in SOLPOS_COLUMNS}, index=times)
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def _save_to_disk(self, key, solpos):
+        path = self._disk_path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **{name: solpos[name].to_numpy() for name in SOLPOS_COLUMNS})
+            # Atomic rename so other workers never read a partial file
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _remember(self, key, solpos):
+        with self._lock:
+            self._entries[key] = solpos
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get(self, times, latitude, longitude):
+        """Solar position for ``times`` at the snapped site.
+
+        The returned frame is shared between requests and must not be mutated.
+        """
+        key = self.key(times, latitude, longitude)
+        with self._lock:
+            solpos = self._entries.get(key)
+            if solpos is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return solpos
+
+        if self.cache_dir:
+            solpos = self._load_from_disk(key, times)
+            if solpos is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                self._remember(key, solpos)
+                return solpos
+
+        with self._lock:
+            self.misses += 1
+        solpos = pvlib.solarposition.get_solarposition(times, key[0], key[1])[list(SOLPOS_COLUMNS)]
+        self._remember(key, solpos)
+        if self.cache_dir:
+            self._save_to_disk(key, solpos)
+        return solpos
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "maxsize": self.maxsize,
+                "grid_deg": self.grid_deg,
+                "disk_tier": bool(self.cache_dir),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.disk_hits) / lookups, 4) if lookups else None,
+            }
+
+
+solar_position_cache = SolarPositionCache()
+
+def get_solar_position(times, latitude, longitude):
+    return solar_position_cache.get(times, latitude, longitude)
@@ -0,0 +1,84 @@
+import os
+import hashlib
+import tempfile
+import unittest
+
+import laspy
+import numpy as np
+
+from benchmarks.run import compare_to_baseline, run_size, STAGES
+from benchmarks.synthetic_lidar import NOISE, parse_size, write_tile
+from benchmarks.weather_fixture import fixture_columns
+
+TOLERANCE = {"seconds": 0.5, "min_seconds": 0.05, "peak_rss_mb": 0.25, "min_peak_rss_mb": 32}
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+class TestSyntheticLidar(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size('1M'), 1_000_000)
+        self.assertEqual(parse_size('2.5m'), 2_500_000)
+        self.assertEqual(parse_size('500k'), 500_000)
+        self.assertEqual(parse_size('2500'), 2500)
+
+    def test_tiles_are_deterministic_across_chunking(self):
+        a = write_tile(os.path.join(self.tmp.name, 'a.las'), 25_000, seed=7, chunk_points=10_000)
+        b = write_tile(os.path.join(self.tmp.name, 'b.las'), 25_000, seed=7, chunk_points=10_000)
+        c = write_tile(os.path.join(self.tmp.name, 'c.las'), 25_000, seed=8, chunk_points=10_000)
+        self.assertEqual(file_digest(a), file_digest(b))
+        self.assertNotEqual(file_digest(a), file_digest(c))
+
+    def test_tile_has_terrain_features_and_noise(self):
+        path = write_tile(os.path.join(self.tmp.name, 'tile.las'), 20_000, seed=1)
+        las = laspy.read(path)
+        self.assertEqual(len(las.points), 20_000)
+        classes = set(np.unique(las.classification).tolist())
+        self.assertTrue({2, 5, 6, NOISE} <= classes)
+
+class TestWeatherFixture(unittest.TestCase):
+
+    def test_fixture_is_pinned(self):
+        first, second = fixture_columns(), fixture_columns()
+        for name, values in first.items():
+            self.assertEqual(values.shape, (8760,))
+            np.testing.assert_array_equal(values, second[name])
+        self.assertTrue(1200 < first['ghi'].sum() / 1000 < 2200)
+
+class TestRegressionCheck(unittest.TestCase):
+
+    def report(self, seconds, peak):
+        return {"points": 1000, "stages": {"parse": {"seconds": seconds, "peak_rss_mb": peak}}}
+
+    def test_within_tolerance_passes(self):
+        baseline = {"stages": {"parse": {"seconds": 1.0, "peak_rss_mb": 100.0}}}
+        self.assertEqual(compare_to_baseline(self.report(1.5, 150.0), baseline, TOLERANCE), [])
+
+    def test_slower_or_hungrier_stage_fails(self):
+        baseline = {"stages": {"parse": {"seconds": 1.0, "peak_rss_mb": 100.0}}}
+        problems = compare_to_baseline(self.report(1.6, 160.0), baseline, TOLERANCE)
+        self.assertEqual(len(problems), 2)
+        self.assertIn('parse', problems[0])
+
+    def test_stages_without_baseline_are_skipped(self):
+        self.assertEqual(compare_to_baseline(self.report(9.0, 900.0), {"stages": {}}, TOLERANCE), [])
+
+class TestRunSize(unittest.TestCase):
+
+    def test_small_tile_runs_every_stage_for_real(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            report = run_size(20_000, data_dir=data_dir)
+        self.assertEqual(tuple(report['stages']), STAGES)
+        self.assertGreater(report['annual_kwh'], 0)
+        self.assertGreater(report['tiles'], 0)
+        self.assertEqual(report['persist_mode'], 'recording-cursor')
+        self.assertGreater(report['stages']['parse']['throughput'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
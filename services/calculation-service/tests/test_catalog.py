@@ -0,0 +1,93 @@
+import time
+import unittest
+
+from catalog import (Catalog, CatalogError, CATALOG_DEFAULT_MODULE, modules_per_string, normalize_name,
+                     system_summary)
+
+class TestNormalize(unittest.TestCase):
+
+    def test_sam_and_display_names_share_a_key(self):
+        self.assertEqual(normalize_name('Canadian_Solar_Inc__CS5P_220M'), 'canadiansolarinccs5p220m')
+        self.assertEqual(normalize_name('Canadian Solar Inc. CS5P-220M'), 'canadiansolarinccs5p220m')
+
+class TestCatalog(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.catalog = Catalog.load()
+
+    def test_exact_and_legacy_names(self):
+        modules = self.catalog.modules
+        row = modules.lookup('Canadian_Solar_Inc__CS5P_220M')
+        self.assertEqual(modules.names[row], 'Canadian Solar Inc. CS5P-220M')
+        self.assertEqual(modules.lookup('canadian solar inc cs5p 220m'), row)
+
+    def test_fuzzy_model_number(self):
+        modules = self.catalog.modules
+        row = modules.lookup('CS5P-220M')
+        self.assertIn('CS5P-220M', modules.names[row])
+        self.assertIsNone(modules.lookup('zzzz qqqq'))
+
+    def test_manufacturer_prefix(self):
+        modules = self.catalog.modules
+        rows = modules.prefix_rows('Canadian Solar')
+        self.assertGreater(len(rows), 10)
+        self.assertTrue(all(modules.names[r].startswith('Canadian Solar') for r in rows))
+
+    def test_search_by_power_and_type(self):
+        results = self.catalog.search('modules', manufacturer='Canadian Solar', power=300, technology='mono')
+        self.assertTrue(results)
+        self.assertAlmostEqual(results[0]['rating_w'], 300, delta=10)
+        self.assertTrue(all(r['technology'] == 'Mono-c-Si' for r in results))
+        with self.assertRaises(CatalogError):
+            self.catalog.search('modules', technology='graphene')
+
+    def test_resolve_default_system(self):
+        system = self.catalog.resolve({"count": 20})
+        self.assertEqual(system['module']['name'], CATALOG_DEFAULT_MODULE)
+        self.assertEqual(system['modules'], 20)
+        self.assertAlmostEqual(system['pdc0'], 20 * system['module']['stc_w'])
+        # The inverters cover the array at about the default DC/AC ratio
+        self.assertGreaterEqual(system['inverter']['paco_w'] * system['inverters'], system['pdc0'] / 1.2 - 1e-6)
+        self.assertLessEqual(system['modules_per_string'], 20)
+        self.assertEqual(set(system['module']['params']),
+                         {'alpha_sc', 'a_ref', 'I_L_ref', 'I_o_ref', 'R_sh_ref', 'R_s', 'Adjust'})
+
+    def test_resolve_by_manufacturer_and_power(self):
+        system = self.catalog.resolve({"manufacturer": "Canadian Solar", "power": 300, "count": 10})
+        self.assertTrue(system['module']['name'].startswith('Canadian Solar'))
+        self.assertAlmostEqual(system['module']['stc_w'], 300, delta=10)
+
+    def test_resolve_named_inverter(self):
+        system = self.catalog.resolve({"count": 30, "inverter": "SMA America: SB5000US", "inverter_count": 2})
+        self.assertIn('SB5000US', system['inverter']['name'])
+        self.assertEqual(system['inverters'], 2)
+        self.assertEqual(system_summary(system)['inverters'], 2)
+
+    def test_resolve_rejects_bad_specs(self):
+        for specs in ("panel", {"module": "zzzz qqqq"}, {"count": 0}, {"count": "many"}, {"type": "graphene"}):
+            with self.assertRaises(CatalogError, msg=specs):
+                self.catalog.resolve(specs)
+
+    def test_modules_per_string_respects_voltage_limits(self):
+        module = {'V_mp_ref': 40.0, 'V_oc_ref': 48.0}
+        inverter = {'Vdco': 400.0, 'Vdcmax': 480.0}
+        self.assertEqual(modules_per_string(module, inverter, 20), 10)
+        self.assertEqual(modules_per_string(module, inverter, 4), 4)
+        self.assertEqual(modules_per_string(module, dict(inverter, Vdcmax=300.0), 20), 6)
+
+    def test_repeated_resolve_is_cached(self):
+        catalog = Catalog(self.catalog.modules, self.catalog.inverters)
+        specs = {"manufacturer": "SunPower", "power": 330, "count": 24}
+        first = catalog.resolve(specs)
+        started = time.perf_counter()
+        for _ in range(1000):
+            again = catalog.resolve(dict(specs))
+        per_call = (time.perf_counter() - started) / 1000
+        self.assertIs(again, first)
+        self.assertEqual(catalog.stats()['misses'], 1)
+        self.assertEqual(catalog.stats()['hits'], 1000)
+        self.assertLess(per_call, 1e-3)
+
+if __name__ == '__main__':
+    unittest.main()
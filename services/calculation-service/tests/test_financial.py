@@ -0,0 +1,88 @@
+import time
+import unittest
+
+import numpy as np
+
+from financial import (FinancialError, analyze, cash_flows, evaluate, irr, npv, parse_financial, payback_years,
+                       FINANCE_SCENARIOS)
+
+
+class TestParseFinancial(unittest.TestCase):
+
+    def test_defaults(self):
+        inputs = parse_financial(None)
+        self.assertIsNone(inputs['cost_usd'])
+        self.assertEqual(inputs['years'], 25)
+        self.assertEqual(inputs['scenarios'], FINANCE_SCENARIOS)
+        self.assertEqual(parse_financial({"uncertainty": {"om": 0.1}})['uncertainty']['om'], 0.1)
+
+    def test_rejects_bad_inputs(self):
+        for config in ("cheap", {"discount_rate": "high"}, {"years": 0}, {"years": 80}, {"degradation": -0.1},
+                       {"scenarios": 10**9}, {"uncertainty": {"weather": 0.1}}, {"cost_usd": float('nan')}):
+            with self.assertRaises(FinancialError, msg=config):
+                parse_financial(config)
+
+
+class TestCashFlows(unittest.TestCase):
+
+    def test_cash_flows_degrade_and_escalate(self):
+        energy, flows, om = cash_flows(1000.0, 5000.0, 0.1, 0.02, 0.01, 10.0, 0.0, 3)
+        np.testing.assert_allclose(energy[0], [1000, 990, 980.1])
+        np.testing.assert_allclose(flows[0], [-5000, 90, 990 * 0.102 - 10, 980.1 * 0.1 * 1.02 ** 2 - 10])
+        np.testing.assert_allclose(om[0], [10, 10, 10])
+
+    def test_irr_zeroes_npv(self):
+        flows = np.array([[-1000.0] + [150.0] * 10, [-1000.0] + [50.0] * 10, [-1000.0] + [100.0] * 10])
+        rates = irr(flows)
+        np.testing.assert_allclose(npv(flows[:2], rates[:2]), 0, atol=1e-6)
+        self.assertAlmostEqual(rates[0], 0.0814, places=4)
+        self.assertLess(rates[1], 0)
+        self.assertAlmostEqual(rates[2], 0.0, places=9)
+        self.assertTrue(np.isnan(irr(np.array([[-1000.0] + [0.0] * 10]))[0]))
+
+    def test_payback_interpolates_within_the_year(self):
+        flows = np.array([[-250.0, 100, 100, 100, 100], [-500.0, 100, 100, 100, 100], [0.0, 1, 1, 1, 1]])
+        np.testing.assert_allclose(payback_years(flows), [2.5, np.inf, 0.0])
+
+    def test_lcoe_without_om_or_discounting(self):
+        result = evaluate(1000.0, 10000.0, 0.1, 0.0, 0.0, 0.0, 0.0, 0.0, 20)
+        self.assertAlmostEqual(result['lcoe'][0], 0.5)
+        self.assertAlmostEqual(result['npv'][0], -8000.0)
+        self.assertAlmostEqual(result['roi'][0], -0.8)
+
+
+class TestAnalyze(unittest.TestCase):
+
+    def test_base_case_and_percentiles(self):
+        result = analyze(150000.0, 100.0, parse_financial({"cost_per_w": 1.5}))
+        self.assertEqual(result['cost'], 150000.0)
+        self.assertGreater(result['npv'], 0)
+        self.assertAlmostEqual(result['npv'], float(npv(np.array([result['cash_flows']]), 0.06)[0]), places=1)
+        spread = result['monte_carlo']
+        for metric in ('npv', 'irr', 'lcoe', 'payback_years'):
+            self.assertLessEqual(spread[metric]['p10'], spread[metric]['p50'])
+            self.assertLessEqual(spread[metric]['p50'], spread[metric]['p90'])
+        # The spread is centred on the base case
+        self.assertAlmostEqual(spread['irr']['p50'], result['irr'], delta=0.005)
+        self.assertEqual(result['npv_p50'], spread['npv']['p50'])
+
+    def test_seeded_runs_repeat(self):
+        inputs = parse_financial({"scenarios": 1000, "seed": 7})
+        self.assertEqual(analyze(1e5, 60.0, inputs)['npv_p10'], analyze(1e5, 60.0, inputs)['npv_p10'])
+
+    def test_unprofitable_project_has_no_payback(self):
+        result = analyze(1000.0, 100.0, parse_financial({"scenarios": 500}))
+        self.assertIsNone(result['payback_years'])
+        self.assertIsNone(result['irr'])
+        self.assertIsNone(result['monte_carlo']['payback_years']['p50'])
+        self.assertEqual(result['monte_carlo']['probability_positive_npv'], 0.0)
+
+    def test_ten_thousand_scenarios_run_well_under_a_second(self):
+        inputs = parse_financial({"scenarios": 10000})
+        started = time.perf_counter()
+        analyze(150000.0, 100.0, inputs)
+        self.assertLess(time.perf_counter() - started, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
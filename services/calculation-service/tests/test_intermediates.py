@@ -0,0 +1,109 @@
+import json
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from intermediates import Intermediates, load_intermediates, plan, save_intermediates
+from layout import Terrain
+from shading import ShadingResult
+from weather_store import SiteWeather, WEATHER_COLUMNS
+
+STATION = {"id": "724666", "name": "Golden", "lat": 39.7, "lon": -105.2, "utc_offset": -7}
+LIDAR = {"mins": [0.0, 0.0, 0.0], "maxs": [100.0, 100.0, 20.0], "center": [50.0, 50.0],
+         "header_mins": [-10.0, -10.0, 0.0], "header_maxs": [110.0, 110.0, 25.0], "point_count": 1000}
+
+
+def site_weather():
+    rng = np.random.default_rng(0)
+    columns = {name: rng.uniform(0, 900, 8760) for name in WEATHER_COLUMNS}
+    return SiteWeather(STATION, 3.2, columns, 2001)
+
+
+def solar_position(times):
+    zenith = np.linspace(10, 170, len(times))
+    return pd.DataFrame({"apparent_zenith": zenith, "apparent_elevation": 90 - zenith,
+                         "azimuth": np.linspace(0, 360, len(times))}, index=times)
+
+
+def request(**mount):
+    return {"location": {"lat": 39.7, "lon": -105.2}, "panel_specs": {"count": 10},
+            "ground_mount_config": mount, "resolution": {"minutes": 60, "profile_minutes": None},
+            "financial": None}
+
+
+def collect(mount=None, shading=None, terrain=None, poa=True):
+    weather = site_weather()
+    hourly = {name: np.full(8760, value, dtype=np.float32) for name, value in
+              (("direct", 500.0), ("sky", 80.0), ("ground", 5.0))} if poa else None
+    return Intermediates.collect(request(**(mount or {"tilt": 30, "azimuth": 180})), LIDAR, weather,
+                                 solar_position(weather.times), shading, terrain, hourly)
+
+
+class TestIntermediates(unittest.TestCase):
+
+    def round_trip(self, interm):
+        cur = mock.Mock()
+        save_intermediates(cur, 'p1', interm)
+        _, (project_id, inputs, blob) = cur.execute.call_args.args
+        self.assertEqual(project_id, 'p1')
+        cur.fetchone.return_value = (json.loads(inputs), memoryview(blob))
+        return load_intermediates(cur, 'p1')
+
+    def test_round_trip_restores_weather_and_solar_position(self):
+        weather = site_weather()
+        stored = self.round_trip(collect())
+        restored = stored.weather()
+        np.testing.assert_array_equal(restored.times, weather.times)
+        np.testing.assert_allclose(restored['ghi'], weather['ghi'], rtol=1e-6)
+        self.assertEqual(restored.station, STATION)
+        solpos = stored.solar_position(restored.times)
+        np.testing.assert_allclose(solpos['apparent_zenith'], solar_position(weather.times)['apparent_zenith'],
+                                   rtol=1e-6)
+        np.testing.assert_allclose(solpos['apparent_elevation'], 90 - solpos['apparent_zenith'])
+        self.assertEqual(stored.request['panel_specs'], {"count": 10})
+        # The header extent the grids were laid out from, for replaying the stored cloud
+        self.assertEqual(stored.inputs['lidar']['header_mins'], [-10.0, -10.0, 0.0])
+
+    def test_shading_terrain_and_poa_round_trip(self):
+        horizons = np.full((3, 36), 5.0)
+        shading = ShadingResult(np.arange(0, 360, 10.0), horizons, np.full(8760, 0.9), 0.98, 0.5, [0, 2])
+        terrain = Terrain(np.arange(16, dtype=np.float32).reshape(4, 4), 2.0)
+        stored = self.round_trip(collect(shading=shading, terrain=terrain))
+
+        reusable, restored = stored.shading_for({"tilt": 30, "azimuth": 180})
+        self.assertTrue(reusable)
+        np.testing.assert_allclose(restored.beam_factor, 0.9, rtol=1e-6)
+        np.testing.assert_array_equal(restored.horizons, horizons)
+        self.assertEqual(restored.levels, [0, 2])
+        np.testing.assert_array_equal(stored.terrain().elevation, terrain.elevation)
+        self.assertEqual(stored.poa_for({"tilt": 30, "azimuth": 180}, 60)['sky'][0], 80.0)
+
+    def test_missing_or_stale_row_is_none(self):
+        cur = mock.Mock()
+        cur.fetchone.return_value = None
+        self.assertIsNone(load_intermediates(cur, 'p1'))
+        cur.fetchone.return_value = ({"version": 0}, b'')
+        self.assertIsNone(load_intermediates(cur, 'p1'))
+
+    def test_plan_recomputes_only_what_changed(self):
+        stored = collect()
+        self.assertEqual(plan(stored, {"tilt": 30, "azimuth": 180}, 60), [])
+        # A new orientation or a sub-hourly step needs new POA, nothing upstream
+        self.assertEqual(plan(stored, {"tilt": 20, "azimuth": 180}, 60), ['irradiance'])
+        self.assertEqual(plan(stored, {"tilt": 30, "azimuth": 180}, 15), ['irradiance'])
+        # The observer height changes the horizon profiles
+        self.assertEqual(plan(stored, {"tilt": 30, "azimuth": 180, "array_height_m": 4}, 60), ['shading'])
+        # A first row layout needs the ground under it
+        self.assertEqual(plan(stored, {"tilt": 30, "azimuth": 180, "gcr": 0.4}, 60), ['terrain'])
+        self.assertEqual(plan(collect(poa=False), {"tilt": 30, "azimuth": 180}, 60), ['irradiance'])
+
+    def test_no_surface_model_is_reused_as_none(self):
+        reusable, shading = collect().shading_for({"tilt": 30, "azimuth": 180})
+        self.assertTrue(reusable)
+        self.assertIsNone(shading)
+
+
+if __name__ == '__main__':
+    unittest.main()
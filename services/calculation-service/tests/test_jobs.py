@@ -0,0 +1,77 @@
+import unittest
+import threading
+from unittest import mock
+
+from jobs import Job, JobManager
+
+class TestJob(unittest.TestCase):
+
+    def test_stage_progress_and_timing(self):
+        job = Job('p1', stages=('a', 'b'))
+        with job.stage('a'):
+            self.assertEqual(job.to_dict()['stages']['a']['state'], 'running')
+        status = job.to_dict()
+        self.assertEqual(status['stages']['a']['state'], 'done')
+        self.assertIsNotNone(status['stages']['a']['seconds'])
+        self.assertEqual(status['progress'], 0.5)
+
+    def test_reentered_stage_accumulates_time(self):
+        job = Job('p1', stages=('a',))
+        with mock.patch('jobs.time.perf_counter', side_effect=[0.0, 1.5, 10.0, 10.25]):
+            for _ in range(2):
+                with job.stage('a'):
+                    pass
+        self.assertEqual(job.timings(), {'a': 1.75})
+        self.assertEqual(job.to_dict()['stages']['a']['state'], 'done')
+
+    def test_failed_stage(self):
+        job = Job('p1', stages=('a',))
+        with self.assertRaises(RuntimeError):
+            with job.stage('a'):
+                raise RuntimeError('boom')
+        self.assertEqual(job.to_dict()['stages']['a']['state'], 'failed')
+
+class TestJobManager(unittest.TestCase):
+
+    def test_submit_runs_in_pool_and_releases_slot(self):
+        manager = JobManager(workers=1, queue_size=0)
+        self.assertTrue(manager.reserve())
+        # Saturated: the single slot is held until the job finishes
+        self.assertFalse(manager.reserve())
+
+        done = threading.Event()
+        def work(job, value):
+            with job.stage('lidar'):
+                pass
+            done.set()
+            return {'value': value}
+
+        job = manager.submit('p1', work, 42)
+        self.assertTrue(done.wait(5))
+        manager._executor.shutdown(wait=True)
+        self.assertEqual(manager.get('p1').to_dict()['result'], {'value': 42})
+        self.assertEqual(job.status, 'completed')
+        self.assertTrue(manager.reserve())
+
+    def test_failed_job_records_error(self):
+        manager = JobManager(workers=1, queue_size=1)
+        manager.reserve()
+        def work(job):
+            raise ValueError('bad input')
+        job = manager.submit('p2', work)
+        manager._executor.shutdown(wait=True)
+        self.assertEqual(job.status, 'error')
+        self.assertEqual(job.error, 'bad input')
+
+    def test_finished_jobs_are_pruned(self):
+        manager = JobManager(workers=1, queue_size=1, retention=-1)
+        manager.reserve()
+        manager.submit('p3', lambda job: None)
+        manager._executor.shutdown(wait=True)
+        manager._executor = type(manager._executor)(max_workers=1)
+        manager.reserve()
+        manager.submit('p4', lambda job: None)
+        self.assertIsNone(manager.get('p3'))
+
+if __name__ == '__main__':
+    unittest.main()
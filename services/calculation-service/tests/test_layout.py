@@ -0,0 +1,187 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pvlib
+
+from layout import (LayoutError, Terrain, TerrainModelBuilder, evaluate_layouts, load_terrain, parse_layout,
+                    place_rows, GROUND_CLASS)
+from point_cloud_store import encode_tile
+from simulation import site_arrays, simulate_arrays
+
+
+def clear_sky_inputs(latitude=39.7, longitude=-105.2):
+    times = pd.date_range('2024-01-01', periods=8760, freq='h', tz='Etc/GMT+7')
+    site = pvlib.location.Location(latitude, longitude)
+    weather = site.get_clearsky(times).assign(temp_air=20.0, wind_speed=1.0)
+    return site_arrays(weather, site.get_solarposition(times))
+
+
+def north_rising_terrain(rise_per_m, size_m=200, cell_m=2.0):
+    cells = int(size_m // cell_m) + 1
+    north = (np.arange(cells) - (cells - 1) / 2) * cell_m
+    return Terrain(np.tile((north * rise_per_m)[:, None], (1, cells)).astype(np.float32), cell_m)
+
+
+class TestParseLayout(unittest.TestCase):
+
+    def test_no_spacing_means_no_layout(self):
+        self.assertIsNone(parse_layout({"tilt": 30}))
+        self.assertIsNone(parse_layout(None))
+
+    def test_gcr_and_pitch(self):
+        layout = parse_layout({"gcr": 0.4, "row_width_m": 4})
+        self.assertAlmostEqual(layout['pitch_m'], 10.0)
+        layout = parse_layout({"pitch_m": 8}, defaults={"row_width_m": 4, "site_m": [80, 120]})
+        self.assertAlmostEqual(layout['gcr'], 0.5)
+        self.assertEqual(layout['site_m'], (80.0, 120.0))
+
+    def test_rejects_bad_layouts(self):
+        for config in ({"gcr": 0}, {"gcr": 1.5}, {"pitch_m": 2, "row_width_m": 4}, {"gcr": 0.4, "tilt": 95},
+                       {"gcr": "dense"}, {"gcr": 0.4, "site_m": 1e6}, {"gcr": 0.4, "setback_m": -1}, "rows"):
+            with self.assertRaises(LayoutError, msg=config):
+                parse_layout(config)
+
+
+class TestPlaceRows(unittest.TestCase):
+
+    def test_rows_fit_inside_the_setback(self):
+        rows = place_rows(parse_layout({"gcr": 0.4, "row_width_m": 4, "site_m": 100, "setback_m": 5, "tilt": 0}))
+        # 90 m of depth, 4 m rows every 10 m
+        self.assertEqual(rows.rows, 9)
+        self.assertEqual(rows.row_length_m, 90)
+        self.assertEqual(rows.modules(2.0), 9 * 90 * 4 // 2)
+        with self.assertRaises(LayoutError):
+            place_rows(parse_layout({"gcr": 0.4, "site_m": 10, "setback_m": 5}))
+
+    def test_rows_follow_the_terrain(self):
+        rows = place_rows(parse_layout({"gcr": 0.5, "site_m": 100}), north_rising_terrain(0.1))
+        # South-facing rows: each back row stands one pitch further north
+        np.testing.assert_allclose(np.diff(rows.base_m), 0.8, atol=0.25)
+        np.testing.assert_allclose(rows.cross_slope, np.degrees(np.arctan(0.1)), atol=1.5)
+        np.testing.assert_allclose(rows.axis_tilt, 0, atol=1e-6)
+
+    def test_along_row_slope_becomes_axis_tilt(self):
+        cells = 101
+        east = (np.arange(cells) - 50) * 2.0
+        terrain = Terrain(np.tile(east * 0.05, (cells, 1)).astype(np.float32), 2.0)
+        rows = place_rows(parse_layout({"gcr": 0.4, "site_m": 100}), terrain)
+        # South-facing rows have axis_azimuth 90 (east); ground rising that way tilts the axis negative
+        np.testing.assert_allclose(rows.axis_tilt, -np.degrees(np.arctan(0.05)), atol=0.1)
+
+
+class TestRowShading(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.inputs = clear_sky_inputs()
+
+    def test_night_and_single_row_are_unshaded(self):
+        rows = place_rows(parse_layout({"gcr": 0.6}))
+        self.assertEqual(rows.beam_factor_at(np.array([180.0]), np.array([-5.0]))[0], 1.0)
+        self.assertLess(rows.beam_factor_at(np.array([180.0]), np.array([10.0]))[0], 1.0)
+        single = place_rows(parse_layout({"gcr": 0.6, "site_m": 20, "setback_m": 5}))
+        self.assertEqual(single.rows, 1)
+        self.assertEqual(single.beam_factor_at(np.array([180.0]), np.array([10.0]))[0], 1.0)
+        self.assertEqual(single.sky_factor, 1.0)
+
+    def test_matches_pvlib_for_a_flat_pair(self):
+        rows = place_rows(parse_layout({"gcr": 0.5, "tilt": 25}))
+        azimuth, elevation = np.array([150.0, 200.0]), np.array([15.0, 25.0])
+        expected = pvlib.shading.shaded_fraction1d(90 - elevation, azimuth, 90.0, 25.0,
+                                                   collector_width=4.0, pitch=8.0)
+        np.testing.assert_allclose(rows.shaded_fraction(azimuth, elevation), expected, rtol=1e-5)
+        np.testing.assert_allclose(rows.beam_factor_at(azimuth, elevation),
+                                   1 - expected * (rows.rows - 1) / rows.rows, rtol=1e-5)
+
+    def test_denser_rows_shade_more_and_upslope_rows_less(self):
+        layouts = [place_rows(parse_layout({"gcr": gcr})) for gcr in (0.3, 0.5, 0.7)]
+        result = evaluate_layouts(self.inputs, layouts, 200)
+        self.assertTrue(np.all(np.diff(result['row_shading_loss_pct']) > 0))
+        self.assertTrue(np.all(np.diff(result['annual_kwh']) > 0))
+        self.assertTrue(np.all(np.diff(result['specific_yield_kwh_kwp']) < 0))
+
+        flat = place_rows(parse_layout({"gcr": 0.6}))
+        upslope = place_rows(parse_layout({"gcr": 0.6}), north_rising_terrain(0.1))
+        downslope = place_rows(parse_layout({"gcr": 0.6}), north_rising_terrain(-0.1))
+        loss = evaluate_layouts(self.inputs, [upslope, flat, downslope], 200)['row_shading_loss_pct']
+        self.assertTrue(loss[0] < loss[1] < loss[2])
+
+    def test_unshaded_layout_matches_batch_simulation(self):
+        rows = place_rows(parse_layout({"gcr": 0.05, "tilt": 30, "site_m": 20, "setback_m": 5}))
+        result = evaluate_layouts(self.inputs, [rows], 200)
+        pdc0 = rows.collector_area_m2 * 200
+        expected = simulate_arrays(self.inputs, 30, 180, pdc0)
+        self.assertAlmostEqual(result['annual_kwh'][0], expected['annual_kwh'][0], delta=1e-6 * expected['annual_kwh'][0])
+
+    def test_candidates_are_evaluated_together(self):
+        layouts = [place_rows(parse_layout({"gcr": gcr, "tilt": tilt}))
+                   for gcr in np.linspace(0.2, 0.8, 8) for tilt in (15, 25, 35)]
+        result = evaluate_layouts(self.inputs, layouts, 200)
+        self.assertEqual(result['annual_kwh'].shape, (24,))
+        self.assertTrue(np.isfinite(result['kwh_per_site_m2']).all())
+
+
+class TestTerrainModelBuilder(unittest.TestCase):
+
+    def header(self, size=100.0):
+        return SimpleNamespace(mins=[0.0, 0.0, 0.0], maxs=[size, size, 50.0])
+
+    def test_ground_returns_win_over_canopy(self):
+        builder = TerrainModelBuilder(cell_m=2.0, size_m=40, units='m')
+        builder.start(self.header())
+        x = np.array([50.0, 50.0, 50.0, 60.0])
+        y = np.array([50.0, 50.0, 50.0, 60.0])
+        z = np.array([12.0, 20.0, 11.0, 30.0])
+        classes = np.array([GROUND_CLASS, 5, 7, 5], dtype=np.uint8)
+        builder(SimpleNamespace(classification=classes), x, y, z)
+        terrain = builder.build()
+        self.assertAlmostEqual(float(terrain.sample(0.0, 0.0)), 12.0)
+        # No ground under the tree: its lowest non-noise return stands in
+        self.assertAlmostEqual(float(terrain.sample(10.0, 10.0)), 30.0)
+
+    def test_unclassified_and_split_merge(self):
+        builder = TerrainModelBuilder(cell_m=2.0, size_m=40, units='m')
+        builder.start(self.header())
+        part = builder.split()
+        part(SimpleNamespace(), np.array([50.0]), np.array([50.0]), np.array([3.0]))
+        builder(SimpleNamespace(), np.array([50.0]), np.array([50.0]), np.array([4.0]))
+        builder.merge(part)
+        self.assertAlmostEqual(float(builder.build().sample(0.0, 0.0)), 3.0)
+
+    def test_empty_cloud_has_no_terrain(self):
+        builder = TerrainModelBuilder(units='m')
+        self.assertIsNone(builder.build())
+        builder.start(self.header())
+        self.assertIsNone(builder.build())
+
+
+class TestLoadTerrain(unittest.TestCase):
+
+    def test_tiles_stream_through_the_builder_once(self):
+        cur = mock.Mock()
+        # Tile envelopes, then the cloud's quantization
+        cur.fetchone.side_effect = [(0.0, 0.0, 10.0, 100.0, 100.0, 30.0), ([0.01, 0.01, 0.01], [0.0, 0.0, 0.0], [2.0])]
+        q = np.array([5000, 6000], dtype=np.int32)
+        tiles_cur = mock.MagicMock()
+        tiles_cur.__iter__.return_value = iter([
+            (2, encode_tile(q, q, np.array([1200, 3000], dtype=np.int32), np.array([GROUND_CLASS, 5], dtype=np.uint8))),
+        ])
+
+        terrain = load_terrain(cur, 'project-1', units='m', tiles_cur=tiles_cur)
+
+        self.assertAlmostEqual(float(terrain.sample(0.0, 0.0)), 12.0)
+        self.assertIn('ST_Extent', cur.execute.call_args_list[0].args[0])
+        tiles_cur.execute.assert_called_once()
+
+    def test_no_stored_tiles(self):
+        cur = mock.Mock()
+        cur.fetchone.return_value = (None,) * 6
+        tiles_cur = mock.MagicMock()
+        self.assertIsNone(load_terrain(cur, 'project-1', tiles_cur=tiles_cur))
+        tiles_cur.execute.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
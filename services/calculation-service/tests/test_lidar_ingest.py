@@ -0,0 +1,180 @@
+import unittest
+import io
+import os
+import base64
+import hashlib
+import tempfile
+from unittest import mock
+
+import numpy as np
+
+import lidar_ingest
+from benchmarks.synthetic_lidar import write_tile
+from lidar_ingest import ingest_lidar, spool_base64, spool_stream, chunk_points_for_budget, LidarIngestError
+from point_cloud_store import TileWriter, replay_point_cloud
+from shading import SurfaceModelBuilder
+
+def make_reader(chunks, point_size=34):
+    reader = mock.MagicMock()
+    reader.__enter__.return_value = reader
+    reader.header.point_format.size = point_size
+    reader.header.mins = [1, 2, 3]
+    reader.header.maxs = [4, 5, 6]
+    reader.chunk_iterator.return_value = [
+        mock.Mock(x=np.asarray(x, dtype=float), y=np.asarray(y, dtype=float), z=np.asarray(z, dtype=float))
+        for x, y, z in chunks
+    ]
+    return reader
+
+class TestLidarIngest(unittest.TestCase):
+
+    def test_spool_base64_round_trip_across_blocks(self):
+        payload = bytes(range(256)) * 50
+        encoded = base64.b64encode(payload).decode('ascii')
+        # Insert line breaks as MIME encoders do
+        encoded = '\n'.join(encoded[i:i + 76] for i in range(0, len(encoded), 76))
+        with spool_base64(encoded, block_size=1000) as spool:
+            self.assertEqual(spool.read(), payload)
+
+    def test_spool_base64_rejects_invalid_payload(self):
+        with self.assertRaises(LidarIngestError):
+            spool_base64('not*base64')
+        # A truncated payload leaves characters that never complete a block
+        with self.assertRaises(LidarIngestError):
+            spool_base64(base64.b64encode(b'truncated')[:-3], block_size=8)
+
+    def test_spool_stream_is_seekable_copy(self):
+        with spool_stream(io.BytesIO(b'x' * 5000), block_size=1024) as spool:
+            self.assertEqual(len(spool.read()), 5000)
+            spool.seek(0)
+            self.assertEqual(spool.read(1), b'x')
+
+    def test_spooling_feeds_digest_with_decoded_bytes(self):
+        payload = bytes(range(256)) * 20
+        from_stream, from_base64 = hashlib.sha256(), hashlib.sha256()
+        spool_stream(io.BytesIO(payload), block_size=1000, digest=from_stream).close()
+        spool_base64(base64.b64encode(payload), block_size=1000, digest=from_base64).close()
+        self.assertEqual(from_stream.hexdigest(), hashlib.sha256(payload).hexdigest())
+        self.assertEqual(from_base64.hexdigest(), from_stream.hexdigest())
+
+    def test_chunk_points_respect_budget(self):
+        budget = 16 * 1024 * 1024
+        chunk = chunk_points_for_budget(34, budget)
+        self.assertLessEqual(chunk * (34 + 24), budget)
+        # Chunk size does not depend on the tile size, only on the budget
+        self.assertEqual(chunk_points_for_budget(34, budget * 2), chunk * 2)
+
+    def test_ingest_streams_chunks_and_reports_stats(self):
+        reader = make_reader([([0, 5], [1, 2], [3, 4]), ([10, -1], [7, 0], [2, 9])])
+        seen = []
+        with mock.patch.object(lidar_ingest.laspy, 'open', return_value=reader):
+            result = ingest_lidar(io.BytesIO(b''), budget_bytes=1024 * 1024,
+                                  consumers=[lambda points, x, y, z: seen.append(len(x))])
+
+        self.assertEqual(seen, [2, 2])
+        self.assertEqual(result['point_count'], 4)
+        self.assertEqual(result['mins'], [-1, 0, 2])
+        self.assertEqual(result['maxs'], [10, 7, 9])
+        self.assertEqual(result['center'], [4.5, 3.5])
+        self.assertEqual(result['stats']['chunks'], 2)
+        reader.chunk_iterator.assert_called_once_with(chunk_points_for_budget(34, 1024 * 1024))
+        for key in ('points_per_sec', 'peak_rss_mb', 'seconds'):
+            self.assertIn(key, result['stats'])
+
+    def test_ingest_empty_file_uses_header_extent(self):
+        reader = make_reader([])
+        with mock.patch.object(lidar_ingest.laspy, 'open', return_value=reader):
+            result = ingest_lidar(io.BytesIO(b''))
+        self.assertEqual(result['point_count'], 0)
+        self.assertEqual(result['center'], [2.5, 3.5])
+
+class StoredTiles:
+    """Cursor over one project's stored cloud, as :func:`point_cloud_store.load_point_cloud` reads it."""
+
+    def __init__(self, writer):
+        self.cloud = (writer.scales.tolist(), writer.offsets.tolist(), list(writer.voxels_m))
+        self.rows = [(count, blob) for level, _, _, count, _, blob in writer.tiles() if level == 0]
+
+    def execute(self, sql, params=()):
+        pass
+
+    def fetchone(self):
+        return self.cloud
+
+    def __iter__(self):
+        return iter(self.rows)
+
+class TestReplayMatchesIngest(unittest.TestCase):
+
+    def test_padded_header_extent_is_replayed(self):
+        # The header claims a wider extent than the points cover, as tiles cut from a larger survey do
+        rng = np.random.default_rng(3)
+        # On the 1 cm storage grid, so the stored tiles decode to the same coordinates
+        x, y = rng.integers(2000, 6000, (2, 2000)) * 0.01
+        z = rng.integers(0, 1500, 2000) * 0.01
+        reader = make_reader([(x, y, z)])
+        reader.header.mins = [0.0, 0.0, 0.0]
+        reader.header.maxs = [100.0, 100.0, 30.0]
+        reader.header.scales = [0.01, 0.01, 0.01]
+        reader.header.offsets = [0.0, 0.0, 0.0]
+        ingested, tiles = SurfaceModelBuilder(cell_m=2, near_m=0), TileWriter(tile_size_m=25, units='m', voxels_m=())
+        with mock.patch.object(lidar_ingest.laspy, 'open', return_value=reader):
+            lidar = ingest_lidar(io.BytesIO(b''), consumers=[ingested, tiles])
+        self.assertEqual(lidar['header_mins'], [0.0, 0.0, 0.0])
+        self.assertGreater(lidar['mins'][0], 19)
+
+        replayed = SurfaceModelBuilder(cell_m=2, near_m=0)
+        replay_point_cloud(StoredTiles(tiles), 'project-1', [replayed], lidar['header_mins'], lidar['header_maxs'])
+        tiles.close()
+        original, rebuilt = ingested.build(), replayed.build()
+        self.assertEqual(rebuilt.origin, original.origin)
+        self.assertEqual(rebuilt.dsm.shape, original.dsm.shape)
+        np.testing.assert_allclose(rebuilt.dsm, original.dsm, atol=0.01)
+
+class TestParallelIngest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.tmp.name, 'tile.las')
+        write_tile(cls.path, 230_000, seed=7)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def ingest(self, source, workers):
+        surface, tiles = SurfaceModelBuilder(near_m=20), TileWriter()
+        with mock.patch.object(lidar_ingest, 'LIDAR_PARALLEL_MIN_POINTS', 1):
+            result = ingest_lidar(source, budget_bytes=4 * 1024 * 1024, consumers=[surface, tiles], workers=workers)
+        blobs = [(level, tx, ty, count, blob) for level, tx, ty, count, _, blob in tiles.tiles()]
+        tiles.close()
+        return result, surface.build(), blobs
+
+    def test_parallel_ingest_matches_serial(self):
+        serial, serial_surface, serial_tiles = self.ingest(self.path, workers=1)
+        with open(self.path, 'rb') as f:
+            # An unnamed in-memory upload is copied to a file the workers can open
+            parallel, surface, tiles = self.ingest(io.BytesIO(f.read()), workers=2)
+
+        self.assertEqual(serial['stats']['workers'], 1)
+        self.assertEqual(parallel['stats']['workers'], 2)
+        self.assertEqual(parallel['point_count'], 230_000)
+        # Jobs start on LAZ chunk boundaries
+        self.assertEqual(parallel['stats']['chunks'], 5)
+        self.assertEqual(parallel['mins'], serial['mins'])
+        self.assertEqual(parallel['maxs'], serial['maxs'])
+        np.testing.assert_array_equal(surface.dsm, serial_surface.dsm)
+        np.testing.assert_array_equal(surface.coarse.dsm, serial_surface.coarse.dsm)
+        self.assertEqual(tiles, serial_tiles)
+        self.assertIsNotNone(parallel['stats']['worker_peak_rss_mb'])
+
+    def test_consumers_without_split_run_serially(self):
+        seen = []
+        with mock.patch.object(lidar_ingest, 'LIDAR_PARALLEL_MIN_POINTS', 1):
+            result = ingest_lidar(self.path, consumers=[lambda points, x, y, z: seen.append(len(x))], workers=2)
+        self.assertEqual(result['stats']['workers'], 1)
+        self.assertEqual(sum(seen), 230_000)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+from metrics import (Counter, GaugeCallback, Histogram, Registry, payload_label, points_label,
+                     server_timing)
+
+class TestSizeClasses(unittest.TestCase):
+
+    def test_points_label(self):
+        self.assertEqual(points_label(None), 'unknown')
+        self.assertEqual(points_label(999_999), '<1M')
+        self.assertEqual(points_label(1_000_000), '1M-10M')
+        self.assertEqual(points_label(49_999_999), '10M-50M')
+        self.assertEqual(points_label(80_000_000), '>=50M')
+
+    def test_payload_label(self):
+        self.assertEqual(payload_label(5 * 2**20), '<10MB')
+        self.assertEqual(payload_label(500 * 2**20), '100MB-1GB')
+        self.assertEqual(payload_label(2 * 2**30), '>=1GB')
+
+class TestHistogram(unittest.TestCase):
+
+    def test_render_is_cumulative_per_label_set(self):
+        histogram = Histogram('stage_seconds', 'Stage time.', ('stage',), buckets=(0.1, 1))
+        histogram.observe(0.05, 'parse')
+        histogram.observe(0.5, 'parse')
+        histogram.observe(3, 'parse')
+        histogram.observe(0.1, 'persist')  # bucket bounds are inclusive
+
+        lines = histogram.render()
+
+        self.assertEqual(lines[:2], ['# HELP stage_seconds Stage time.', '# TYPE stage_seconds histogram'])
+        self.assertIn('stage_seconds_bucket{stage="parse",le="0.1"} 1', lines)
+        self.assertIn('stage_seconds_bucket{stage="parse",le="1"} 2', lines)
+        self.assertIn('stage_seconds_bucket{stage="parse",le="+Inf"} 3', lines)
+        self.assertIn('stage_seconds_sum{stage="parse"} 3.55', lines)
+        self.assertIn('stage_seconds_count{stage="parse"} 3', lines)
+        self.assertIn('stage_seconds_bucket{stage="persist",le="0.1"} 1', lines)
+
+class TestRegistry(unittest.TestCase):
+
+    def test_render_counters_and_gauges(self):
+        registry = Registry()
+        counter = registry.register(Counter('points_total', 'Points.', ('mode',)))
+        registry.register(GaugeCallback('pool', 'Pool', lambda: {"size": 3, "waits": 7, "wait_seconds_total": 0.5},
+                                        ('size', 'idle'), ('waits', 'wait_seconds_total')))
+        counter.inc('sync', amount=10)
+        counter.inc('sync', amount=5)
+
+        text = registry.render()
+
+        self.assertIn('# TYPE points_total counter\npoints_total{mode="sync"} 15\n', text)
+        self.assertIn('# TYPE pool_size gauge\npool_size 3\n', text)
+        self.assertIn('pool_idle 0\n', text)
+        # Cumulative keys are counters, named with a single _total suffix
+        self.assertIn('# TYPE pool_waits_total counter\npool_waits_total 7\n', text)
+        self.assertIn('# TYPE pool_wait_seconds_total counter\npool_wait_seconds_total 0.5\n', text)
+        self.assertTrue(text.endswith('\n'))
+
+class TestServerTiming(unittest.TestCase):
+
+    def test_stages_in_order_with_total(self):
+        header = server_timing({"decode": 0.0123, "lidar": 1.5, "shading": None})
+        self.assertEqual(header, 'decode;dur=12.3, lidar;dur=1500.0, total;dur=1512.3')
+
+if __name__ == '__main__':
+    unittest.main()
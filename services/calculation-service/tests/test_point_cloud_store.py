@@ -0,0 +1,180 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from point_cloud_store import (TileWriter, decode_tile, encode_tile, load_point_cloud, replay_point_cloud,
+                               save_point_cloud, voxel_downsample, LIDAR_FETCH_TILES)
+
+def header(mins, maxs, scales=(0.01, 0.01, 0.01), offsets=(0, 0, 0)):
+    return mock.Mock(mins=mins, maxs=maxs, scales=scales, offsets=offsets)
+
+def stream(writer, chunks):
+    for x, y, z, classes in chunks:
+        writer(mock.Mock(classification=np.asarray(classes, dtype=np.uint8)),
+               np.asarray(x, dtype=float), np.asarray(y, dtype=float), np.asarray(z, dtype=float))
+
+class TestTileEncoding(unittest.TestCase):
+
+    def test_round_trip(self):
+        q = np.array([0, 150, -20], dtype=np.int32)
+        blob = encode_tile(q, q + 1, q + 2, np.array([2, 5, 6], dtype=np.uint8))
+        x, y, z, classes = decode_tile(blob, 3, (0.01, 0.01, 0.001), (100.0, 200.0, 0.0))
+        np.testing.assert_allclose(x, [100.0, 101.5, 99.8])
+        np.testing.assert_allclose(y, [200.01, 201.51, 199.81])
+        np.testing.assert_allclose(z, [0.002, 0.152, -0.018])
+        np.testing.assert_array_equal(classes, [2, 5, 6])
+
+    def test_count_mismatch_is_rejected(self):
+        blob = encode_tile(*(np.zeros(2, dtype=np.int32),) * 3, np.zeros(2, dtype=np.uint8))
+        with self.assertRaises(ValueError):
+            decode_tile(blob, 3, (1, 1, 1), (0, 0, 0))
+
+class TestTileWriter(unittest.TestCase):
+
+    def test_points_are_grouped_by_tile_across_chunks(self):
+        writer = TileWriter(tile_size_m=10, units='m', voxels_m=())
+        writer.start(header([0, 0, 0], [25, 15, 10]))
+        stream(writer, [
+            ([1.0, 12.0, 3.0], [1.0, 1.0, 11.0], [1.0, 2.0, 3.0], [2, 2, 5]),
+            ([2.0, 24.5], [2.0, 14.0], [4.0, 5.0], [2, 6]),
+        ])
+        tiles = {(tx, ty): (count, bounds, blob) for _, tx, ty, count, bounds, blob in writer.tiles()}
+        writer.close()
+
+        self.assertEqual(sorted(tiles), [(0, 0), (0, 1), (1, 0), (2, 1)])
+        count, bounds, blob = tiles[(0, 0)]
+        self.assertEqual(count, 2)
+        np.testing.assert_allclose(bounds, (1.0, 1.0, 1.0, 2.0, 2.0, 4.0))
+        x, y, z, classes = decode_tile(blob, count, writer.scales, writer.offsets)
+        np.testing.assert_allclose(x, [1.0, 2.0])
+        np.testing.assert_allclose(z, [1.0, 4.0])
+        np.testing.assert_array_equal(classes, [2, 2])
+
+    def test_missing_classification_is_stored_as_zero(self):
+        writer = TileWriter(tile_size_m=10, units='m')
+        writer.start(header([0, 0, 0], [5, 5, 5]))
+        writer(mock.Mock(spec=[]), np.array([1.0]), np.array([1.0]), np.array([1.0]))
+        _, _, _, count, _, blob = next(writer.tiles())
+        self.assertEqual(decode_tile(blob, count, writer.scales, writer.offsets)[3].tolist(), [0])
+
+class TestPyramid(unittest.TestCase):
+
+    def test_voxel_downsample_keeps_highest_point_per_voxel(self):
+        qx = np.array([0, 10, 60, 0, 250, 5], dtype=np.int32)
+        qy = np.zeros(6, dtype=np.int32)
+        qz = np.array([10, 30, 20, 500, 0, 90], dtype=np.int32)
+        classes = np.array([2, 5, 2, 2, 2, 7], dtype=np.uint8)
+        keep = voxel_downsample(qx, qy, qz, classes, (50, 50, 100))
+        # Points 0 and 1 share a voxel, 3 sits above them; the noise point is dropped
+        self.assertEqual(sorted(keep.tolist()), [1, 2, 3, 4])
+
+    def test_voxels_align_across_tiles(self):
+        qx = np.array([-1, 0], dtype=np.int32)
+        keep = voxel_downsample(qx, np.zeros(2, dtype=np.int32), np.zeros(2, dtype=np.int32),
+                                np.full(2, 2, dtype=np.uint8), (100, 100, 100))
+        self.assertEqual(len(keep), 2)
+
+    def test_levels_thin_each_tile(self):
+        writer = TileWriter(tile_size_m=10, units='m', voxels_m=(0.5, 4))
+        writer.start(header([0, 0, 0], [9.99, 9.99, 5]))
+        grid = np.arange(0, 10, 0.1)
+        x, y = (v.ravel() for v in np.meshgrid(grid, grid))
+        stream(writer, [(x, y, np.ones_like(x), np.full(len(x), 2))])
+
+        tiles = list(writer.tiles())
+        writer.close()
+
+        self.assertEqual([(level, count) for level, _, _, count, _, _ in tiles], [(0, 10000), (1, 400), (2, 9)])
+        x1, _, z1, _ = decode_tile(tiles[1][5], 400, writer.scales, writer.offsets)
+        np.testing.assert_allclose(z1, 1.0)
+        summary = writer.pyramid_summary()
+        self.assertEqual([level['voxel_m'] for level in summary], [None, 0.5, 4])
+        self.assertEqual(summary[1]['point_ratio'], 0.04)
+        self.assertLess(summary[2]['decoded_mb'], summary[0]['decoded_mb'])
+
+class TestSaveAndLoad(unittest.TestCase):
+
+    def test_save_replaces_project_tiles(self):
+        writer = TileWriter(tile_size_m=10, units='m', voxels_m=(2,))
+        writer.start(header([0, 0, 0], [25, 5, 5]))
+        stream(writer, [([1.0, 21.0], [1.0, 1.0], [0.5, 3.0], [2, 2])])
+        cur = mock.Mock()
+
+        self.assertEqual(save_point_cloud(cur, 'project-1', writer), 2)
+
+        statements = [call.args[0] for call in cur.execute.call_args_list]
+        self.assertIn('INSERT INTO lidar_clouds', statements[0])
+        self.assertEqual(cur.execute.call_args_list[0].args[1][4], [2])
+        self.assertIn('DELETE FROM lidar_tiles', statements[1])
+        self.assertEqual(cur.execute.call_args_list[1].args[1], ('project-1',))
+        # Two tiles, each at full resolution and one pyramid level
+        self.assertEqual(sum('INSERT INTO lidar_tiles' in sql for sql in statements), 4)
+        self.assertEqual([call.args[1][:5] for call in cur.execute.call_args_list[2:]],
+                         [('project-1', 0, 0, 0, 1), ('project-1', 1, 0, 0, 1),
+                          ('project-1', 0, 2, 0, 1), ('project-1', 1, 2, 0, 1)])
+
+    def test_save_without_ingest_stores_nothing(self):
+        cur = mock.Mock()
+        self.assertEqual(save_point_cloud(cur, 'project-1', TileWriter()), 0)
+        cur.execute.assert_not_called()
+
+    def test_load_filters_by_bbox(self):
+        q = np.array([100, 200], dtype=np.int32)
+        blob = encode_tile(q, q, q, np.array([2, 2], dtype=np.uint8))
+        cur = mock.Mock()
+        cur.fetchone.return_value = ([0.01, 0.01, 0.01], [0.0, 0.0, 0.0], [])
+        tiles_cur = mock.MagicMock()
+        tiles_cur.__iter__.return_value = iter([(2, blob)])
+
+        tiles = list(load_point_cloud(cur, 'project-1', bbox=(0, 0, 5, 5), tiles_cur=tiles_cur))
+
+        self.assertEqual(len(tiles), 1)
+        np.testing.assert_allclose(tiles[0][0], [1.0, 2.0])
+        # Tiles stream from the server-side cursor a batch at a time
+        self.assertEqual(tiles_cur.itersize, LIDAR_FETCH_TILES)
+        tiles_cur.fetchall.assert_not_called()
+        sql, params = tiles_cur.execute.call_args.args
+        self.assertIn('extent && ST_MakeEnvelope', sql)
+        self.assertEqual(params, ('project-1', 0, 0, 0, 5, 5))
+
+    def test_load_takes_full_resolution_only_near_detail_bbox(self):
+        cur = mock.MagicMock()
+        cur.fetchone.return_value = ([0.01, 0.01, 0.01], [0.0, 0.0, 0.0], [0.5, 2.0])
+
+        list(load_point_cloud(cur, 'project-1', level=5, detail_bbox=(10, 10, 20, 20)))
+
+        sql, params = cur.execute.call_args.args
+        self.assertIn('level = 0 AND extent &&', sql)
+        self.assertIn('NOT IN', sql)
+        # Clamped to the coarsest stored level
+        self.assertEqual(params, ('project-1', 10, 10, 20, 20, 2, 'project-1', 10, 10, 20, 20))
+
+    def test_load_without_pyramid_falls_back_to_full_resolution(self):
+        cur = mock.MagicMock()
+        cur.fetchone.return_value = ([0.01, 0.01, 0.01], [0.0, 0.0, 0.0], [])
+        list(load_point_cloud(cur, 'project-1', level=2, detail_bbox=(10, 10, 20, 20)))
+        self.assertEqual(cur.execute.call_args.args[1], ('project-1', 0))
+
+    def test_load_without_stored_cloud_yields_nothing(self):
+        cur = mock.Mock()
+        cur.fetchone.return_value = None
+        self.assertEqual(list(load_point_cloud(cur, 'project-1')), [])
+
+    def test_replay_feeds_consumers_like_an_ingest(self):
+        q = np.array([100, 200, 300], dtype=np.int32)
+        blob = encode_tile(q, q, q, np.array([2, 5, 2], dtype=np.uint8))
+        cur = mock.MagicMock()
+        cur.fetchone.return_value = ([0.01, 0.01, 0.01], [0.0, 0.0, 0.0], [])
+        cur.__iter__.return_value = iter([(3, blob)])
+        consumer = mock.Mock()
+
+        self.assertEqual(replay_point_cloud(cur, 'project-1', [consumer], [0, 0, 0], [10, 10, 10]), 3)
+
+        self.assertEqual(consumer.start.call_args.args[0].maxs, [10, 10, 10])
+        chunk, x, y, z = consumer.call_args.args
+        np.testing.assert_allclose(x, [1.0, 2.0, 3.0])
+        np.testing.assert_array_equal(chunk.classification, [2, 5, 2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import io
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import profiles
+from profiles import (PROFILE_COLUMNS, PROFILE_HOURS, ProfileError, fetch_profiles, pack_profile, parse_export,
+                      unpack_profile, write_arrow, write_npy)
+
+
+def hourly(scale):
+    return {name: np.arange(PROFILE_HOURS, dtype=np.float32) * scale + index
+            for index, name in enumerate(PROFILE_COLUMNS)}
+
+
+class TestPacking(unittest.TestCase):
+
+    def test_round_trip(self):
+        blob = pack_profile(hourly(2.0))
+        self.assertEqual(len(blob), len(PROFILE_COLUMNS) * PROFILE_HOURS * 4)
+        columns = unpack_profile(blob)
+        np.testing.assert_array_equal(columns['dc_w'], hourly(2.0)['dc_w'])
+
+    def test_parse_export(self):
+        self.assertEqual(parse_export(['a'], None), (['a'], 'npy'))
+        for args in (([], 'npy'), ('a', 'npy'), (['a'], 'csv')):
+            with self.assertRaises(ProfileError, msg=args):
+                parse_export(*args)
+        with mock.patch.object(profiles, 'PROFILE_BULK_MAX', 2):
+            with self.assertRaises(ProfileError):
+                parse_export(['a', 'b', 'c'], 'npy')
+        with mock.patch.object(profiles, 'pa', None):
+            with self.assertRaises(ProfileError):
+                parse_export(['a'], 'arrow')
+
+
+class TestExport(unittest.TestCase):
+
+    def test_fetch_keeps_request_order_and_marks_missing(self):
+        cur = mock.MagicMock()
+        cur.__iter__.return_value = iter([('b', b'B'), ('d', b'D')])
+        rows = list(fetch_profiles(cur, ['a', 'b', 'c', 'd', 'e']))
+        self.assertEqual(rows, [('a', None), ('b', b'B'), ('c', None), ('d', b'D'), ('e', None)])
+        self.assertEqual(cur.itersize, profiles.PROFILE_FETCH_ROWS)
+
+    def test_fetch_handles_duplicates_and_missing_ids(self):
+        cur = mock.MagicMock()
+        # Rows come back once per id, in first-request order
+        cur.__iter__.return_value = iter([('b', b'B'), ('a', b'A'), ('d', b'D')])
+        rows = list(fetch_profiles(cur, ['b', 'c', 'a', 'b', 'd', 'a', 'c']))
+        self.assertEqual(rows, [('b', b'B'), ('c', None), ('a', b'A'), ('b', b'B'), ('d', b'D'), ('a', b'A'),
+                                ('c', None)])
+        # Each id is queried once
+        self.assertEqual(cur.execute.call_args[0][1], (['b', 'c', 'a', 'd'], ['b', 'c', 'a', 'd']))
+
+    def test_npy_stream_is_a_loadable_array(self):
+        rows = [('a', pack_profile(hourly(1.0))), ('b', None), ('c', memoryview(pack_profile(hourly(3.0))))]
+        array = np.load(io.BytesIO(b''.join(write_npy(rows, 3))))
+        self.assertEqual(array.shape, (3, len(PROFILE_COLUMNS), PROFILE_HOURS))
+        self.assertEqual(array.dtype, np.float32)
+        np.testing.assert_array_equal(array[2, 0], hourly(3.0)['ac_w'])
+        self.assertTrue(np.isnan(array[1]).all())
+
+    def test_npy_rejects_a_truncated_blob(self):
+        with self.assertRaises(ProfileError):
+            b''.join(write_npy([('a', b'\x00' * 12)], 1))
+
+    @unittest.skipIf(profiles.pa is None, "pyarrow is not installed")
+    def test_arrow_stream_holds_one_row_per_stored_profile(self):
+        rows = [('a', pack_profile(hourly(1.0))), ('b', None), ('c', pack_profile(hourly(3.0)))]
+        table = profiles.pa.ipc.open_stream(b''.join(write_arrow(rows, batch_rows=1))).read_all()
+        self.assertEqual(table.column('project_id').to_pylist(), ['a', 'c'])
+        np.testing.assert_array_equal(table.column('poa_w_m2')[1].values.to_numpy(), hourly(3.0)['poa_w_m2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
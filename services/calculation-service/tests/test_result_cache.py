@@ -0,0 +1,116 @@
+import json
+import unittest
+from unittest import mock
+
+from result_cache import MemoryResultStore, PostgresResultStore, calculation_key, make_result_store
+
+class TestCalculationKey(unittest.TestCase):
+
+    def key(self, **overrides):
+        inputs = {
+            "lidar_digest": "abc",
+            "project_name": "Barn roof",
+            "location": {"lat": 35.0, "lon": -78.0},
+            "panel_specs": {"type": "mono", "count": 10},
+            "ground_mount_config": None,
+        }
+        inputs.update(overrides)
+        return calculation_key(**inputs)
+
+    def test_formatting_differences_share_a_key(self):
+        self.assertEqual(
+            self.key(),
+            self.key(location={"lon": -78, "lat": 35.0000000001},
+                     panel_specs={"count": 10.0, "type": "mono"}, ground_mount_config={})
+        )
+
+    def test_any_input_change_changes_the_key(self):
+        base = self.key()
+        for overrides in ({"lidar_digest": "abd"}, {"project_name": "Barn roof 2"},
+                          {"location": {"lat": 35.1, "lon": -78.0}},
+                          {"panel_specs": {"type": "mono", "count": 11}},
+                          {"ground_mount_config": {"tilt": 30}},
+                          {"options": {"minutes": 15, "profile_minutes": None}}):
+            self.assertNotEqual(self.key(**overrides), base, overrides)
+
+    def test_unset_options_keep_the_key(self):
+        self.assertEqual(self.key(options=None), self.key())
+
+    def test_version_is_part_of_the_key(self):
+        base = self.key()
+        with mock.patch('result_cache.RESULT_MEMO_VERSION', '2'):
+            self.assertNotEqual(self.key(), base)
+
+class TestMemoryResultStore(unittest.TestCase):
+
+    def test_least_recently_used_entry_is_evicted(self):
+        store = MemoryResultStore(max_entries=2, ttl=60)
+        store.put('a', 'p1', {"annual_kwh": 1})
+        store.put('b', 'p2', {"annual_kwh": 2})
+        store.get('a')
+        store.put('c', 'p3', {"annual_kwh": 3})
+        self.assertIsNone(store.get('b'))
+        self.assertEqual(store.get('a'), ('p1', {"annual_kwh": 1}))
+        self.assertEqual(store.stats()['entries'], 2)
+
+    def test_entries_expire(self):
+        store = MemoryResultStore(max_entries=2, ttl=60)
+        with mock.patch('result_cache.time.time', return_value=1000.0):
+            store.put('a', 'p1', {})
+        with mock.patch('result_cache.time.time', return_value=1061.0):
+            self.assertIsNone(store.get('a'))
+        self.assertEqual(store.stats()['misses'], 1)
+
+    def test_discard_project_drops_only_its_entries(self):
+        store = MemoryResultStore(max_entries=4, ttl=60)
+        store.put('a', 'p1', {})
+        store.put('b', 'p1', {})
+        store.put('c', 'p2', {})
+        # A key re-pointed at another project no longer belongs to the first
+        store.put('b', 'p2', {})
+        store.discard_project('p1')
+        self.assertIsNone(store.get('a'))
+        self.assertEqual(store.get('b'), ('p2', {}))
+        store.discard_project('p2')
+        self.assertEqual(store.stats()['entries'], 0)
+
+class TestPostgresResultStore(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = mock.Mock()
+        self.cur = self.conn.cursor.return_value
+        self.store = PostgresResultStore(lambda: self.conn, max_entries=100, ttl=3600)
+
+    def test_hit_touches_row_and_decodes_result(self):
+        self.cur.fetchone.return_value = ('p1', json.dumps({"annual_kwh": 5.0}))
+        self.assertEqual(self.store.get('k'), ('p1', {"annual_kwh": 5.0}))
+        sql, params = self.cur.execute.call_args.args
+        self.assertIn('UPDATE calculation_memo SET last_used_at', sql)
+        self.assertEqual(params, ('k', 3600))
+        self.conn.close.assert_called_once()
+
+    def test_put_upserts_then_prunes(self):
+        self.store.put('k', 'p1', {"annual_kwh": 5.0})
+        (insert_sql, insert_params), (prune_sql, prune_params) = [c.args for c in self.cur.execute.call_args_list]
+        self.assertIn('ON CONFLICT (input_hash)', insert_sql)
+        self.assertEqual(insert_params, ('k', 'p1', '{"annual_kwh": 5.0}'))
+        self.assertIn('DELETE FROM calculation_memo', prune_sql)
+        self.assertEqual(prune_params, (3600, 100))
+        self.assertEqual(self.conn.commit.call_count, 2)
+
+    def test_discard_project_deletes_its_rows(self):
+        self.store.discard_project('p1')
+        self.cur.execute.assert_called_once_with("DELETE FROM calculation_memo WHERE project_id = %s", ('p1',))
+        self.conn.commit.assert_called_once()
+
+class TestMakeResultStore(unittest.TestCase):
+
+    def test_store_selection(self):
+        self.assertIsInstance(make_result_store('memory'), MemoryResultStore)
+        self.assertIsInstance(make_result_store('postgres', connect=mock.Mock()), PostgresResultStore)
+        self.assertIsNone(make_result_store('off'))
+        with self.assertRaises(ValueError):
+            make_result_store('redis')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from shading import (SurfaceModel, SurfaceModelBuilder, analyze_shading,
+                     beam_shading_factor, horizontal_scale, sky_view_factor)
+
+def flat_site_with_wall(size=200, wall_row=120, wall_height=20.0):
+    """200 m square at 1 m cells, flat ground with an east-west wall north of centre."""
+    dsm = np.zeros((size, size), dtype=np.float32)
+    dsm[wall_row, :] = wall_height
+    return SurfaceModel(dsm, origin=(0.0, 0.0), cell_m=1.0, scale=(1.0, 1.0))
+
+def header(mins, maxs):
+    return mock.Mock(mins=mins, maxs=maxs)
+
+class TestSurfaceModelBuilder(unittest.TestCase):
+
+    def test_rasterizes_highest_return_per_cell(self):
+        builder = SurfaceModelBuilder(cell_m=1.0, units='m')
+        builder.start(header([0, 0, 0], [9.9, 9.9, 30]))
+        x = np.array([0.2, 0.7, 5.5, 9.9])
+        y = np.array([0.1, 0.4, 5.5, 9.9])
+        z = np.array([1.0, 3.0, 7.0, 2.0])
+        builder(mock.Mock(classification=np.array([2, 2, 5, 2], dtype=np.uint8)), x, y, z)
+        surface = builder.build()
+        self.assertEqual(surface.shape, (10, 10))
+        self.assertEqual(surface.dsm[0, 0], 3.0)
+        self.assertEqual(surface.dsm[5, 5], 7.0)
+        self.assertTrue(np.isnan(surface.dsm[3, 3]))
+
+    def test_noise_points_are_ignored(self):
+        builder = SurfaceModelBuilder(cell_m=1.0, units='m')
+        builder.start(header([0, 0, 0], [4, 4, 100]))
+        builder(mock.Mock(classification=np.array([2, 7, 18])), np.array([1.0, 1.0, 1.0]),
+                np.array([1.0, 1.0, 1.0]), np.array([2.0, 90.0, 100.0]))
+        self.assertEqual(builder.build().dsm[1, 1], 2.0)
+
+    def test_cell_size_grows_to_fit_budget(self):
+        builder = SurfaceModelBuilder(cell_m=1.0, max_cells=100 * 100, units='m')
+        builder.start(header([0, 0, 0], [1000, 1000, 10]))
+        self.assertGreaterEqual(builder.cell_m, 10.0)
+        self.assertLessEqual(builder.n_rows * builder.n_cols, 102 * 102)
+
+    def test_empty_cloud_has_no_surface(self):
+        builder = SurfaceModelBuilder(units='m')
+        builder.start(header([0, 0, 0], [10, 10, 10]))
+        self.assertIsNone(builder.build())
+        self.assertIsNone(analyze_shading(None, None, (0, 0)))
+
+    def test_horizontal_scale(self):
+        self.assertEqual(horizontal_scale([500000, 3960000], [501000, 3961000], 'auto'), (1.0, 1.0))
+        x_scale, y_scale = horizontal_scale([-78.79, 35.78], [-78.78, 35.79], 'auto')
+        self.assertAlmostEqual(x_scale, 111320 * np.cos(np.radians(35.785)))
+        self.assertAlmostEqual(horizontal_scale([0, 0], [1, 1], 'ft')[0], 0.3048)
+
+class TestCoarseToFine(unittest.TestCase):
+
+    @staticmethod
+    def site(**kwargs):
+        """400 m square: a 5 m fence 20 m south of centre and a 30 m block 150 m north."""
+        builder = SurfaceModelBuilder(cell_m=1.0, units='m', **kwargs)
+        builder.start(header([0, 0, 0], [400, 400, 40]))
+        grid = np.arange(0.25, 400, 0.5)
+        x, y = (v.ravel() for v in np.meshgrid(grid, grid))
+        z = np.zeros_like(x)
+        z[(np.abs(y - 180) < 0.5) & (np.abs(x - 200) < 30)] = 5.0
+        z[(y > 350) & (y < 360)] = 30.0
+        builder(mock.Mock(spec=[]), x, y, z)
+        return builder.build()
+
+    def test_fine_grid_only_near_the_centre(self):
+        surface = self.site(near_m=60, far_cell_m=4)
+        self.assertEqual(surface.cell_m, 1.0)
+        self.assertEqual(surface.coarse.cell_m, 4.0)
+        self.assertLess(surface.dsm.size, 125 * 125)
+        self.assertEqual(surface.coarse.shape, (101, 101))
+        single = self.site(near_m=0)
+        self.assertIsNone(single.coarse)
+        self.assertEqual(single.shape, (401, 401))
+
+    def test_horizon_matches_full_resolution(self):
+        rows, cols = [200], [200]
+        coarse = self.site(near_m=60, far_cell_m=4)
+        full = self.site(near_m=0)
+        row, col = coarse.to_grid(200.0, 200.0)
+        azimuths, horizons = coarse.horizon_profiles([row], [col], [1.0], max_distance_m=300)
+        _, expected = full.horizon_profiles(rows, cols, [1.0], max_distance_m=300)
+        np.testing.assert_allclose(horizons, expected, atol=1.0)
+        self.assertAlmostEqual(horizons[0][azimuths == 180][0], np.degrees(np.arctan2(4.0, 20.0)), delta=1.0)
+        self.assertGreater(horizons[0][azimuths == 0][0], 10.0)
+
+    def test_levels_report_savings(self):
+        surface = self.site(near_m=60, far_cell_m=4)
+        solpos = pd.DataFrame({'azimuth': [180.0], 'apparent_elevation': [45.0]})
+        levels = analyze_shading(surface, solpos, center=(200.0, 200.0)).summary()['levels']
+        self.assertEqual([level['cell_m'] for level in levels], [1.0, 4.0])
+        self.assertLess(sum(level['cell_ratio'] for level in levels), 0.2)
+        self.assertLess(sum(level['ray_step_ratio'] for level in levels), 0.5)
+
+class TestHorizonAndMask(unittest.TestCase):
+
+    def test_wall_raises_northern_horizon(self):
+        surface = flat_site_with_wall()
+        azimuths, horizons = surface.horizon_profiles([100], [100], [1.0], max_distance_m=100)
+        north = horizons[0][azimuths == 0][0]
+        south = horizons[0][azimuths == 180][0]
+        self.assertAlmostEqual(north, np.degrees(np.arctan2(19.0, 20.0)), delta=1.0)
+        self.assertEqual(south, 0.0)
+
+    def test_beam_factor(self):
+        azimuths = np.arange(0, 360, 1.0)
+        horizons = np.zeros((2, 360), dtype=np.float32)
+        horizons[0, 170:191] = 40.0  # first observer blocked to the south
+        factor = beam_shading_factor(azimuths, horizons, [180, 180, 90, 359.5], [30, 50, 30, 10])
+        np.testing.assert_array_equal(factor, [0.5, 1.0, 1.0, 1.0])
+
+    def test_sky_view_factor(self):
+        self.assertEqual(sky_view_factor(np.zeros((1, 360))), 1.0)
+        self.assertAlmostEqual(sky_view_factor(np.full((1, 360), 30.0)), 0.75)
+
+    def test_analyze_shading(self):
+        surface = flat_site_with_wall(wall_row=110, wall_height=40.0)
+        times = pd.date_range('1990-06-21 04:00', periods=4, freq='6h')
+        solpos = pd.DataFrame({'azimuth': [60.0, 90.0, 180.0, 300.0],
+                               'apparent_elevation': [20.0, 30.0, 70.0, 10.0]}, index=times)
+        shading = analyze_shading(surface, solpos, center=(100.0, 100.0), array_height_m=1.0, span_m=0)
+        # Sun at azimuth 60/300 with low elevation is behind the wall to the north
+        np.testing.assert_array_equal(shading.beam_factor, [0.0, 1.0, 1.0, 0.0])
+        self.assertLess(shading.sky_view_factor, 1.0)
+        summary = shading.summary()
+        self.assertEqual(summary['beam_unshaded_fraction'], 0.5)
+
+if __name__ == '__main__':
+    unittest.main()
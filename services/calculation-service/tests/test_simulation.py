@@ -0,0 +1,99 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+import pvlib
+
+from simulation import simulate_configurations, simulate_arrays, site_arrays, optimize_orientation, temperature_model_parameters
+
+LAT, LON = 35.79, -78.78
+TIMES = pd.date_range('1990-01-01', periods=8760, freq='h', tz='Etc/GMT+5')
+
+def clear_sky_inputs():
+    solpos = pvlib.solarposition.get_solarposition(TIMES, LAT, LON)
+    clearsky = pvlib.location.Location(LAT, LON, tz='Etc/GMT+5').get_clearsky(TIMES, solar_position=solpos)
+    weather = {
+        'ghi': clearsky['ghi'], 'dni': clearsky['dni'], 'dhi': clearsky['dhi'],
+        'temp_air': pd.Series(20.0, index=TIMES), 'wind_speed': pd.Series(2.0, index=TIMES),
+    }
+    return weather, solpos
+
+class TestSimulateConfigurations(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.weather, cls.solpos = clear_sky_inputs()
+
+    def reference(self, tilt, azimuth, pdc0, inverter_pdc0):
+        """Scalar pvlib chain for one configuration."""
+        params = temperature_model_parameters()
+        poa = pvlib.irradiance.get_total_irradiance(
+            tilt, azimuth, self.solpos['apparent_zenith'], self.solpos['azimuth'],
+            self.weather['dni'], self.weather['ghi'], self.weather['dhi']
+        )
+        poa_global = poa['poa_global'].fillna(0)
+        cell = pvlib.temperature.sapm_cell(poa_global, self.weather['temp_air'], self.weather['wind_speed'],
+                                           params['a'], params['b'], params['deltaT'])
+        dc = pvlib.pvsystem.pvwatts_dc(poa_global, cell, pdc0, -0.004)
+        ac = pvlib.inverter.pvwatts(dc, inverter_pdc0, 0.96).fillna(0).clip(lower=0)
+        return ac.sum() / 1000
+
+    def test_matches_scalar_pvlib_chain(self):
+        tilts = [0, 20, 30, 30, 45]
+        azimuths = [180, 180, 180, 220, 160]
+        pdc0 = [5000, 5000, 5000, 6000, 4000]
+        result = simulate_configurations(self.weather, self.solpos, tilts, azimuths, pdc0,
+                                         inverter_pdc0=np.array(pdc0) / 1.2, chunk_size=2)
+        self.assertEqual(result['annual_kwh'].shape, (5,))
+        for i in range(5):
+            expected = self.reference(tilts[i], azimuths[i], pdc0[i], pdc0[i] / 1.2)
+            self.assertAlmostEqual(result['annual_kwh'][i], expected, places=6)
+
+    def test_duplicate_orientations_share_poa(self):
+        result = simulate_configurations(self.weather, self.solpos, [30, 30], [180, 180], [5000, 10000])
+        self.assertAlmostEqual(result['poa_kwh_m2'][0], result['poa_kwh_m2'][1])
+        self.assertAlmostEqual(result['annual_kwh'][1], 2 * result['annual_kwh'][0], places=3)
+        self.assertAlmostEqual(result['specific_yield_kwh_kwp'][0], result['specific_yield_kwh_kwp'][1], places=6)
+
+    def test_south_facing_beats_north_facing(self):
+        result = simulate_configurations(self.weather, self.solpos, 30, [180, 0], 5000)
+        self.assertGreater(result['annual_kwh'][0], result['annual_kwh'][1])
+
+    def test_inverter_clips_peak_power(self):
+        result = simulate_configurations(self.weather, self.solpos, 30, 180, 5000, inverter_pdc0=2000)
+        self.assertLessEqual(result['peak_ac_w'][0], 2000 * 0.96 + 1e-6)
+
+    def test_shading_factors_reduce_yield(self):
+        inputs = site_arrays(self.weather, self.solpos)
+        open_sky = simulate_arrays(inputs, 30, 180, 5000)
+        beam = np.where(self.solpos['azimuth'].to_numpy() > 180, 0.0, 1.0)
+        shaded = simulate_arrays(inputs, 30, 180, 5000, beam_factor=beam, sky_view_factor=0.9)
+        self.assertLess(shaded['annual_kwh'][0], open_sky['annual_kwh'][0])
+        unity = simulate_arrays(inputs, 30, 180, 5000, beam_factor=np.ones(len(beam)), sky_view_factor=1.0)
+        self.assertAlmostEqual(unity['annual_kwh'][0], open_sky['annual_kwh'][0], places=6)
+
+class TestOptimizeOrientation(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.inputs = site_arrays(*clear_sky_inputs())
+
+    def test_grid_surface_and_optimum(self):
+        result = optimize_orientation(self.inputs, 5000, tilt_range=(0, 60), azimuth_range=(90, 270), step=10)
+        self.assertEqual(result['surface'].shape, (7, 19))
+        self.assertEqual(result['evaluations'], 7 * 19)
+        self.assertAlmostEqual(result['annual_kwh'], result['surface'].max())
+        # Clear-sky optimum at 35.8N faces south at roughly latitude tilt
+        self.assertEqual(result['azimuth'], 180.0)
+        self.assertTrue(20 <= result['tilt'] <= 40)
+
+    def test_refinement_never_loses_to_coarse_grid(self):
+        coarse = optimize_orientation(self.inputs, 5000, step=20)
+        refined = optimize_orientation(self.inputs, 5000, step=20, fine_step=1)
+        self.assertGreaterEqual(refined['annual_kwh'], coarse['annual_kwh'])
+        self.assertGreater(refined['evaluations'], coarse['evaluations'])
+        self.assertEqual(refined['surface'].shape, coarse['surface'].shape)
+        self.assertLessEqual(abs(refined['azimuth'] - 180), 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import tempfile
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import solar_cache
+from solar_cache import SolarPositionCache, snap, SOLPOS_COLUMNS
+
+TIMES = pd.date_range('1990-01-01', periods=48, freq='h', tz='Etc/GMT+5')
+
+def fake_solarposition(times, latitude, longitude):
+    values = np.full(len(times), latitude + longitude)
+    return pd.DataFrame({name: values for name in SOLPOS_COLUMNS + ('equation_of_time',)}, index=times)
+
+class TestSolarPositionCache(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(solar_cache.pvlib.solarposition, 'get_solarposition', side_effect=fake_solarposition)
+        self.mock_solpos = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_snap_to_cell_centre(self):
+        self.assertEqual(snap(35.7912, 0.01), 35.795)
+        self.assertEqual(snap(-78.7812, 0.01), -78.785)
+        self.assertEqual(snap(35.70, 0.5), 35.75)
+
+    def test_nearby_sites_share_an_entry(self):
+        cache = SolarPositionCache(maxsize=4, cache_dir=None, grid_deg=0.01)
+        first = cache.get(TIMES, 35.7912, -78.7812)
+        second = cache.get(TIMES, 35.7988, -78.7801)
+        self.assertIs(first, second)
+        self.assertEqual(list(first.columns), list(SOLPOS_COLUMNS))
+        self.mock_solpos.assert_called_once_with(TIMES, 35.795, -78.785)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_year_is_part_of_the_key(self):
+        cache = SolarPositionCache(maxsize=4, cache_dir=None)
+        cache.get(TIMES, 35.79, -78.78)
+        cache.get(pd.date_range('1991-01-01', periods=48, freq='h', tz='Etc/GMT+5'), 35.79, -78.78)
+        self.assertEqual(self.mock_solpos.call_count, 2)
+
+    def test_lru_eviction(self):
+        cache = SolarPositionCache(maxsize=2, cache_dir=None, grid_deg=1)
+        cache.get(TIMES, 10, 10)
+        cache.get(TIMES, 20, 20)
+        cache.get(TIMES, 10, 10)  # refresh
+        cache.get(TIMES, 30, 30)  # evicts (20, 20)
+        self.assertEqual(cache.stats()['entries'], 2)
+        cache.get(TIMES, 10, 10)
+        cache.get(TIMES, 20, 20)
+        self.assertEqual(cache.stats()['misses'], 4)
+
+    def test_disk_tier_shared_between_caches(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            writer = SolarPositionCache(maxsize=2, cache_dir=cache_dir)
+            expected = writer.get(TIMES, 35.79, -78.78)
+            reader = SolarPositionCache(maxsize=2, cache_dir=cache_dir)
+            loaded = reader.get(TIMES, 35.79, -78.78)
+            pd.testing.assert_frame_equal(loaded, expected)
+            self.mock_solpos.assert_called_once()
+            self.assertEqual(reader.stats()['disk_hits'], 1)
+            self.assertEqual(reader.stats()['hit_ratio'], 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
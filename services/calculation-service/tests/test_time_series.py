@@ -0,0 +1,166 @@
+import unittest
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import pvlib
+
+from catalog import Catalog
+from layout import parse_layout, place_rows, evaluate_layouts
+from shading import ShadingResult
+from simulation import simulate_configurations, site_arrays
+from time_series import month_chunks, parse_minutes, parse_resolution, simulate_time_series, upsample
+
+LAT, LON = 35.79, -78.78
+TIMES = pd.date_range('1990-01-01', periods=8760, freq='h', tz='Etc/GMT+5')
+
+class FakeWeather:
+    """Clear-sky year shaped like weather_store.SiteWeather."""
+
+    def __init__(self):
+        solpos = pvlib.solarposition.get_solarposition(TIMES, LAT, LON)
+        clearsky = pvlib.location.Location(LAT, LON, tz='Etc/GMT+5').get_clearsky(TIMES, solar_position=solpos)
+        self.times = TIMES
+        self.solpos = solpos
+        self.columns = {
+            'ghi': clearsky['ghi'], 'dni': clearsky['dni'], 'dhi': clearsky['dhi'],
+            'temp_air': pd.Series(20.0, index=TIMES), 'wind_speed': pd.Series(2.0, index=TIMES),
+        }
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+class TestParsing(unittest.TestCase):
+
+    def test_parse_minutes(self):
+        for value in (15, '15', '15min', '15m', ' 15MIN '):
+            self.assertEqual(parse_minutes(value), 15)
+        self.assertEqual(parse_minutes('1h'), 60)
+        for value in ('0', '-5', '7.5', 'fast', True):
+            with self.assertRaises(ValueError):
+                parse_minutes(value)
+
+    def test_parse_resolution(self):
+        self.assertIsNone(parse_resolution(None))
+        self.assertEqual(parse_resolution('15min'), {"minutes": 15, "profile_minutes": None})
+        self.assertEqual(parse_resolution(5, '1h'), {"minutes": 5, "profile_minutes": 60})
+        self.assertEqual(parse_resolution(None, 1440), {"minutes": 60, "profile_minutes": 1440})
+
+    def test_parse_resolution_rejects_unsupported_steps(self):
+        for args in (('7min',), (15, 10), (60, 90), (1, 1)):
+            with self.assertRaises(ValueError, msg=args):
+                parse_resolution(*args)
+
+class TestChunking(unittest.TestCase):
+
+    def test_month_chunks_cover_the_year(self):
+        chunks = month_chunks(TIMES)
+        self.assertEqual(len(chunks), 12)
+        self.assertEqual(chunks[0], (0, 744))
+        self.assertEqual(chunks[1], (744, 744 + 672))
+        self.assertEqual(chunks[-1][1], 8760)
+
+    def test_upsample_interpolates_towards_the_next_hour(self):
+        values = np.array([0.0, 4.0, 8.0])
+        np.testing.assert_array_equal(upsample(values, 0, 2, 4), [0, 1, 2, 3, 4, 5, 6, 7])
+        # The last hour is held
+        np.testing.assert_array_equal(upsample(values, 2, 3, 2), [8, 8])
+        self.assertEqual(upsample(values, 0, 3, 1).dtype, np.float32)
+
+class TestSimulateTimeSeries(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.weather = FakeWeather()
+
+    def test_hourly_matches_batch_simulation(self):
+        expected = simulate_configurations(self.weather, self.weather.solpos, 30, 180, 5000)
+        result = simulate_time_series(self.weather, LAT, LON, 5000, solpos=self.weather.solpos)
+        self.assertEqual(result['timesteps'], 8760)
+        self.assertAlmostEqual(result['annual_kwh'], expected['annual_kwh'][0], delta=expected['annual_kwh'][0] * 1e-4)
+        self.assertAlmostEqual(result['peak_ac_w'], expected['peak_ac_w'][0], delta=1)
+        self.assertIsNone(result['profile'])
+
+    def test_sub_hourly_run_keeps_a_downsampled_profile(self):
+        hourly = simulate_time_series(self.weather, LAT, LON, 5000, solpos=self.weather.solpos)
+        result = simulate_time_series(self.weather, LAT, LON, 5000, minutes=15, profile_minutes=60)
+        self.assertEqual(result['timesteps'], 4 * 8760)
+        self.assertAlmostEqual(result['annual_kwh'], hourly['annual_kwh'], delta=hourly['annual_kwh'] * 0.02)
+        profile = result['profile']
+        self.assertEqual(len(profile['ac_w']), 8760)
+        self.assertEqual(profile['ac_w'].dtype, np.float32)
+        self.assertAlmostEqual(float(profile['ac_w'].sum(dtype=np.float64)) / 1000, result['annual_kwh'], places=1)
+
+    def test_undersized_inverter_reports_clipping(self):
+        sized = simulate_time_series(self.weather, LAT, LON, 5000, solpos=self.weather.solpos)
+        undersized = simulate_time_series(self.weather, LAT, LON, 5000, inverter_pdc0=2500, solpos=self.weather.solpos)
+        self.assertGreater(undersized['clipping_loss_kwh'], sized['clipping_loss_kwh'])
+        self.assertLess(undersized['annual_kwh'], sized['annual_kwh'])
+        self.assertLessEqual(undersized['peak_ac_w'], 2500 * 0.96 + 1e-3)
+
+    def test_shading_is_resampled_at_fine_steps(self):
+        # A 30 degree horizon all round
+        azimuths = np.arange(0, 360, 1.0)
+        horizons = np.full((1, len(azimuths)), 30.0)
+        shading = ShadingResult(azimuths, horizons, np.ones(8760, dtype=np.float32), 0.75, 0.0)
+        result = simulate_time_series(self.weather, LAT, LON, 5000, minutes=30, shading=shading)
+        self.assertGreater(result['shading_loss_pct'], 0.05)
+        self.assertLess(result['net_annual_kwh'], result['annual_kwh'])
+
+    def test_row_shading_applies_to_every_case(self):
+        rows = place_rows(parse_layout({"gcr": 0.6, "tilt": 30}))
+        open_field = simulate_time_series(self.weather, LAT, LON, 5000, solpos=self.weather.solpos)
+        result = simulate_time_series(self.weather, LAT, LON, 5000, solpos=self.weather.solpos, rows=rows)
+        self.assertIsNone(open_field['row_shading_loss_pct'])
+        self.assertLess(result['annual_kwh'], open_field['annual_kwh'])
+        self.assertEqual(result['shading_loss_pct'], 0.0)
+        # The month-chunked float32 run agrees with the batched layout comparison
+        inputs = site_arrays(self.weather, self.weather.solpos)
+        expected = evaluate_layouts(inputs, [rows], 1.0)['row_shading_loss_pct'][0]
+        self.assertAlmostEqual(result['row_shading_loss_pct'], expected, delta=1e-4)
+
+    def test_stored_poa_reproduces_the_run(self):
+        first = simulate_time_series(self.weather, LAT, LON, 5000, solpos=self.weather.solpos)
+        self.assertEqual(first['poa']['direct'].shape, (8760,))
+        again = simulate_time_series(self.weather, LAT, LON, 5000, solpos=self.weather.solpos, poa=first['poa'])
+        self.assertAlmostEqual(again['annual_kwh'], first['annual_kwh'], delta=first['annual_kwh'] * 1e-6)
+        self.assertAlmostEqual(again['poa_kwh_m2'], first['poa_kwh_m2'], delta=first['poa_kwh_m2'] * 1e-6)
+        # Sub-hourly runs keep no POA to store
+        self.assertIsNone(simulate_time_series(self.weather, LAT, LON, 5000, minutes=30)['poa'])
+
+    def test_hourly_series_sum_to_the_annual_totals(self):
+        for minutes in (60, 15):
+            result = simulate_time_series(self.weather, LAT, LON, 5000, minutes=minutes, solpos=self.weather.solpos)
+            hourly = result['hourly']
+            self.assertEqual(hourly['ac_w'].shape, (8760,))
+            self.assertEqual(hourly['ac_w'].dtype, np.float32)
+            self.assertAlmostEqual(float(hourly['ac_w'].sum(dtype=np.float64)) / 1000, result['annual_kwh'],
+                                   delta=result['annual_kwh'] * 1e-5)
+            self.assertAlmostEqual(float(hourly['dc_w'].sum(dtype=np.float64)) / 1000, result['dc_kwh'],
+                                   delta=result['dc_kwh'] * 1e-5)
+            self.assertAlmostEqual(float(hourly['poa_w_m2'].sum(dtype=np.float64)) / 1000, result['poa_kwh_m2'],
+                                   delta=result['poa_kwh_m2'] * 1e-5)
+
+    def test_catalog_system_yield_is_close_to_pvwatts(self):
+        system = Catalog.load().resolve({"count": 20})
+        pvwatts = simulate_time_series(self.weather, LAT, LON, system['pdc0'], solpos=self.weather.solpos)
+        result = simulate_time_series(self.weather, LAT, LON, solpos=self.weather.solpos, system=system)
+        self.assertAlmostEqual(result['annual_kwh'], pvwatts['annual_kwh'], delta=pvwatts['annual_kwh'] * 0.1)
+        self.assertLess(result['annual_kwh'], result['dc_kwh'])
+        self.assertLessEqual(result['peak_ac_w'], system['inverter']['paco_w'] * system['inverters'] + 1e-3)
+
+    def test_stage_callback_is_entered_per_chunk(self):
+        entered = []
+
+        @contextmanager
+        def stage(name):
+            entered.append(name)
+            yield
+
+        simulate_time_series(self.weather, LAT, LON, 5000, solpos=self.weather.solpos, stage=stage)
+        self.assertEqual(entered.count('solar_position'), 12)
+        self.assertEqual(entered.count('power'), 12)
+        self.assertEqual(set(entered), {'solar_position', 'irradiance', 'temperature', 'power'})
+
+if __name__ == '__main__':
+    unittest.main()
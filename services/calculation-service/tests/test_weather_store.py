@@ -0,0 +1,69 @@
+import unittest
+import os
+import tempfile
+
+import numpy as np
+
+from weather_store import WeatherStore, WeatherStoreError, write_store, utc_offset_tz, WEATHER_COLUMNS, HOURS_PER_YEAR
+
+STATIONS = [
+    {'name': 'Raleigh', 'lat': 35.87, 'lon': -78.78, 'elevation': 130, 'utc_offset': -5},
+    {'name': 'Denver', 'lat': 39.83, 'lon': -104.65, 'elevation': 1650, 'utc_offset': -7},
+    {'name': 'Sydney', 'lat': -33.95, 'lon': 151.18, 'elevation': 6, 'utc_offset': 10},
+]
+
+class TestWeatherStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        # Each station's columns are filled with its row number for easy checks
+        columns = {
+            name: np.repeat(np.arange(len(STATIONS), dtype=np.float32)[:, None], HOURS_PER_YEAR, axis=1)
+            for name in WEATHER_COLUMNS
+        }
+        write_store(self.tmpdir.name, STATIONS, columns)
+        self.store = WeatherStore(self.tmpdir.name)
+
+    def test_columns_are_memory_mapped(self):
+        self.assertEqual(len(self.store), 3)
+        for name in WEATHER_COLUMNS:
+            self.assertIsInstance(self.store.columns[name], np.memmap)
+
+    def test_nearest_station(self):
+        index, distance_km = self.store.nearest(35.79, -78.63)
+        self.assertEqual(index, 0)
+        self.assertLess(distance_km, 20)
+        self.assertEqual(self.store.nearest(39.7, -105.0)[0], 1)
+        # Crossing the antimeridian still finds Sydney
+        self.assertEqual(self.store.nearest(-34.0, 151.2 - 360)[0], 2)
+
+    def test_site_weather_is_zero_copy_slice(self):
+        weather = self.store.site_weather(35.79, -78.63)
+        self.assertEqual(weather.station['name'], 'Raleigh')
+        self.assertEqual(weather.tz, 'Etc/GMT+5')
+        self.assertEqual(len(weather.times), HOURS_PER_YEAR)
+        ghi = weather['ghi']
+        self.assertTrue(np.shares_memory(ghi.to_numpy(), self.store.columns['ghi']))
+        self.assertTrue((ghi == 0).all())
+
+    def test_site_too_far_from_any_station(self):
+        with self.assertRaises(WeatherStoreError):
+            self.store.site_weather(64.1, -21.9, max_km=250)
+
+    def test_missing_store(self):
+        with self.assertRaises(WeatherStoreError):
+            WeatherStore(os.path.join(self.tmpdir.name, 'missing'))
+
+    def test_write_store_validates_shape(self):
+        columns = {name: np.zeros((1, 24)) for name in WEATHER_COLUMNS}
+        with self.assertRaises(ValueError):
+            write_store(self.tmpdir.name, STATIONS[:1], columns)
+
+    def test_utc_offset_tz(self):
+        self.assertEqual(utc_offset_tz(-8), 'Etc/GMT+8')
+        self.assertEqual(utc_offset_tz(10), 'Etc/GMT-10')
+        self.assertEqual(utc_offset_tz(0), 'Etc/GMT')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,265 @@
+"""Single-site simulation at a configurable time resolution.
+
+The weather store holds hourly TMY. For finer steps the hourly columns are
+linearly interpolated and solar position is computed at the fine
+timestamps. The solpos -> POA -> cell temperature -> DC -> AC chain runs one
+calendar month at a time on float32 arrays; only running totals, hourly
+means and, optionally, a profile averaged down to ``profile_minutes``
+outlive a chunk, so peak memory is set by the longest month and stays
+flat as the resolution gets finer (a 1-minute month is about 45k steps).
+
+DC and AC use PVWatts from ``pdc0``, or, for a catalog ``system`` (see
+:meth:`catalog.Catalog.resolve`), the CEC single-diode module model and the
+Sandia inverter model for the resolved module, stringing and inverters.
+
+Interpolated hourly weather has none of the sub-hourly cloud variability
+that real 1- or 5-minute data shows, so clipping estimated this way is a
+lower bound.
+"""
+import os
+from contextlib import nullcontext
+
+import numpy as np
+import pandas as pd
+import pvlib
+
+from simulation import (temperature_model_parameters, DEFAULT_GAMMA_PDC, DEFAULT_DC_AC_RATIO,
+                        DEFAULT_ETA_INV_NOM, DEFAULT_ALBEDO)
+
+TIME_RESOLUTIONS_MIN = (60, 30, 15, 10, 5, 1)
+PROFILE_MAX_POINTS = int(os.getenv('PROFILE_MAX_POINTS', str(4 * 8760)))
+MINUTES_PER_DAY = 1440
+
+
+def parse_minutes(value):
+    """Minutes from ``15``, ``"15"``, ``"15min"``, ``"15m"`` or ``"1h"``."""
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid duration {value!r}")
+    if isinstance(value, (int, float)):
+        minutes = float(value)
+    else:
+        text = str(value).strip().lower()
+        for suffix, factor in (('min', 1), ('m', 1), ('h', 60)):
+            if text.endswith(suffix):
+                minutes = float(text[:-len(suffix)]) * factor
+                break
+        else:
+            minutes = float(text)
+    if minutes <= 0 or minutes != int(minutes):
+        raise ValueError(f"Invalid duration {value!r}; expected a whole number of minutes")
+    return int(minutes)
+
+
+def parse_resolution(time_resolution, profile_resolution=None):
+    """``{"minutes", "profile_minutes"}`` for a request, or None when neither is set.
+
+    ``profile_minutes`` must be a multiple of the step that divides a day, so
+    profile intervals never straddle a month chunk.
+    """
+    if time_resolution is None and profile_resolution is None:
+        return None
+    minutes = parse_minutes(time_resolution) if time_resolution is not None else 60
+    if minutes not in TIME_RESOLUTIONS_MIN:
+        raise ValueError(f"time_resolution must be one of {', '.join(map(str, TIME_RESOLUTIONS_MIN))} minutes")
+    profile_minutes = None
+    if profile_resolution is not None:
+        profile_minutes = parse_minutes(profile_resolution)
+        if profile_minutes % minutes or MINUTES_PER_DAY % profile_minutes:
+            raise ValueError("profile_resolution must be a multiple of time_resolution that divides a day")
+        if 365 * MINUTES_PER_DAY // profile_minutes > PROFILE_MAX_POINTS:
+            raise ValueError(f"profile_resolution would exceed {PROFILE_MAX_POINTS} points")
+    return {"minutes": minutes, "profile_minutes": profile_minutes}
+
+
+def month_chunks(times):
+    """``(start, stop)`` positions of each calendar month in an hourly index."""
+    edges = np.flatnonzero(np.diff(times.month)) + 1
+    bounds = np.concatenate(([0], edges, [len(times)]))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def upsample(values, start, stop, steps):
+    """Hourly ``values[start:stop]`` linearly interpolated to ``steps`` per hour, as float32.
+
+    Each hour is interpolated towards the next one; the last hour of the
+    year is held.
+    """
+    hourly = np.asarray(values[start:min(stop + 1, len(values))], dtype=np.float32)
+    if steps == 1:
+        return hourly[:stop - start]
+    if len(hourly) == stop - start:
+        hourly = np.append(hourly, hourly[-1])
+    fraction = np.arange(steps, dtype=np.float32) / steps
+    return (hourly[:-1, None] + (hourly[1:, None] - hourly[:-1, None]) * fraction).ravel()
+
+
+def _f32(values):
+    return np.nan_to_num(np.asarray(values, dtype=np.float32))
+
+
+def system_power(poa_global, cell_temperature, system):
+    """DC and AC watts of a catalog system, plus DC beyond the inverters' rating.
+
+    Modules follow the CEC single-diode model at their maximum power
+    point; the string voltage feeds the Sandia inverter model. Night steps
+    are skipped rather than solved.
+    """
+    dc = np.zeros(poa_global.shape, dtype=np.float32)
+    v_dc = np.zeros(poa_global.shape, dtype=np.float32)
+    lit = poa_global > 0
+    if lit.any():
+        photocurrent, saturation_current, resistance_series, resistance_shunt, nNsVth = pvlib.pvsystem.calcparams_cec(
+            poa_global[lit].astype(float), np.asarray(cell_temperature, dtype=float)[lit], **system['module']['params']
+        )
+        mpp = pvlib.pvsystem.max_power_point(photocurrent, saturation_current, resistance_series, resistance_shunt,
+                                             nNsVth, method='newton')
+        dc[lit] = np.clip(_f32(mpp['p_mp']), 0, None) * system['modules']
+        v_dc[lit] = np.clip(_f32(mpp['v_mp']), 0, None) * system['modules_per_string']
+    inverter = system['inverter']['params']
+    inverters = system['inverters']
+    per_inverter = dc / inverters
+    ac = np.clip(_f32(pvlib.inverter.sandia(v_dc, per_inverter, inverter)), 0, None) * inverters
+    clipped = np.clip(per_inverter - inverter['Pdco'], 0, None) * inverters * (inverter['Paco'] / inverter['Pdco'])
+    return dc, ac, clipped
+
+
+def simulate_time_series(weather, latitude, longitude, pdc0=None, minutes=60, profile_minutes=None,
+                         surface_tilt=30, surface_azimuth=180, gamma_pdc=DEFAULT_GAMMA_PDC,
+                         inverter_pdc0=None, eta_inv_nom=DEFAULT_ETA_INV_NOM, albedo=DEFAULT_ALBEDO,
+                         temperature_params=None, shading=None, solpos=None, stage=None, system=None,
+                         rows=None, poa=None):
+    """Annual totals for one array at ``minutes`` resolution, month by month.
+
+    With a catalog ``system`` the PVWatts arguments (``pdc0``, ``gamma_pdc``,
+    ``inverter_pdc0``, ``eta_inv_nom``) are ignored.
+
+    ``shading`` is a :class:`shading.ShadingResult`; its horizons are
+    re-sampled at the fine sun positions. ``rows`` is a ground-mount
+    :class:`layout.RowLayout`; its row-to-row shading applies to every case,
+    so ``shading_loss_pct`` stays the LIDAR horizon's share. Hourly runs
+    return the year's open-field POA components as ``poa``; passing them
+    back (``poa``, for the same orientation and albedo) skips the
+    irradiance transposition. ``hourly`` holds the reported case's AC, DC
+    and effective POA as hourly float32 means at any resolution (see
+    :mod:`profiles`). ``solpos`` (hourly, e.g. from the
+    solar position cache) is reused when ``minutes`` is 60. ``stage(name)``
+    is entered around each step of every chunk, so a job's stage timings
+    add up across months.
+    """
+    stage = stage or (lambda name: nullcontext())
+    params = temperature_params or temperature_model_parameters()
+    if system is not None:
+        pdc0 = system['pdc0']
+    if inverter_pdc0 is None:
+        inverter_pdc0 = pdc0 / DEFAULT_DC_AC_RATIO
+    steps = 60 // minutes
+    step_hours = minutes / 60
+    profile_block = profile_minutes // minutes if profile_minutes else None
+    times = weather.times
+    # The rated AC output; DC beyond what it can convert is clipped
+    pac0 = eta_inv_nom * inverter_pdc0
+
+    cases = ('unshaded', 'shaded') if shading is not None else ('unshaded',)
+    ac_wh = dict.fromkeys(cases, 0.0)
+    dc_wh = dict.fromkeys(cases, 0.0)
+    clipped_wh = dict.fromkeys(cases, 0.0)
+    peak_ac_w = dict.fromkeys(cases, 0.0)
+    poa_wh_m2 = 0.0
+    open_poa_wh_m2 = 0.0
+    profile = []
+    hourly = {name: [] for name in ('ac_w', 'dc_w', 'poa_w_m2')}
+    components = {name: [] for name in ('direct', 'sky', 'ground')} if steps == 1 else None
+    timesteps = 0
+
+    columns = {name: weather[name].to_numpy() for name in ('ghi', 'dni', 'dhi', 'temp_air', 'wind_speed')}
+    for start, stop in month_chunks(times):
+        with stage('solar_position'):
+            if steps == 1 and solpos is not None:
+                zenith = _f32(solpos['apparent_zenith'].to_numpy()[start:stop])
+                sun_azimuth = _f32(solpos['azimuth'].to_numpy()[start:stop])
+            else:
+                chunk_times = pd.date_range(times[start], periods=(stop - start) * steps, freq=f'{minutes}min')
+                position = pvlib.solarposition.get_solarposition(chunk_times, latitude, longitude)
+                zenith = _f32(position['apparent_zenith'].to_numpy())
+                sun_azimuth = _f32(position['azimuth'].to_numpy())
+            chunk = {name: upsample(values, start, stop, steps) for name, values in columns.items()}
+            if steps > 1:
+                # Interpolation smears irradiance past sunrise and sunset
+                night = zenith >= 90
+                for name in ('ghi', 'dni', 'dhi'):
+                    chunk[name][night] = 0
+
+        with stage('irradiance'):
+            if poa is not None and steps == 1:
+                poa_direct, poa_sky, poa_ground = (_f32(poa[name][start:stop]) for name in ('direct', 'sky', 'ground'))
+            else:
+                transposed = pvlib.irradiance.get_total_irradiance(
+                    surface_tilt, surface_azimuth, zenith, sun_azimuth,
+                    chunk['dni'], chunk['ghi'], chunk['dhi'], albedo=albedo
+                )
+                poa_direct = _f32(transposed['poa_direct'])
+                poa_sky = _f32(transposed['poa_sky_diffuse'])
+                poa_ground = _f32(transposed['poa_ground_diffuse'])
+                del transposed
+            if components is not None:
+                for name, values in (('direct', poa_direct), ('sky', poa_sky), ('ground', poa_ground)):
+                    components[name].append(values)
+            if rows is not None:
+                open_poa_wh_m2 += float((poa_direct + poa_sky + poa_ground).sum(dtype=np.float64)) * step_hours
+                poa_direct = poa_direct * rows.beam_factor_at(sun_azimuth, 90 - zenith)
+                poa_sky = poa_sky * np.float32(rows.sky_factor)
+            poa_global = {'unshaded': poa_direct + poa_sky + poa_ground}
+            if shading is not None:
+                if steps == 1:
+                    beam = np.asarray(shading.beam_factor, dtype=np.float32)[start:stop]
+                else:
+                    beam = shading.beam_factor_at(sun_azimuth, 90 - zenith)
+                poa_global['shaded'] = poa_direct * beam + poa_sky * np.float32(shading.sky_view_factor) + poa_ground
+            del poa_direct, poa_sky, poa_ground
+            poa_wh_m2 += float(poa_global['unshaded'].sum(dtype=np.float64)) * step_hours
+
+        for case in cases:
+            with stage('temperature'):
+                cell_temperature = pvlib.temperature.sapm_cell(
+                    poa_global[case], chunk['temp_air'], chunk['wind_speed'], params['a'], params['b'], params['deltaT']
+                )
+            with stage('power'):
+                if system is not None:
+                    dc, ac, clipped = system_power(poa_global[case], cell_temperature, system)
+                else:
+                    dc = _f32(pvlib.pvsystem.pvwatts_dc(poa_global[case], cell_temperature, pdc0, gamma_pdc))
+                    ac = np.clip(_f32(pvlib.inverter.pvwatts(dc, inverter_pdc0, eta_inv_nom)), 0, None)
+                    clipped = np.clip(dc * eta_inv_nom - pac0, 0, None)
+                ac_wh[case] += float(ac.sum(dtype=np.float64)) * step_hours
+                dc_wh[case] += float(dc.sum(dtype=np.float64)) * step_hours
+                clipped_wh[case] += float(clipped.sum(dtype=np.float64)) * step_hours
+                peak_ac_w[case] = max(peak_ac_w[case], float(ac.max(initial=0)))
+                if case == cases[-1]:
+                    if profile_block:
+                        profile.append(ac.reshape(-1, profile_block).mean(axis=1, dtype=np.float32))
+                    for name, values in (('ac_w', ac), ('dc_w', dc), ('poa_w_m2', poa_global[case])):
+                        hourly[name].append(values.reshape(-1, steps).mean(axis=1, dtype=np.float32))
+        timesteps += (stop - start) * steps
+
+    reported = cases[-1]
+    annual_kwh = ac_wh['unshaded'] / 1000
+    net_annual_kwh = ac_wh[reported] / 1000
+    return {
+        "minutes": minutes,
+        "timesteps": timesteps,
+        "annual_kwh": annual_kwh,
+        "net_annual_kwh": net_annual_kwh,
+        "shading_loss_pct": 1 - net_annual_kwh / annual_kwh if annual_kwh > 0 else 0.0,
+        "dc_kwh": dc_wh[reported] / 1000,
+        "clipping_loss_kwh": clipped_wh[reported] / 1000,
+        "peak_ac_w": peak_ac_w[reported],
+        "poa_kwh_m2": poa_wh_m2 / 1000,
+        "row_shading_loss_pct": 1 - poa_wh_m2 / open_poa_wh_m2 if open_poa_wh_m2 > 0 else None,
+        "poa": {name: np.concatenate(values) for name, values in components.items()} if components else None,
+        "hourly": {name: np.concatenate(values) for name, values in hourly.items()},
+        "profile": {
+            "minutes": profile_minutes,
+            "start": times[0].isoformat(),
+            "ac_w": np.concatenate(profile),
+        } if profile_block else None,
+    }
@@ -0,0 +1,177 @@
+"""Offline typical-year weather store.
+
+TMY3/EPW files are bulk-loaded once into one ``.npy`` file per weather column
+(shape ``stations x 8760``, float32) plus a station table. Workers open the
+columns with ``mmap_mode='r'`` and look up the nearest station with a KD-tree
+over unit-sphere coordinates, so weather for a site is a zero-copy row slice.
+
+Build a store with::
+
+    python weather_store.py build data/weather path/to/*.epw path/to/*.csv
+"""
+import os
+import json
+import argparse
+import threading
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+WEATHER_STORE_DIR = os.getenv(
+    'WEATHER_STORE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'weather')
+)
+WEATHER_MAX_STATION_KM = float(os.getenv('WEATHER_MAX_STATION_KM', '250'))
+
+WEATHER_COLUMNS = ('ghi', 'dni', 'dhi', 'temp_air', 'wind_speed')
+HOURS_PER_YEAR = 8760
+EARTH_RADIUS_KM = 6371.0
+STATIONS_FILE = 'stations.json'
+
+
+class WeatherStoreError(Exception):
+    """Raised when the store is missing or has no station near a site."""
+
+
+def _unit_vectors(lat, lon):
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+def _chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+def utc_offset_tz(utc_offset_hours):
+    """pytz-style fixed-offset zone; TMY data is always in local standard time."""
+    offset = int(round(utc_offset_hours))
+    # The Etc/GMT sign convention is inverted (Etc/GMT+5 is UTC-5)
+    return 'Etc/GMT' + ('' if offset == 0 else f'{-offset:+d}')
+
+
+class SiteWeather:
+    """Weather for one station as zero-copy Series over the store's memmaps."""
+
+    def __init__(self, station, distance_km, columns, year):
+        self.station = station
+        self.distance_km = distance_km
+        self.tz = utc_offset_tz(station['utc_offset'])
+        self.times = pd.date_range(f'{year}-01-01', periods=HOURS_PER_YEAR, freq='h', tz=self.tz)
+        self.columns = {
+            name: pd.Series(values, index=self.times, name=name, copy=False)
+            for name, values in columns.items()
+        }
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+
+class WeatherStore:
+    """Read-only view over a store directory written by :func:`write_store`."""
+
+    def __init__(self, path=WEATHER_STORE_DIR):
+        stations_path = os.path.join(path, STATIONS_FILE)
+        if not os.path.exists(stations_path):
+            raise WeatherStoreError(f"No weather store at {path}")
+        with open(stations_path) as f:
+            self.stations = json.load(f)
+        if not self.stations:
+            raise WeatherStoreError(f"Weather store at {path} has no stations")
+        self.path = path
+        self.columns = {
+            name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+            for name in WEATHER_COLUMNS
+        }
+        self._tree = cKDTree(_unit_vectors(
+            [s['lat'] for s in self.stations], [s['lon'] for s in self.stations]
+        ))
+
+    def __len__(self):
+        return len(self.stations)
+
+    def nearest(self, lat, lon):
+        """Index of and great-circle distance in km to the closest station."""
+        chord, index = self._tree.query(_unit_vectors(lat, lon)[0])
+        return int(index), float(_chord_to_km(chord))
+
+    def site_weather(self, lat, lon, year=1990, max_km=WEATHER_MAX_STATION_KM):
+        index, distance_km = self.nearest(lat, lon)
+        if distance_km > max_km:
+            raise WeatherStoreError(
+                f"Nearest weather station is {distance_km:.0f} km from ({lat}, {lon})"
+            )
+        columns = {name: data[index] for name, data in self.columns.items()}
+        return SiteWeather(self.stations[index], distance_km, columns, year)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_weather_store():
+    """Open the configured store once per worker process."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = WeatherStore(WEATHER_STORE_DIR)
+    return _store
+
+
+def write_store(path, stations, columns):
+    """Write station metadata and ``stations x 8760`` column arrays to ``path``."""
+    os.makedirs(path, exist_ok=True)
+    for name in WEATHER_COLUMNS:
+        data = np.asarray(columns[name], dtype=np.float32)
+        if data.shape != (len(stations), HOURS_PER_YEAR):
+            raise ValueError(f"Column {name} has shape {data.shape}, expected ({len(stations)}, {HOURS_PER_YEAR})")
+        np.save(os.path.join(path, f'{name}.npy'), data)
+    with open(os.path.join(path, STATIONS_FILE), 'w') as f:
+        json.dump(stations, f)
+
+
+def read_weather_file(filename):
+    """Parse a TMY3 CSV or EPW file into station metadata and hourly columns."""
+    from pvlib import iotools
+
+    if filename.lower().endswith('.epw'):
+        data, meta = iotools.read_epw(filename)
+        station = {'name': meta.get('city'), 'lat': meta['latitude'], 'lon': meta['longitude'],
+                   'elevation': meta.get('altitude'), 'utc_offset': meta['TZ']}
+    else:
+        data, meta = iotools.read_tmy3(filename, map_variables=True)
+        station = {'name': meta.get('Name'), 'lat': meta['latitude'], 'lon': meta['longitude'],
+                   'elevation': meta.get('altitude'), 'utc_offset': meta['TZ']}
+    station['source'] = os.path.basename(filename)
+
+    # Leap-day hours are dropped so every station lines up on the same 8760 grid
+    index = data.index
+    data = data[~((index.month == 2) & (index.day == 29))]
+    if len(data) != HOURS_PER_YEAR:
+        raise ValueError(f"{filename} has {len(data)} hourly rows, expected {HOURS_PER_YEAR}")
+    return station, {name: data[name].to_numpy(dtype=np.float32) for name in WEATHER_COLUMNS}
+
+
+def build_store(path, filenames):
+    """Bulk-load weather files into a new store at ``path``."""
+    stations = []
+    columns = {name: np.empty((len(filenames), HOURS_PER_YEAR), dtype=np.float32) for name in WEATHER_COLUMNS}
+    for row, filename in enumerate(filenames):
+        station, values = read_weather_file(filename)
+        stations.append(station)
+        for name in WEATHER_COLUMNS:
+            columns[name][row] = values[name]
+    write_store(path, stations, columns)
+    return len(stations)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help='Bulk-load TMY3/EPW files into a store')
+    build.add_argument('path')
+    build.add_argument('files', nargs='+')
+    args = parser.parse_args()
+    count = build_store(args.path, args.files)
+    print(f"Wrote {count} stations to {args.path}")
@@ -0,0 +1,233 @@
+"""Pooled PostgreSQL connections shared by the Flask services.
+
+Each service builds one :class:`ConnectionPool` at import time with its own
+sizing; ``DB_POOL_MIN``/``DB_POOL_MAX`` set in a container's environment
+override it. ``pool.getconn()`` hands out a :class:`PooledConnection` that
+behaves like a psycopg2 connection except that ``close()`` returns it to the
+pool, so existing ``conn = get_db_connection() ... conn.close()`` call sites
+keep working unchanged.
+
+Connections that have been idle longer than ``idle_timeout`` are closed down
+to ``minconn`` whenever the pool is used (the docker-compose health probes
+keep that happening on quiet services). A connection idle for more than
+``check_after`` seconds is pinged before it is handed out, and connections
+that come back closed or in an unknown transaction state are discarded and
+replaced, so a database restart costs one failed ping rather than a failed
+request.
+"""
+import os
+import time
+import logging
+import threading
+
+import psycopg2
+from psycopg2 import extensions
+
+# Unset sizing variables fall back to the defaults each service passes in
+DB_POOL_MIN = os.getenv('DB_POOL_MIN')
+DB_POOL_MAX = os.getenv('DB_POOL_MAX')
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv('DB_POOL_TIMEOUT_SECONDS', '10'))
+DB_POOL_IDLE_SECONDS = float(os.getenv('DB_POOL_IDLE_SECONDS', '300'))
+DB_POOL_CHECK_SECONDS = float(os.getenv('DB_POOL_CHECK_SECONDS', '30'))
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """No connection became free within the checkout timeout."""
+
+
+class PooledConnection:
+    """A checked-out connection; ``close()`` gives it back to the pool."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise psycopg2.InterfaceError("connection already returned to the pool")
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Same as psycopg2: commit or roll back the transaction, keep the connection
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.putconn(conn)
+
+    def discard(self):
+        """Close the underlying connection instead of reusing it."""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.putconn(conn, discard=True)
+
+    def __del__(self):
+        if getattr(self, '_conn', None) is not None:
+            self.close()
+
+
+class ConnectionPool:
+    """Thread-safe LIFO pool of psycopg2 connections with checkout metrics."""
+
+    def __init__(self, dsn, minconn=None, maxconn=None, timeout=None, idle_timeout=None,
+                 check_after=None, connect=psycopg2.connect):
+        self.dsn = dsn
+        self.minconn = int(DB_POOL_MIN or (1 if minconn is None else minconn))
+        self.maxconn = max(int(DB_POOL_MAX or (5 if maxconn is None else maxconn)), 1)
+        self.timeout = DB_POOL_TIMEOUT_SECONDS if timeout is None else timeout
+        self.idle_timeout = DB_POOL_IDLE_SECONDS if idle_timeout is None else idle_timeout
+        self.check_after = DB_POOL_CHECK_SECONDS if check_after is None else check_after
+        self._connect = connect
+        self._idle = []  # (connection, returned_at); most recently used last
+        self._size = 0  # open connections, idle and checked out
+        self._cond = threading.Condition()
+        self._last_reap = time.monotonic()
+        self.connects = 0
+        self.discarded = 0
+        self.reaped = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+
+    def getconn(self, timeout=None):
+        """Check out a live connection, waiting up to ``timeout`` seconds for one."""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = None
+        with self._cond:
+            self._reap_idle()
+            while True:
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    self._size += 1
+                    conn, returned_at = None, None
+                    break
+                now = time.monotonic()
+                if deadline is None:
+                    deadline = now + timeout
+                    self.waits += 1
+                    wait_start = now
+                remaining = deadline - now
+                if remaining <= 0:
+                    self.timeouts += 1
+                    self._record_wait(now - wait_start)
+                    raise PoolTimeout(f"No database connection available within {timeout:.1f}s")
+                self._cond.wait(remaining)
+            if deadline is not None:
+                self._record_wait(time.monotonic() - wait_start)
+            self.checkouts += 1
+
+        # Connecting and pinging happen outside the lock
+        if conn is not None and not self._usable(conn, returned_at):
+            self._close(conn)
+            with self._cond:
+                self.discarded += 1
+            conn = None
+        if conn is None:
+            try:
+                conn = self._connect(self.dsn)
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self.checkouts -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self.connects += 1
+        return PooledConnection(self, conn)
+
+    def putconn(self, conn, discard=False):
+        """Return a raw connection; broken or discarded ones are closed."""
+        if not discard and not conn.closed:
+            try:
+                status = conn.info.transaction_status
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    discard = True
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    # Never leak an open transaction to the next borrower
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard or conn.closed:
+            self._close(conn)
+            with self._cond:
+                self._size -= 1
+                self.discarded += 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _usable(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error as e:
+            logger.warning(f"Discarding broken pooled connection: {e}")
+            return False
+
+    def _record_wait(self, seconds):
+        self.wait_seconds += seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def _reap_idle(self):
+        """Close connections idle past ``idle_timeout`` down to ``minconn``. Caller holds the lock."""
+        now = time.monotonic()
+        if now - self._last_reap < min(self.idle_timeout, 60):
+            return
+        self._last_reap = now
+        # Oldest idle connections are at the front
+        while self._idle and self._size > self.minconn and now - self._idle[0][1] > self.idle_timeout:
+            conn, _ = self._idle.pop(0)
+            self._close(conn)
+            self._size -= 1
+            self.reaped += 1
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def closeall(self):
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._close(conn)
+                self._size -= 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "checked_out": self._size - len(self._idle),
+                "min": self.minconn,
+                "max": self.maxconn,
+                "checkouts": self.checkouts,
+                "connects": self.connects,
+                "discarded": self.discarded,
+                "reaped": self.reaped,
+                "waits": self.waits,
+                "wait_seconds_total": round(self.wait_seconds, 4),
+                "max_wait_seconds": round(self.max_wait_seconds, 4),
+                "timeouts": self.timeouts,
+            }
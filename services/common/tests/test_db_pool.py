@@ -0,0 +1,130 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+import psycopg2
+from psycopg2 import extensions
+
+from db_pool import ConnectionPool, PoolTimeout
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = 0
+        self.info = mock.Mock(transaction_status=extensions.TRANSACTION_STATUS_IDLE)
+        self.rollbacks = 0
+        self.ping_error = None
+
+    def cursor(self):
+        cur = mock.MagicMock()
+        cur.__enter__.return_value = cur
+        if self.ping_error:
+            cur.execute.side_effect = self.ping_error
+        return cur
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+def make_pool(**kwargs):
+    connections = []
+    def connect(dsn):
+        connections.append(FakeConnection())
+        return connections[-1]
+    kwargs.setdefault('minconn', 1)
+    kwargs.setdefault('maxconn', 2)
+    return ConnectionPool('postgresql://test', connect=connect, **kwargs), connections
+
+class TestConnectionPool(unittest.TestCase):
+
+    def test_close_returns_connection_for_reuse(self):
+        pool, connections = make_pool()
+        conn = pool.getconn()
+        conn.close()
+        pool.getconn().close()
+        self.assertEqual(len(connections), 1)
+        stats = pool.stats()
+        self.assertEqual((stats['checkouts'], stats['connects'], stats['idle'], stats['checked_out']), (2, 1, 1, 0))
+
+    def test_returned_connection_cannot_be_used(self):
+        pool, _ = make_pool()
+        conn = pool.getconn()
+        conn.close()
+        with self.assertRaises(psycopg2.InterfaceError):
+            conn.cursor()
+
+    def test_open_transaction_is_rolled_back_on_return(self):
+        pool, connections = make_pool()
+        conn = pool.getconn()
+        connections[0].info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+        conn.close()
+        self.assertEqual(connections[0].rollbacks, 1)
+        self.assertEqual(pool.stats()['idle'], 1)
+
+    def test_broken_connection_is_discarded_on_return(self):
+        pool, connections = make_pool()
+        conn = pool.getconn()
+        connections[0].closed = 2
+        conn.close()
+        pool.getconn()
+        self.assertEqual(len(connections), 2)
+        self.assertEqual(pool.stats()['discarded'], 1)
+
+    def test_stale_connection_failing_ping_is_replaced(self):
+        pool, connections = make_pool(check_after=0)
+        pool.getconn().close()
+        connections[0].ping_error = psycopg2.OperationalError("server closed the connection")
+        conn = pool.getconn()
+        self.assertIs(conn._conn, connections[1])
+        self.assertEqual(connections[0].closed, 1)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_waits_for_a_free_connection(self):
+        pool, _ = make_pool(maxconn=1)
+        held = pool.getconn()
+        threading.Timer(0.05, held.close).start()
+        pool.getconn(timeout=2)
+        stats = pool.stats()
+        self.assertEqual(stats['waits'], 1)
+        self.assertGreater(stats['wait_seconds_total'], 0)
+
+    def test_times_out_when_exhausted(self):
+        pool, _ = make_pool(maxconn=1)
+        held = pool.getconn()
+        with self.assertRaises(PoolTimeout):
+            pool.getconn(timeout=0.01)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+        held.close()
+
+    def test_leaked_connection_returns_when_collected(self):
+        pool, _ = make_pool(maxconn=1)
+        pool.getconn()
+        pool.getconn(timeout=0.01)
+        self.assertEqual(pool.stats()['connects'], 1)
+
+    def test_failed_connect_frees_the_slot(self):
+        pool = ConnectionPool('postgresql://test', minconn=0, maxconn=1,
+                              connect=mock.Mock(side_effect=[psycopg2.OperationalError("down"), FakeConnection()]))
+        with self.assertRaises(psycopg2.OperationalError):
+            pool.getconn()
+        pool.getconn(timeout=0.01)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_idle_connections_are_reaped_down_to_minimum(self):
+        pool, connections = make_pool(minconn=1, maxconn=3, idle_timeout=0.01)
+        held = [pool.getconn() for _ in range(3)]
+        for conn in held:
+            conn.close()
+        time.sleep(0.02)
+        pool.getconn()
+        stats = pool.stats()
+        self.assertEqual(stats['reaped'], 2)
+        self.assertEqual(stats['size'], 1)
+        self.assertEqual(sum(c.closed for c in connections), 2)
+
+if __name__ == '__main__':
+    unittest.main()
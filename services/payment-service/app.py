@@ -1,9 +1,13 @@
 import os
+import sys
 import stripe
-import psycopg2
 from flask import Flask, request, jsonify, abort
 from dotenv import load_dotenv
 
+# Modules shared by the services live in services/common (copied to /common in the images)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+from db_pool import ConnectionPool
+
 load_dotenv()
 
 app = Flask(__name__)
@@ -15,10 +19,14 @@ SUCCESS_URL = os.getenv('STRIPE_SUCCESS_URL')
 CANCEL_URL = os.getenv('STRIPE_CANCEL_URL')
 
 YOUR_PRODUCT_PRICE_ID = os.getenv('STRIPE_PRODUCT_PRICE_ID')
+# Postgres channel the PDF service listens on to pre-render a project's reports
+REPORT_WARMUP_CHANNEL = os.getenv('REPORT_WARMUP_CHANNEL', 'report_warmup')
+
+db_pool = ConnectionPool(DATABASE_URL, minconn=1, maxconn=4)
 
 def get_db_connection():
-    conn = psycopg2.connect(DATABASE_URL)
-    return conn
+    """A pooled connection; ``close()`` returns it to the pool."""
+    return db_pool.getconn()
 
 @app.route('/api/checkout', methods=['POST'])
 def checkout():
@@ -77,6 +85,7 @@ def stripe_webhook():
         project_id = session.get('client_reference_id')
 
         if project_id:
+            conn = None
             try:
                 conn = get_db_connection()
                 cur = conn.cursor()
@@ -84,14 +93,24 @@ def stripe_webhook():
                     "UPDATE projects SET status = %s WHERE id = %s",
                     ('paid', project_id)
                 )
+                # Delivered on commit, so reports are only warmed for projects that really are paid
+                cur.execute("SELECT pg_notify(%s, %s)", (REPORT_WARMUP_CHANNEL, project_id))
                 conn.commit()
                 cur.close()
-                conn.close()
                 app.logger.info(f"Project {project_id} status updated to 'paid'.")
             except Exception as e:
                 app.logger.error(f"Database update failed for project {project_id}: {e}")
+                if conn is not None:
+                    try:
+                        # Don't hand a connection with an aborted transaction back to the pool
+                        conn.rollback()
+                    except Exception as rollback_error:
+                        app.logger.error(f"Rollback failed for project {project_id}: {rollback_error}")
                 # In a real application, you might want to retry or log this more robustly
                 return jsonify({"error": "Database update failed"}), 500
+            finally:
+                if conn is not None:
+                    conn.close()
         else:
             app.logger.warning(f"checkout.session.completed event received without client_reference_id: {session}")
 
@@ -108,6 +127,11 @@ def stripe_webhook():
 
     return jsonify(success=True)
 
+@app.route('/api/db/stats', methods=['GET'])
+def db_stats():
+    """Connection pool metrics: size, checked out, waits and wait time."""
+    return jsonify(db_pool.stats())
+
 @app.route("/health")
 def health():
     # Basic health check, could be extended to check DB connection
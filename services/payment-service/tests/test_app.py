@@ -87,14 +87,37 @@ class TestApp(unittest.TestCase):
 
         mock_stripe_webhook_construct_event.assert_called_once()
         mock_get_db_connection.assert_called_once()
-        mock_cur.execute.assert_called_once_with(
+        mock_cur.execute.assert_any_call(
             "UPDATE projects SET status = %s WHERE id = %s",
             ('paid', 'test_project_456')
         )
+        # The PDF service is asked to pre-render once the update commits
+        mock_cur.execute.assert_called_with("SELECT pg_notify(%s, %s)", ('report_warmup', 'test_project_456'))
         mock_conn.commit.assert_called_once()
         mock_cur.close.assert_called_once()
         mock_conn.close.assert_called_once()
 
+    @mock.patch('stripe.Webhook.construct_event')
+    @mock.patch('app.get_db_connection')
+    def test_stripe_webhook_failed_update_returns_connection(self, mock_get_db_connection, mock_stripe_webhook_construct_event):
+        mock_stripe_webhook_construct_event.return_value = {
+            'type': 'checkout.session.completed',
+            'data': {'object': {'client_reference_id': 'test_project_789', 'id': 'cs_test_456'}}
+        }
+        mock_conn = mock.Mock()
+        mock_conn.cursor.return_value.execute.side_effect = Exception("relation does not exist")
+        mock_get_db_connection.return_value = mock_conn
+
+        response = self.app.post('/webhooks/stripe',
+                                   headers={'stripe-signature': 'mock_signature'},
+                                   data=json.dumps({"id": "evt_test", "type": "checkout.session.completed"}),
+                                   content_type='application/json')
+
+        self.assertEqual(response.status_code, 500)
+        mock_conn.commit.assert_not_called()
+        mock_conn.rollback.assert_called_once()
+        mock_conn.close.assert_called_once()
+
     @mock.patch('stripe.Webhook.construct_event')
     def test_stripe_webhook_invalid_signature(self, mock_stripe_webhook_construct_event):
         mock_stripe_webhook_construct_event.side_effect = stripe.error.SignatureVerificationError('Invalid signature', 'header', 'payload')
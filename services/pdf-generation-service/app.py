@@ -1,22 +1,27 @@
 import os
+import sys
 import json
 import psycopg2
 import uuid
 from datetime import datetime
 from flask import Flask, request, jsonify, send_file, g
-from flask_caching import Cache
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from dotenv import load_dotenv
-from jinja2 import Environment, FileSystemLoader
-from weasyprint import HTML, CSS
-from weasyprint.text.fonts import FontConfiguration
-import io
 import logging
 import hashlib
 import time
 from functools import wraps
 
+# Modules shared by the services live in services/common (copied to /common in the images)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+from db_pool import ConnectionPool
+from artifact_store import ArtifactStore
+from warmup import ReportWarmup
+from render_pool import RenderPool, RenderPoolSaturated, RenderTimeout
+from report_templates import REPORT_TEMPLATES, ReportTemplates
+
 app = Flask(__name__, template_folder='templates')
 
 # Security configurations
@@ -36,12 +41,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Configure caching with security considerations
-cache = Cache(app, config={
-    'CACHE_TYPE': 'simple',  # Use Redis in production for better security
-    'CACHE_DEFAULT_TIMEOUT': 3600,  # Cache for 1 hour
-    'CACHE_KEY_PREFIX': 'pdf_gen_',
-})
+# Rendered reports are shared by every worker through the artifact store
+artifact_store = ArtifactStore()
+
+# Reports rendered in the background as soon as a project is paid
+WARMUP_REPORTS = (('detailed', True), ('summary', True))
 
 # Configure rate limiting
 limiter = Limiter(
@@ -55,9 +59,6 @@ load_dotenv()
 
 DATABASE_URL = os.getenv('DATABASE_URL')
 
-# Font configuration for WeasyPrint
-font_config = FontConfiguration()
-
 # Security middleware
 @app.after_request
 def add_security_headers(response):
@@ -83,17 +84,25 @@ def audit_log(action, resource, user_id=None, details=None):
     }
     logger.info(f"AUDIT: {log_entry}")
 
+db_pool = ConnectionPool(DATABASE_URL, minconn=2, maxconn=10)
+
+def start_warmup():
+    """Start pre-rendering reports for paid projects; call once per worker process (idempotent)."""
+    report_warmup.start()
+
 def get_db_connection():
+    """A pooled connection; ``close()`` returns it to the pool."""
     try:
-        conn = psycopg2.connect(DATABASE_URL)
-        return conn
+        return db_pool.getconn()
     except psycopg2.Error as e:
         logger.error(f"Database connection failed: {e}")
         raise
 
-# Setup Jinja2 environment
-template_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
-env = Environment(loader=FileSystemLoader(template_dir))
+# Report templates are compiled, and their stylesheets read, once and reloaded on change
+report_templates = ReportTemplates()
+
+# WeasyPrint runs in worker processes that load fonts and parse the report stylesheets once
+render_pool = RenderPool(preload=[report_templates.stylesheets(name) for name in REPORT_TEMPLATES.values()])
 
 @app.route('/api/download/<project_id>', methods=['GET', 'HEAD'])
 @limiter.limit("20 per hour; 5 per minute")
@@ -105,15 +114,8 @@ def download_pdf(project_id):
     if request.method == 'HEAD':
         return check_pdf_available(project_id)
 
-    # Create cache key that includes query parameters for customization
     format_type = request.args.get('format', 'detailed')
     include_financial = request.args.get('include_financial', 'true').lower() == 'true'
-    cache_key = f'pdf_{project_id}_{format_type}_{include_financial}'
-
-    # Check cache first
-    cached_response = cache.get(cache_key)
-    if cached_response:
-        return cached_response
     try:
         # Validate project_id format
         try:
@@ -123,134 +125,66 @@ def download_pdf(project_id):
 
         conn = get_db_connection()
         cur = conn.cursor()
+        project_data, calculation_data = fetch_report_rows(cur, project_id)
+        cur.close()
+        conn.close()
 
-        # Retrieve project data
-        cur.execute(
-            "SELECT project_name, location_lat, location_lon, cost_usd, status, metadata, created_at FROM projects WHERE id = %s",
-            (project_id,)
-        )
-        project_data = cur.fetchone()
         if not project_data:
-            cur.close()
-            conn.close()
             return jsonify({"error": "Project not found"}), 404
 
-        project_name, location_lat, location_lon, cost_usd, status, metadata, created_at = project_data
+        project_name = project_data[0]
+        status = project_data[4]
 
         # Check if project is paid (only allow downloads for paid projects)
         if status != 'paid':
-            cur.close()
-            conn.close()
             return jsonify({"error": "Project must be paid before PDF download is available"}), 403
 
-        # Retrieve calculation data
-        cur.execute(
-            "SELECT annual_kwh, shading_loss_pct, financial_data, created_at FROM calculations WHERE project_id = %s ORDER BY created_at DESC LIMIT 1",
-            (project_id,)
-        )
-        calculation_data = cur.fetchone()
-
-        cur.close()
-        conn.close()
-
         if not calculation_data:
             return jsonify({"error": "Calculation results not found for this project"}), 404
 
-        annual_kwh, shading_loss_pct, financial_data, calc_created_at = calculation_data
+        report, key, rendered = stored_report(project_id, project_data, calculation_data, format_type,
+                                              include_financial)
 
-        # Parse financial data if it's stored as JSON
-        try:
-            if isinstance(financial_data, str):
-                financial_data = json.loads(financial_data)
-        except (json.JSONDecodeError, TypeError):
-            financial_data = {}
-
-        # Parse metadata if it's stored as JSON
-        try:
-            if isinstance(metadata, str):
-                metadata = json.loads(metadata)
-        except (json.JSONDecodeError, TypeError):
-            metadata = {}
-
-        # Calculate additional metrics
-        net_annual_kwh = annual_kwh * (1 - shading_loss_pct) if annual_kwh and shading_loss_pct else annual_kwh
-        cost_per_kwh = cost_usd / net_annual_kwh if net_annual_kwh and net_annual_kwh > 0 else 0
-
-        # Prepare data for template
-        report_data = {
-            "project_id": project_id,
-            "project_name": project_name or "Unnamed Project",
-            "location": {
-                "lat": location_lat,
-                "lon": location_lon
-            },
-            "cost_usd": cost_usd or 0,
-            "status": status,
-            "annual_kwh": annual_kwh or 0,
-            "net_annual_kwh": net_annual_kwh or 0,
-            "shading_loss_pct": shading_loss_pct or 0,
-            "cost_per_kwh": cost_per_kwh,
-            "financial_data": financial_data if include_financial else {},
-            "metadata": metadata,
-            "project_created_at": created_at.isoformat() if created_at else None,
-            "calculation_created_at": calc_created_at.isoformat() if calc_created_at else None,
-            "generation_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S UTC"),
-            "format": format_type,
-            "include_financial": include_financial
-        }
-
-        # Choose template based on format
-        if format_type == 'summary':
-            template_name = 'report_template_summary.html'
-        elif format_type == 'detailed':
-            template_name = 'report_template.html'
-        else:
-            template_name = 'report_template.html'
-
-        # Load and render HTML template
-        try:
-            template = env.get_template(template_name)
-        except:
-            # Fallback to main template if specific template doesn't exist
-            template = env.get_template('report_template.html')
-
-        html_out = template.render(report=report_data)
-
-        # Generate PDF with custom CSS
-        css = CSS(string="""
-            @page {
-                size: A4;
-                margin: 1in;
-            }
-            body {
-                font-family: 'Helvetica', 'Arial', sans-serif;
-                line-height: 1.6;
-                color: #333;
-            }
-        """)
-
-        pdf_file = HTML(string=html_out).write_pdf(stylesheets=[css], font_config=font_config)
-
-        # Create the response
+        # Served from the open handle, which stays readable if the report is pruned meanwhile
+        stat = os.fstat(report.fileno())
         response = send_file(
-            io.BytesIO(pdf_file),
+            report,
             mimetype='application/pdf',
             as_attachment=True,
-            download_name=f'solar_report_{project_name.replace(" ", "_")}_{project_id[:8]}_{format_type}.pdf'
+            download_name=f'solar_report_{project_name.replace(" ", "_")}_{project_id[:8]}_{format_type}.pdf',
+            etag=key[1],
+            last_modified=stat.st_mtime,
         )
+        response.content_length = stat.st_size
+        response.cache_control.private = True
+        # Conditional and Range requests are answered from the file
+        try:
+            response = response.make_conditional(request, accept_ranges=True, complete_length=stat.st_size)
+        except RequestedRangeNotSatisfiable:
+            report.close()
+            raise
 
-        # Audit log successful PDF generation
+        # Audit log successful PDF delivery
         audit_log('pdf_download_success', f'project:{project_id}', details={
             'format': format_type,
             'include_financial': include_financial,
-            'file_size': len(pdf_file)
+            'file_size': stat.st_size,
+            'rendered': rendered,
+            'status': response.status_code
         })
 
-        # Cache the response for 1 hour
-        cache.set(cache_key, response, timeout=3600)
-
         return response
 
+    except RenderPoolSaturated as e:
+        logger.warning(f"PDF render pool saturated; asking client to retry in {e.retry_after}s")
+        response = jsonify({"error": "PDF generation is busy, please retry", "retry_after": e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+    except RenderTimeout as e:
+        logger.error(f"PDF generation timed out: {e}")
+        return jsonify({"error": "PDF generation timed out"}), 504
+    except RequestedRangeNotSatisfiable as e:
+        return e
     except psycopg2.Error as e:
         logger.error(f"Database error: {e}")
         return jsonify({"error": "Database operation failed"}), 500
@@ -258,6 +192,148 @@ def download_pdf(project_id):
         logger.error(f"PDF generation error: {e}")
         return jsonify({"error": "PDF generation failed"}), 500
 
+def fetch_report_rows(cur, project_id):
+    """``(project row, latest calculation row)``; the calculation is None for a missing or unpaid project."""
+    # One primary-key lookup in the snapshot the database keeps current
+    cur.execute(
+        "SELECT project_name, location_lat, location_lon, cost_usd, status, metadata, project_created_at, "
+        "calculation_id, annual_kwh, shading_loss_pct, financial_data, calculation_created_at "
+        "FROM project_reports WHERE project_id = %s",
+        (project_id,)
+    )
+    row = cur.fetchone()
+    if not row:
+        return None, None
+    project_data, calculation_data = row[:7], row[7:]
+    if project_data[4] != 'paid' or calculation_data[0] is None:
+        return project_data, None
+    return project_data, calculation_data
+
+def stored_report(project_id, project_data, calculation_data, format_type, include_financial):
+    """``(file, key, rendered)`` of a report in the artifact store, rendering it if it is not there yet.
+
+    The file is open for reading; the caller closes it.
+    """
+    # Choose template based on format
+    template_name = report_templates.template_name(format_type)
+
+    # The same calculation, options and template always render the same
+    # report, so it is rendered once and then served from the store
+    key = artifact_store.key(project_id, calculation_data[0], format_type, include_financial,
+                             report_templates.digest(template_name))
+    report = artifact_store.open(project_id, key)
+    if report is not None:
+        return report, key, False
+    with artifact_store.rendering(project_id, key):
+        report = artifact_store.open(project_id, key)
+        if report is not None:
+            return report, key, False
+        report_data = build_report_data(project_id, project_data, calculation_data, format_type, include_financial)
+        artifact_store.put(project_id, key, render_pdf(template_name, report_data))
+        return artifact_store.open(project_id, key), key, True
+
+def prerender_reports(project_id):
+    """Store the reports a paid project is likely to download first; returns how many were rendered."""
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        project_data, calculation_data = fetch_report_rows(cur, project_id)
+        cur.close()
+    finally:
+        conn.close()
+    if not calculation_data:
+        logger.info(f"Skipping report warm-up for project {project_id}: not paid or not calculated")
+        return 0
+    rendered = 0
+    for format_type, include_financial in WARMUP_REPORTS:
+        report, _, fresh = stored_report(project_id, project_data, calculation_data, format_type, include_financial)
+        report.close()
+        rendered += fresh
+    return rendered
+
+def build_report_data(project_id, project_data, calculation_data, format_type, include_financial):
+    """Template context for a project row and its latest calculation row."""
+    project_name, location_lat, location_lon, cost_usd, status, metadata, created_at = project_data
+    _, annual_kwh, shading_loss_pct, financial_data, calc_created_at = calculation_data
+
+    # Parse financial data if it's stored as JSON
+    try:
+        if isinstance(financial_data, str):
+            financial_data = json.loads(financial_data)
+    except (json.JSONDecodeError, TypeError):
+        financial_data = {}
+
+    # Parse metadata if it's stored as JSON
+    try:
+        if isinstance(metadata, str):
+            metadata = json.loads(metadata)
+    except (json.JSONDecodeError, TypeError):
+        metadata = {}
+
+    # Calculate additional metrics
+    net_annual_kwh = annual_kwh * (1 - shading_loss_pct) if annual_kwh and shading_loss_pct else annual_kwh
+    cost_per_kwh = cost_usd / net_annual_kwh if net_annual_kwh and net_annual_kwh > 0 else 0
+
+    return {
+        "project_id": project_id,
+        "project_name": project_name or "Unnamed Project",
+        "location": {
+            "lat": location_lat,
+            "lon": location_lon
+        },
+        "cost_usd": cost_usd or 0,
+        "status": status,
+        "annual_kwh": annual_kwh or 0,
+        "net_annual_kwh": net_annual_kwh or 0,
+        "shading_loss_pct": shading_loss_pct or 0,
+        "cost_per_kwh": cost_per_kwh,
+        "financial_data": financial_data if include_financial else {},
+        "metadata": metadata,
+        "project_created_at": created_at.isoformat() if created_at else None,
+        "calculation_created_at": calc_created_at.isoformat() if calc_created_at else None,
+        "generation_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S UTC"),
+        "format": format_type,
+        "include_financial": include_financial
+    }
+
+def render_pdf(template_name, report_data):
+    """PDF bytes of a report."""
+    html_out = report_templates.render(template_name, report_data)
+
+    # Generate PDF with the template's stylesheets, off the request thread
+    return render_pool.render(html_out, report_templates.stylesheets(template_name))
+
+# Fed by the payment service's NOTIFY and by /api/prerender
+report_warmup = ReportWarmup(prerender_reports, dsn=DATABASE_URL)
+
+@app.route('/api/prerender/<project_id>', methods=['POST'])
+@limiter.limit("60 per hour")
+def prerender(project_id):
+    """Queue a project's reports for background rendering (the payment webhook does this via NOTIFY)."""
+    try:
+        uuid.UUID(project_id)
+    except ValueError:
+        return jsonify({"error": "Invalid project ID format"}), 400
+    start_warmup()
+    queued = report_warmup.submit(project_id)
+    audit_log('pdf_prerender_requested', f'project:{project_id}', details={'queued': queued})
+    return jsonify({"project_id": project_id, "queued": queued}), 202
+
+@app.route('/api/artifacts/stats', methods=['GET'])
+def artifact_stats():
+    """Stored report count and size, and the warm-up queue."""
+    return jsonify({**artifact_store.stats(), "warmup": report_warmup.stats()})
+
+@app.route('/api/render/stats', methods=['GET'])
+def render_stats():
+    """Render pool metrics: busy and idle workers, queue depth, rejections and timeouts."""
+    return jsonify(render_pool.stats())
+
+@app.route('/api/db/stats', methods=['GET'])
+def db_stats():
+    """Connection pool metrics: size, checked out, waits and wait time."""
+    return jsonify(db_pool.stats())
+
 @app.route("/health")
 def health():
     try:
@@ -283,35 +359,23 @@ def check_pdf_available(project_id):
         conn = get_db_connection()
         cur = conn.cursor()
 
-        # Check if project exists and is paid
+        # Check if project exists, is paid and has a calculation
         cur.execute(
-            "SELECT status FROM projects WHERE id = %s",
+            "SELECT status, calculation_id IS NOT NULL FROM project_reports WHERE project_id = %s",
             (project_id,)
         )
         project_data = cur.fetchone()
+        cur.close()
+        conn.close()
 
         if not project_data:
-            cur.close()
-            conn.close()
             return "", 404
 
-        status = project_data[0]
+        status, calculation_exists = project_data
 
         if status != 'paid':
-            cur.close()
-            conn.close()
             return "", 403
 
-        # Check if calculation exists
-        cur.execute(
-            "SELECT 1 FROM calculations WHERE project_id = %s LIMIT 1",
-            (project_id,)
-        )
-        calculation_exists = cur.fetchone() is not None
-
-        cur.close()
-        conn.close()
-
         if not calculation_exists:
             return "", 404
 
@@ -333,13 +397,12 @@ def clear_pdf_cache(project_id):
             audit_log('cache_clear_failed', f'project:{project_id}', details={'error': 'invalid_uuid'})
             return jsonify({"error": "Invalid project ID format"}), 400
 
-        # Clear the specific cache entry
-        cache_key = f'pdf_{project_id}'
-        cache.delete(cache_key)
+        # Drop every stored report of the project
+        removed = artifact_store.delete_project(project_id)
 
-        audit_log('cache_clear_success', f'project:{project_id}')
-        logger.info(f"Cleared PDF cache for project {project_id}")
-        return jsonify({"message": f"Cache cleared for project {project_id}"}), 200
+        audit_log('cache_clear_success', f'project:{project_id}', details={'artifacts': removed})
+        logger.info(f"Cleared {removed} stored PDFs for project {project_id}")
+        return jsonify({"message": f"Cache cleared for project {project_id}", "artifacts": removed}), 200
 
     except Exception as e:
         audit_log('cache_clear_error', f'project:{project_id}', details={'error': str(e)})
@@ -351,10 +414,10 @@ def clear_pdf_cache(project_id):
 def clear_all_cache():
     """Clear all cached PDFs"""
     try:
-        cache.clear()
-        audit_log('cache_clear_all_success', 'all_projects')
-        logger.info("Cleared all PDF caches")
-        return jsonify({"message": "All PDF caches cleared"}), 200
+        removed = artifact_store.clear()
+        audit_log('cache_clear_all_success', 'all_projects', details={'artifacts': removed})
+        logger.info(f"Cleared all {removed} stored PDFs")
+        return jsonify({"message": "All PDF caches cleared", "artifacts": removed}), 200
 
     except Exception as e:
         audit_log('cache_clear_all_error', 'all_projects', details={'error': str(e)})
@@ -390,8 +453,8 @@ def delete_project_data(project_id):
         # Delete project data
         cur.execute("DELETE FROM projects WHERE id = %s", (project_id,))
 
-        # Clear any cached PDFs for this project
-        cache.delete(f'pdf_{project_id}')
+        # Stored PDFs hold the project's data too
+        artifact_store.delete_project(project_id)
 
         conn.commit()
         cur.close()
@@ -426,12 +489,13 @@ def export_project_data(project_id):
         conn = get_db_connection()
         cur = conn.cursor()
 
-        # Retrieve project data
+        # Retrieve project data and its latest calculation
         cur.execute("""
-            SELECT p.*, c.annual_kwh, c.shading_loss_pct, c.financial_data, c.created_at as calc_created_at
-            FROM projects p
-            LEFT JOIN calculations c ON p.id = c.project_id
-            WHERE p.id = %s
+            SELECT project_id, project_created_at, status, cost_usd, project_name, location_lat, location_lon,
+                   lidar_geom, metadata, calculation_id, annual_kwh, shading_loss_pct, financial_data,
+                   calculation_created_at
+            FROM project_reports
+            WHERE project_id = %s
         """, (project_id,))
 
         row = cur.fetchone()
@@ -442,23 +506,26 @@ def export_project_data(project_id):
             audit_log('data_export_failed', f'project:{project_id}', details={'error': 'project_not_found'})
             return jsonify({"error": "Project not found"}), 404
 
+        (row_project_id, created_at, status, cost_usd, project_name, location_lat, location_lon, lidar_geom,
+         metadata, calculation_id, annual_kwh, shading_loss_pct, financial_data, calc_created_at) = row
+
         # Format data for export
         export_data = {
-            "project_id": str(row[0]),
-            "created_at": row[1].isoformat() if row[1] else None,
-            "status": row[2],
-            "cost_usd": float(row[3]) if row[3] else None,
-            "project_name": row[4],
-            "location_lat": float(row[5]) if row[5] else None,
-            "location_lon": float(row[6]) if row[6] else None,
-            "lidar_geom": str(row[7]) if row[7] else None,
-            "metadata": row[8] if row[8] else {},
+            "project_id": str(row_project_id),
+            "created_at": created_at.isoformat() if created_at else None,
+            "status": status,
+            "cost_usd": float(cost_usd) if cost_usd else None,
+            "project_name": project_name,
+            "location_lat": float(location_lat) if location_lat else None,
+            "location_lon": float(location_lon) if location_lon else None,
+            "lidar_geom": str(lidar_geom) if lidar_geom else None,
+            "metadata": metadata if metadata else {},
             "calculation_data": {
-                "annual_kwh": float(row[9]) if row[9] else None,
-                "shading_loss_pct": float(row[10]) if row[10] else None,
-                "financial_data": row[11] if row[11] else {},
-                "created_at": row[12].isoformat() if row[12] else None
-            } if row[9] else None,
+                "annual_kwh": float(annual_kwh) if annual_kwh else None,
+                "shading_loss_pct": float(shading_loss_pct) if shading_loss_pct else None,
+                "financial_data": financial_data if financial_data else {},
+                "created_at": calc_created_at.isoformat() if calc_created_at else None
+            } if calculation_id is not None else None,
             "export_timestamp": time.time(),
             "gdpr_compliant": True
         }
@@ -476,4 +543,6 @@ def export_project_data(project_id):
         return jsonify({"error": "Failed to export project data"}), 500
 
 if __name__ == '__main__':
+    render_pool.start()
+    start_warmup()
     app.run(host='0.0.0.0', port=5002)
\ No newline at end of file
@@ -0,0 +1,154 @@
+"""Rendered PDF reports on a filesystem shared by every worker.
+
+An artifact is addressed by a SHA-256 over everything that decides its
+bytes: project, calculation id, report format, ``include_financial`` and
+the template hash. Files live at ``<root>/<project_id>/<calculation_id>-<digest>.pdf``
+so a project's reports can be dropped together (cache clear, GDPR
+erasure) and a new calculation replaces the previous one's reports.
+
+Files are written to a temporary name and renamed into place, so readers
+never see a partial PDF and need no lock. Rendering takes an exclusive
+``flock`` on the artifact's lock file, so concurrent requests for the same
+missing report render it once; the others wait and read the file.
+Readers :meth:`~ArtifactStore.open` the file and serve from the handle, so
+a report pruned or cleared mid-download is still sent in full. Pruning a
+report takes its lock first and skips one that is being rendered.
+"""
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+PDF_ARTIFACT_DIR = os.getenv('PDF_ARTIFACT_DIR', os.path.join(tempfile.gettempdir(), 'pdf-artifacts'))
+
+
+def template_hash(*sources):
+    """Digest of the template and stylesheet sources a report is rendered from."""
+    digest = hashlib.sha256()
+    for source in sources:
+        digest.update(source if isinstance(source, bytes) else source.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class ArtifactStore:
+    """Content-addressed PDF files under ``root``."""
+
+    def __init__(self, root=PDF_ARTIFACT_DIR):
+        self.root = root
+
+    @staticmethod
+    def key(project_id, calculation_id, format_type, include_financial, template_digest):
+        """``(calculation_id, digest)`` naming one rendered report."""
+        parts = (str(project_id), str(calculation_id), format_type, '1' if include_financial else '0', template_digest)
+        return str(calculation_id), hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+    def _project_dir(self, project_id):
+        return os.path.join(self.root, str(project_id))
+
+    def path(self, project_id, key):
+        calculation_id, digest = key
+        return os.path.join(self._project_dir(project_id), f'{calculation_id}-{digest}.pdf')
+
+    def get(self, project_id, key):
+        """Path of the stored artifact, or None."""
+        path = self.path(project_id, key)
+        return path if os.path.exists(path) else None
+
+    def open(self, project_id, key):
+        """The stored artifact opened for reading, or None; the handle outlives a later prune."""
+        try:
+            return open(self.path(project_id, key), 'rb')
+        except FileNotFoundError:
+            return None
+
+    def put(self, project_id, key, data):
+        """Store ``data`` atomically and drop the project's reports for older calculations."""
+        path = self.path(project_id, key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        calculation_id = key[0]
+        for name in os.listdir(directory):
+            if name.endswith('.pdf') and not name.startswith(f'{calculation_id}-'):
+                stale = os.path.join(directory, name)
+                # A report still being rendered is left for the next prune
+                with self._locked(stale, blocking=False) as held:
+                    if held:
+                        self._remove(stale)
+        return path
+
+    @contextmanager
+    def rendering(self, project_id, key):
+        """Hold the artifact's render lock; re-check :meth:`get` once inside."""
+        directory = self._project_dir(project_id)
+        os.makedirs(directory, exist_ok=True)
+        with self._locked(self.path(project_id, key)):
+            yield
+
+    @contextmanager
+    def _locked(self, path, blocking=True):
+        """``flock`` on the artifact's lock file; yields False if not ``blocking`` and it is held elsewhere."""
+        lock_path = path + '.lock'
+        while True:
+            with open(lock_path, 'a') as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    yield False
+                    return
+                # A prune may have removed the lock file while we waited; lock its replacement
+                try:
+                    current = os.stat(lock_path).st_ino == os.fstat(lock.fileno()).st_ino
+                except FileNotFoundError:
+                    current = False
+                if current:
+                    try:
+                        yield True
+                    finally:
+                        fcntl.flock(lock, fcntl.LOCK_UN)
+                    return
+
+    def delete_project(self, project_id):
+        """Remove every stored report of a project; returns how many PDFs there were."""
+        directory = self._project_dir(project_id)
+        if not os.path.isdir(directory):
+            return 0
+        count = sum(name.endswith('.pdf') for name in os.listdir(directory))
+        shutil.rmtree(directory, ignore_errors=True)
+        return count
+
+    def clear(self):
+        """Remove every stored report."""
+        if not os.path.isdir(self.root):
+            return 0
+        count = 0
+        for name in os.listdir(self.root):
+            count += self.delete_project(name)
+        return count
+
+    def stats(self):
+        files = total = 0
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith('.pdf'):
+                    files += 1
+                    total += os.path.getsize(os.path.join(directory, name))
+        return {"root": self.root, "artifacts": files, "bytes": total}
+
+    @staticmethod
+    def _remove(path):
+        for stale in (path, path + '.lock'):
+            try:
+                os.unlink(stale)
+            except FileNotFoundError:
+                pass
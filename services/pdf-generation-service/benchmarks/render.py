@@ -0,0 +1,112 @@
+"""Per-request cost of turning a report into a PDF, before and after precompiling.
+
+For each report format this times, on a fixed sample report:
+
+* ``compile``: compiling the Jinja template from source, as a cold
+  environment does; ``render`` is the cached template's render alone.
+* ``css_parse``: parsing the page and report stylesheets with WeasyPrint,
+  which the previous inline ``<style>`` and per-request ``CSS(string=...)``
+  paid on every download; render workers now pay it once.
+* ``pdf_inline``: ``write_pdf`` of the HTML with the stylesheet inlined and
+  the page CSS parsed per call, the previous request path.
+* ``pdf_cached``: ``write_pdf`` with the stylesheets parsed once
+  (:class:`render_pool.StylesheetCache`), the request path now.
+
+Run from the service directory (needs WeasyPrint's native libraries)::
+
+    python -m benchmarks.render --iterations 20
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+
+from jinja2 import Environment
+from weasyprint import CSS, HTML
+from weasyprint.text.fonts import FontConfiguration
+
+from render_pool import StylesheetCache
+from report_templates import REPORT_TEMPLATES, TEMPLATE_DIR, ReportTemplates
+
+SAMPLE_REPORT = {
+    "project_id": "12345678-1234-5678-9012-123456789012",
+    "project_name": "Benchmark Residence",
+    "location": {"lat": 35.7796, "lon": -78.6382},
+    "cost_usd": 18500.0,
+    "status": "paid",
+    "annual_kwh": 11250.0,
+    "net_annual_kwh": 10687.5,
+    "shading_loss_pct": 0.05,
+    "cost_per_kwh": 1.731,
+    "financial_data": {"npv_usd": 9125.4, "irr": 0.087, "payback_years": 9.4, "lcoe_usd_per_kwh": 0.071},
+    "metadata": {"tilt": 30, "azimuth": 180, "modules": 24, "inverter": "string"},
+    "project_created_at": "2025-09-01T10:00:00",
+    "calculation_created_at": "2025-09-01T10:05:00",
+    "generation_date": "2025-09-01 10:10:00 UTC",
+    "include_financial": True,
+}
+
+
+def timed(function, iterations):
+    """Median seconds of ``function()`` over ``iterations`` calls, after one warm-up call."""
+    function()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def inline_styles(html, sources):
+    """The report as it was rendered before: its stylesheet in a ``<style>`` element."""
+    return html.replace('</head>', '<style>\n' + sources[-1] + '\n</style>\n</head>', 1)
+
+
+def run_format(templates, format_type, iterations, font_config):
+    name = templates.template_name(format_type)
+    source, _, _ = templates.env.loader.get_source(templates.env, name)
+    sources = templates.stylesheets(name)
+    report = dict(SAMPLE_REPORT, format=format_type)
+    html = templates.render(name, report)
+    inlined = inline_styles(html, sources)
+    cache = StylesheetCache(lambda css: CSS(string=css, font_config=font_config))
+
+    return {
+        "compile": timed(lambda: Environment().from_string(source), iterations),
+        "render": timed(lambda: templates.render(name, report), iterations),
+        "css_parse": timed(lambda: [CSS(string=css, font_config=font_config) for css in sources], iterations),
+        "pdf_inline": timed(lambda: HTML(string=inlined).write_pdf(
+            stylesheets=[CSS(string=sources[0], font_config=font_config)], font_config=font_config), iterations),
+        "pdf_cached": timed(lambda: HTML(string=html).write_pdf(
+            stylesheets=cache.get(sources), font_config=font_config), iterations),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20, help='timed calls per measurement')
+    parser.add_argument('--output', help='write the results as JSON here')
+    args = parser.parse_args(argv)
+
+    templates = ReportTemplates(TEMPLATE_DIR, bytecode_dir=None)
+    font_config = FontConfiguration()
+    results = {}
+    for format_type in REPORT_TEMPLATES:
+        timings = results[format_type] = run_format(templates, format_type, args.iterations, font_config)
+        print(f"{format_type}:")
+        for stage, seconds in timings.items():
+            print(f"    {stage:<11} {seconds * 1000:>9.2f} ms")
+        saved = timings['pdf_inline'] - timings['pdf_cached']
+        print(f"    per-request saving {saved * 1000:.2f} ms ({saved / timings['pdf_inline']:.0%}), "
+              f"plus {timings['compile'] * 1000:.2f} ms compile on a cold environment")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,315 @@
+"""WeasyPrint rendering in dedicated worker processes.
+
+``write_pdf`` is CPU-bound for seconds and holds the GIL, so rendering in
+the request thread stalls every other request of the worker, health checks
+included. :class:`RenderPool` keeps ``PDF_RENDER_WORKERS`` processes, each
+of which imports WeasyPrint and builds its ``FontConfiguration`` once at
+start-up and parses each set of stylesheet sources once
+(:class:`StylesheetCache`), and hands them rendered HTML over a pipe. The
+request thread only waits on the pipe.
+
+Admission is bounded: at most ``PDF_RENDER_QUEUE`` requests wait for a free
+worker, each for at most ``PDF_RENDER_QUEUE_TIMEOUT_SECONDS``; beyond that
+:class:`RenderPoolSaturated` is raised with a ``retry_after`` estimate for a
+503. A job running longer than ``PDF_RENDER_TIMEOUT_SECONDS`` has its
+process killed and replaced, and raises :class:`RenderTimeout`.
+
+Workers are forked where the platform allows, as early as possible (call
+:meth:`RenderPool.start` before serving). They import WeasyPrint themselves,
+so the service process never loads it, and never touch the pooled database
+connections they inherit; forked children exit without running finalizers.
+"""
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+PDF_RENDER_WORKERS = int(os.getenv('PDF_RENDER_WORKERS', '2'))
+PDF_RENDER_QUEUE = int(os.getenv('PDF_RENDER_QUEUE', '8'))
+PDF_RENDER_QUEUE_TIMEOUT_SECONDS = float(os.getenv('PDF_RENDER_QUEUE_TIMEOUT_SECONDS', '10'))
+PDF_RENDER_TIMEOUT_SECONDS = float(os.getenv('PDF_RENDER_TIMEOUT_SECONDS', '60'))
+WORKER_START_TIMEOUT_SECONDS = 60
+# Render time assumed for Retry-After until a job has been measured
+DEFAULT_RENDER_SECONDS = 5.0
+
+logger = logging.getLogger(__name__)
+
+
+class RenderError(Exception):
+    """A render failed in, or took down, its worker process."""
+
+
+class RenderTimeout(RenderError):
+    """A render ran past the per-job timeout; its worker was replaced."""
+
+
+class RenderPoolSaturated(Exception):
+    """Every worker is busy and the wait queue is full; retry after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"PDF render pool saturated; retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class StylesheetCache:
+    """Parsed stylesheets by source, so a worker parses each distinct set once.
+
+    Report stylesheets are reloaded from disk when they change, which gives
+    new sources and a new entry; the oldest sets are dropped past ``max_sets``.
+    """
+
+    def __init__(self, parse, max_sets=8):
+        self.parse = parse
+        self.max_sets = max_sets
+        self._sets = {}
+        self.parsed = 0
+
+    def get(self, sources):
+        key = tuple(sources)
+        sheets = self._sets.get(key)
+        if sheets is None:
+            if len(self._sets) >= self.max_sets:
+                del self._sets[next(iter(self._sets))]
+            sheets = self._sets[key] = [self.parse(source) for source in key]
+            self.parsed += 1
+        return sheets
+
+
+def weasyprint_renderer(preload):
+    """``(html, stylesheet sources) -> PDF bytes`` with one font configuration and parsed-stylesheet cache."""
+    from weasyprint import CSS, HTML
+    from weasyprint.text.fonts import FontConfiguration
+
+    font_config = FontConfiguration()
+    stylesheets = StylesheetCache(lambda source: CSS(string=source, font_config=font_config))
+
+    def render(html, sources):
+        return HTML(string=html).write_pdf(stylesheets=stylesheets.get(sources), font_config=font_config)
+
+    # Parse the report stylesheets and load fonts and layout code before the first real job arrives
+    for sources in preload:
+        render('<p>warm-up</p>', sources)
+    return render
+
+
+def _worker_main(conn, renderer_factory, preload):
+    try:
+        render = renderer_factory(preload)
+    except Exception as e:
+        conn.send(('error', f"{type(e).__name__}: {e}"))
+        return
+    conn.send(('ready', None))
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        try:
+            conn.send(('ok', render(*job)))
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+
+    def __init__(self, context, renderer_factory, preload):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, renderer_factory, preload),
+                                       name='pdf-render', daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    def wait_ready(self, timeout):
+        if self.ready:
+            return
+        if not self.conn.poll(timeout):
+            raise RenderError("PDF render worker did not start in time")
+        status, message = self.conn.recv()
+        if status != 'ready':
+            raise RenderError(f"PDF render worker failed to start: {message}")
+        self.ready = True
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class RenderPool:
+    """Bounded pool of WeasyPrint worker processes."""
+
+    def __init__(self, preload=(), workers=PDF_RENDER_WORKERS, queue_size=PDF_RENDER_QUEUE,
+                 queue_timeout=PDF_RENDER_QUEUE_TIMEOUT_SECONDS, timeout=PDF_RENDER_TIMEOUT_SECONDS,
+                 renderer_factory=weasyprint_renderer):
+        self.preload = [tuple(sources) for sources in preload]
+        self.workers = workers
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self.renderer_factory = renderer_factory
+        method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        self._context = multiprocessing.get_context(method)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._waiting = 0
+        self._busy = 0
+        # Slots whose worker died and could not be respawned; refilled on acquire
+        self._missing = 0
+        self.max_waiting = 0
+        self.rendered = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.restarts = 0
+        self.render_seconds = 0.0
+
+    def start(self):
+        """Spawn the worker processes; idempotent, and done by the first render otherwise."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            for _ in range(self.workers):
+                self._idle.put(self._spawn())
+
+    def stop(self):
+        with self._lock:
+            self._started = False
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+            worker.process.join(5)
+            if worker.process.is_alive():
+                worker.kill()
+
+    def render(self, html, stylesheets=()):
+        """PDF bytes of ``html`` styled by the ``stylesheets`` sources, rendered by a worker process."""
+        self.start()
+        worker = self._acquire()
+        start = time.perf_counter()
+        try:
+            status, payload = self._run(worker, (html, tuple(stylesheets)))
+        except (RenderError, EOFError, OSError) as e:
+            with self._lock:
+                self.failed += 1
+                self.timeouts += isinstance(e, RenderTimeout)
+            # A worker that timed out, died or never started is not reused
+            worker = self._replace(worker)
+            if isinstance(e, RenderError):
+                raise
+            raise RenderError(f"PDF render worker exited: {e}") from e
+        finally:
+            self._release(worker)
+        if status != 'ok':
+            with self._lock:
+                self.failed += 1
+            raise RenderError(payload)
+        with self._lock:
+            self.rendered += 1
+            self.render_seconds += time.perf_counter() - start
+        return payload
+
+    def retry_after(self):
+        """Seconds until a slot is likely to free up, for ``Retry-After``."""
+        average = self.render_seconds / self.rendered if self.rendered else DEFAULT_RENDER_SECONDS
+        backlog = self._waiting + self._busy
+        return max(1, math.ceil(average * backlog / max(self.workers, 1)))
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "busy": self._busy,
+            "idle": self._idle.qsize(),
+            "missing": self._missing,
+            "waiting": self._waiting,
+            "max_waiting": self.max_waiting,
+            "queue_size": self.queue_size,
+            "rendered": self.rendered,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+            "avg_render_seconds": round(self.render_seconds / self.rendered, 3) if self.rendered else None,
+        }
+
+    def _acquire(self):
+        worker = self._respawn()
+        if worker is not None:
+            return worker
+        with self._lock:
+            if self._waiting >= self.queue_size and self._idle.empty():
+                self.rejected += 1
+                raise RenderPoolSaturated(self.retry_after())
+            self._waiting += 1
+            self.max_waiting = max(self.max_waiting, self._waiting)
+        try:
+            worker = self._idle.get(timeout=self.queue_timeout)
+        except queue.Empty:
+            with self._lock:
+                self.rejected += 1
+            raise RenderPoolSaturated(self.retry_after())
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        with self._lock:
+            self._busy += 1
+        return worker
+
+    def _release(self, worker):
+        with self._lock:
+            self._busy -= 1
+            if worker is None:
+                # Only live workers go back; the slot is respawned by a later acquire
+                self._missing += 1
+                return
+        self._idle.put(worker)
+
+    def _respawn(self):
+        """A new worker for a slot left empty by a failed respawn, or None if there is none."""
+        with self._lock:
+            if not self._missing:
+                return None
+            self._missing -= 1
+            self._busy += 1
+        try:
+            return self._spawn()
+        except Exception as e:
+            with self._lock:
+                self._busy -= 1
+                self._missing += 1
+            raise RenderError(f"PDF render worker could not be started: {e}") from e
+
+    def _run(self, worker, job):
+        worker.wait_ready(WORKER_START_TIMEOUT_SECONDS)
+        worker.conn.send(job)
+        if not worker.conn.poll(self.timeout):
+            raise RenderTimeout(f"PDF rendering exceeded {self.timeout:g}s")
+        return worker.conn.recv()
+
+    def _spawn(self):
+        return _Worker(self._context, self.renderer_factory, self.preload)
+
+    def _replace(self, worker):
+        """Kill ``worker`` and spawn its successor; None if the spawn fails."""
+        logger.warning(f"Replacing PDF render worker {worker.process.pid}")
+        worker.kill()
+        with self._lock:
+            self.restarts += 1
+        try:
+            return self._spawn()
+        except Exception:
+            logger.exception("Could not respawn PDF render worker")
+            return None
@@ -0,0 +1,108 @@
+"""Report templates and stylesheets, compiled and read once and reloaded on change.
+
+Each report format is a Jinja template ``<name>.html`` with its stylesheet
+beside it as ``<name>.css``; ``report_page.css`` applies to every format.
+Keeping the CSS out of the HTML lets the render workers parse it once
+(:class:`render_pool.StylesheetCache`) instead of once per document.
+
+Compiled templates stay in the Jinja environment, and ``auto_reload`` stats
+the source on each lookup so an edited template is recompiled. The
+bytecode cache in ``PDF_TEMPLATE_CACHE_DIR`` lets new worker processes skip
+compilation altogether. Stylesheet sources are re-read only when their
+mtime changes.
+"""
+import logging
+import os
+import tempfile
+import threading
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+from artifact_store import template_hash
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+PDF_TEMPLATE_CACHE_DIR = os.getenv('PDF_TEMPLATE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'pdf-templates'))
+REPORT_TEMPLATES = {
+    'detailed': 'report_template.html',
+    'summary': 'report_template_summary.html',
+}
+DEFAULT_TEMPLATE = REPORT_TEMPLATES['detailed']
+PAGE_STYLESHEET = 'report_page.css'
+
+logger = logging.getLogger(__name__)
+
+
+def stylesheet_names(template_name):
+    """The page stylesheet and the template's own, in cascade order."""
+    return PAGE_STYLESHEET, os.path.splitext(template_name)[0] + '.css'
+
+
+class ReportTemplates:
+    """Compiled report templates and their stylesheet sources."""
+
+    def __init__(self, template_dir=TEMPLATE_DIR, bytecode_dir=PDF_TEMPLATE_CACHE_DIR):
+        self.template_dir = template_dir
+        bytecode_cache = None
+        if bytecode_dir:
+            os.makedirs(bytecode_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(bytecode_dir)
+        self.env = Environment(loader=FileSystemLoader(template_dir), bytecode_cache=bytecode_cache,
+                               auto_reload=True)
+        self._sources = {}
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def template_name(self, format_type):
+        """The template for a report format; unknown formats and missing templates use the detailed one."""
+        name = REPORT_TEMPLATES.get(format_type, DEFAULT_TEMPLATE)
+        if name != DEFAULT_TEMPLATE and not os.path.exists(os.path.join(self.template_dir, name)):
+            logger.warning(f"Report template {name} not found; using {DEFAULT_TEMPLATE}")
+            return DEFAULT_TEMPLATE
+        return name
+
+    def template(self, template_name):
+        """Compiled template, recompiled if its source changed."""
+        return self.env.get_template(template_name)
+
+    def render(self, template_name, report):
+        """HTML of a report."""
+        return self.template(template_name).render(report=report)
+
+    def stylesheets(self, template_name):
+        """CSS sources for a template, page stylesheet first."""
+        return tuple(source for source in map(self._read, stylesheet_names(template_name)) if source is not None)
+
+    def digest(self, template_name):
+        """Hash of a template and its stylesheets; changes whenever one of the files does."""
+        version = self._version(template_name)
+        digest = self._digests.get(template_name)
+        if digest is None or digest[0] != version:
+            source, _, _ = self.env.loader.get_source(self.env, template_name)
+            digest = self._digests[template_name] = (version, template_hash(source, *self.stylesheets(template_name)))
+        return digest[1]
+
+    def _version(self, template_name):
+        names = (template_name,) + stylesheet_names(template_name)
+        return tuple(self._mtime(os.path.join(self.template_dir, name)) for name in names)
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _read(self, name):
+        path = os.path.join(self.template_dir, name)
+        mtime = self._mtime(path)
+        if mtime is None:
+            return None
+        cached = self._sources.get(name)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with self._lock:
+            with open(path, encoding='utf-8') as f:
+                source = f.read()
+            self._sources[name] = (mtime, source)
+        return source
+
@@ -1,7 +1,12 @@
 import unittest
 import json
+import shutil
+import tempfile
 from unittest.mock import patch, MagicMock
+import app as app_module
 from app import app, limiter
+from artifact_store import ArtifactStore
+from render_pool import RenderPoolSaturated, RenderTimeout
 from datetime import datetime
 
 class TestApp(unittest.TestCase):
@@ -11,6 +16,16 @@ class TestApp(unittest.TestCase):
         self.app.testing = True
         # Disable rate limiting for tests
         limiter.enabled = False
+        # Each test gets an empty artifact store
+        artifact_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, artifact_dir, True)
+        store_patcher = patch.object(app_module, 'artifact_store', ArtifactStore(artifact_dir))
+        self.artifact_store = store_patcher.start()
+        self.addCleanup(store_patcher.stop)
+        # Rendering happens in the (mocked) worker pool
+        pool_patcher = patch.object(app_module, 'render_pool')
+        self.render_pool = pool_patcher.start()
+        self.addCleanup(pool_patcher.stop)
 
     def tearDown(self):
         # Re-enable rate limiting after tests if necessary (though not strictly needed for test client)
@@ -65,7 +80,9 @@ class TestApp(unittest.TestCase):
             mock_connection = MagicMock()
             mock_cursor = MagicMock()
             # Mock project exists but status is 'pending'
-            mock_cursor.fetchone.side_effect = [('Test Project', 35.79, -78.78, 10000.0, 'pending', '{}', None), None]
+            mock_cursor.fetchone.side_effect = [
+                ('Test Project', 35.79, -78.78, 10000.0, 'pending', '{}', None, None, None, None, None, None)
+            ]
             mock_connection.cursor.return_value = mock_cursor
             mock_conn.return_value = mock_connection
 
@@ -81,8 +98,8 @@ class TestApp(unittest.TestCase):
             mock_cursor = MagicMock()
             # Mock project exists and is paid, but no calculation
             mock_cursor.fetchone.side_effect = [
-                ('Test Project', 35.79, -78.78, 10000.0, 'paid', '{}', None),
-                None  # No calculation data
+                # No calculation data
+                ('Test Project', 35.79, -78.78, 10000.0, 'paid', '{}', None, None, None, None, None, None)
             ]
             mock_connection.cursor.return_value = mock_cursor
             mock_conn.return_value = mock_connection
@@ -97,31 +114,38 @@ class TestApp(unittest.TestCase):
         with patch('app.get_db_connection') as mock_conn:
             mock_connection = MagicMock()
             mock_cursor = MagicMock()
-            # Mock project data: (status,) and calculation data: (1,)
-            mock_cursor.fetchone.side_effect = [('paid',), (1,)]
+            # Mock snapshot: (status, calculation exists)
+            mock_cursor.fetchone.side_effect = [('paid', True)]
             mock_connection.cursor.return_value = mock_cursor
             mock_conn.return_value = mock_connection
 
             response = self.app.head('/api/download/12345678-1234-5678-9012-123456789012')
             self.assertEqual(response.status_code, 200)
+            mock_cursor.execute.assert_called_once()
 
     def test_check_pdf_available_unpaid(self):
         """Test HEAD request for PDF availability when project is unpaid"""
         with patch('app.get_db_connection') as mock_conn:
             mock_connection = MagicMock()
             mock_cursor = MagicMock()
-            # Mock only project data: (status,) - no calculation check needed for unpaid
-            mock_cursor.fetchone.return_value = ('pending',)
+            # Mock snapshot: (status, calculation exists)
+            mock_cursor.fetchone.return_value = ('pending', True)
             mock_connection.cursor.return_value = mock_cursor
             mock_conn.return_value = mock_connection
 
             response = self.app.head('/api/download/12345678-1234-5678-9012-123456789012')
             self.assertEqual(response.status_code, 403)
 
-    @patch('app.cache.set')
-    @patch('app.HTML')
+    def paid_project_rows(self, calculation_id='calc-1'):
+        return [
+            # Report snapshot: project_name, lat, lon, cost, status, metadata, created_at,
+            # then the latest calculation's id, annual_kwh, shading_loss_pct, financial_data, created_at
+            ('Test Project', 35.79, -78.78, 10000.0, 'paid', '{}', datetime(2023, 1, 1, 10, 0, 0),
+             calculation_id, 10000.0, 0.05, '{}', datetime(2023, 1, 1, 11, 0, 0))
+        ]
+
     @patch('app.get_db_connection')
-    def test_download_pdf_success(self, mock_get_db_connection, mock_html, mock_cache_set):
+    def test_download_pdf_success(self, mock_get_db_connection):
         """Test successful PDF download"""
         mock_connection = MagicMock()
         mock_cursor = MagicMock()
@@ -129,33 +153,123 @@ class TestApp(unittest.TestCase):
         mock_connection.cursor.return_value = mock_cursor
 
         # Mock project and calculation data
-        mock_cursor.fetchone.side_effect = [
-            # Project data: project_name, lat, lon, cost, status, metadata, created_at
-            ('Test Project', 35.79, -78.78, 10000.0, 'paid', '{}', datetime(2023, 1, 1, 10, 0, 0)),
-            # Calculation data: annual_kwh, shading_loss_pct, financial_data, created_at
-            (10000.0, 0.05, '{}', datetime(2023, 1, 1, 11, 0, 0))
-        ]
+        mock_cursor.fetchone.side_effect = self.paid_project_rows()
 
-        # Mock WeasyPrint HTML().write_pdf
-        mock_html_instance = MagicMock()
-        mock_html.return_value = mock_html_instance
-        mock_html_instance.write_pdf.return_value = b"dummy pdf content"
+        # Mock the WeasyPrint render pool
+        self.render_pool.render.return_value = b"dummy pdf content"
 
         response = self.app.get('/api/download/12345678-1234-5678-9012-123456789012')
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.mimetype, 'application/pdf')
         self.assertEqual(response.data, b"dummy pdf content")
-        mock_cache_set.assert_called_once() # Ensure caching is called
+        self.assertTrue(response.headers['ETag'])
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+        self.assertEqual(self.artifact_store.stats()['artifacts'], 1)
+        # Project and latest calculation come from one snapshot lookup
+        mock_cursor.execute.assert_called_once()
+        self.assertIn('FROM project_reports WHERE project_id = %s', mock_cursor.execute.call_args[0][0])
+        # The HTML carries no styles; the worker applies the parsed page and report stylesheets
+        html, stylesheets = self.render_pool.render.call_args[0]
+        self.assertIn('Test Project', html)
+        self.assertNotIn('<style', html)
+        self.assertEqual(stylesheets, app_module.report_templates.stylesheets('report_template.html'))
+
+    @patch('app.get_db_connection')
+    def test_download_pdf_is_rendered_once_and_served_conditionally(self, mock_get_db_connection):
+        """Test that stored reports answer repeat, If-None-Match and Range requests"""
+        mock_cursor = MagicMock()
+        mock_get_db_connection.return_value.cursor.return_value = mock_cursor
+        self.render_pool.render.return_value = b"0123456789"
+        url = '/api/download/12345678-1234-5678-9012-123456789012'
+
+        mock_cursor.fetchone.side_effect = self.paid_project_rows()
+        etag = self.app.get(url).headers['ETag']
+        mock_cursor.fetchone.side_effect = self.paid_project_rows()
+        self.assertEqual(self.app.get(url, headers={'If-None-Match': etag}).status_code, 304)
+        mock_cursor.fetchone.side_effect = self.paid_project_rows()
+        partial = self.app.get(url, headers={'Range': 'bytes=2-5'})
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial.data, b"2345")
+        self.assertEqual(partial.headers['Content-Range'], 'bytes 2-5/10')
+        self.render_pool.render.assert_called_once()
+
+        # Options and new calculations are separate artifacts with their own ETags
+        mock_cursor.fetchone.side_effect = self.paid_project_rows()
+        summary = self.app.get(url + '?format=summary')
+        mock_cursor.fetchone.side_effect = self.paid_project_rows('calc-2')
+        recalculated = self.app.get(url)
+        self.assertEqual(len({etag, summary.headers['ETag'], recalculated.headers['ETag']}), 3)
+        self.assertEqual(self.render_pool.render.call_count, 3)
+
+    @patch('app.get_db_connection')
+    def test_download_pdf_when_render_pool_is_saturated(self, mock_get_db_connection):
+        """Test that a saturated render pool answers 503 with Retry-After and stores nothing"""
+        mock_cursor = MagicMock()
+        mock_get_db_connection.return_value.cursor.return_value = mock_cursor
+        mock_cursor.fetchone.side_effect = self.paid_project_rows()
+        self.render_pool.render.side_effect = RenderPoolSaturated(12)
+
+        response = self.app.get('/api/download/12345678-1234-5678-9012-123456789012')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '12')
+        self.assertEqual(json.loads(response.data)['retry_after'], 12)
+        self.assertEqual(self.artifact_store.stats()['artifacts'], 0)
+
+        mock_cursor.fetchone.side_effect = self.paid_project_rows()
+        self.render_pool.render.side_effect = RenderTimeout('PDF rendering exceeded 60s')
+        response = self.app.get('/api/download/12345678-1234-5678-9012-123456789012')
+        self.assertEqual(response.status_code, 504)
+
+    def test_render_stats(self):
+        """Test render pool metrics endpoint"""
+        self.render_pool.stats.return_value = {"workers": 2, "busy": 1, "waiting": 3}
+        response = self.app.get('/api/render/stats')
+        self.assertEqual(json.loads(response.data)['waiting'], 3)
 
-    @patch('app.cache.delete')
     @patch('app.get_db_connection')
-    def test_delete_project_data_success(self, mock_get_db_connection, mock_cache_delete):
+    def test_prerender_reports_stores_detailed_and_summary(self, mock_get_db_connection):
+        """Test that warm-up renders the reports the first download will ask for"""
+        mock_cursor = MagicMock()
+        mock_get_db_connection.return_value.cursor.return_value = mock_cursor
+        self.render_pool.render.return_value = b"prerendered"
+
+        mock_cursor.fetchone.side_effect = self.paid_project_rows()
+        self.assertEqual(app_module.prerender_reports('12345678-1234-5678-9012-123456789012'), 2)
+        self.assertEqual(self.artifact_store.stats()['artifacts'], 2)
+
+        # The first download after payment is served from the store
+        mock_cursor.fetchone.side_effect = self.paid_project_rows()
+        response = self.app.get('/api/download/12345678-1234-5678-9012-123456789012?format=summary')
+        self.assertEqual(response.data, b"prerendered")
+        self.assertEqual(self.render_pool.render.call_count, 2)
+
+        # Unpaid projects are skipped
+        mock_cursor.fetchone.side_effect = [
+            ('Test Project', 35.79, -78.78, 10000.0, 'pending', '{}', None, None, None, None, None, None)
+        ]
+        self.assertEqual(app_module.prerender_reports('12345678-1234-5678-9012-123456789012'), 0)
+
+    @patch('app.start_warmup')
+    @patch('app.report_warmup')
+    def test_prerender_endpoint_queues_the_project(self, mock_warmup, mock_start):
+        """Test manual warm-up requests"""
+        mock_warmup.submit.return_value = True
+        response = self.app.post('/api/prerender/12345678-1234-5678-9012-123456789012')
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(json.loads(response.data)['queued'])
+        mock_warmup.submit.assert_called_once_with('12345678-1234-5678-9012-123456789012')
+        self.assertEqual(self.app.post('/api/prerender/not-a-uuid').status_code, 400)
+
+    @patch('app.get_db_connection')
+    def test_delete_project_data_success(self, mock_get_db_connection):
         """Test successful GDPR data deletion"""
         mock_connection = MagicMock()
         mock_cursor = MagicMock()
         mock_get_db_connection.return_value = mock_connection
         mock_connection.cursor.return_value = mock_cursor
         mock_cursor.fetchone.return_value = ('some_id',) # Project exists
+        key = ArtifactStore.key('12345678-1234-5678-9012-123456789012', 'calc-1', 'detailed', True, 't')
+        self.artifact_store.put('12345678-1234-5678-9012-123456789012', key, b'pdf')
 
         response = self.app.delete('/api/data/privacy/12345678-1234-5678-9012-123456789012')
         self.assertEqual(response.status_code, 200)
@@ -164,7 +278,7 @@ class TestApp(unittest.TestCase):
         mock_cursor.execute.assert_any_call("DELETE FROM calculations WHERE project_id = %s", ('12345678-1234-5678-9012-123456789012',))
         mock_cursor.execute.assert_any_call("DELETE FROM projects WHERE id = %s", ('12345678-1234-5678-9012-123456789012',))
         mock_connection.commit.assert_called_once()
-        mock_cache_delete.assert_called_once_with('pdf_12345678-1234-5678-9012-123456789012')
+        self.assertIsNone(self.artifact_store.get('12345678-1234-5678-9012-123456789012', key))
 
     @patch('app.get_db_connection')
     def test_delete_project_data_not_found(self, mock_get_db_connection):
@@ -199,10 +313,11 @@ class TestApp(unittest.TestCase):
             -78.78, # location_lon (6)
             'POINT (1 1)', # lidar_geom (7)
             json.dumps({'key': 'value'}), # metadata (JSONB) (8)
-            10000.0, # annual_kwh (9)
-            0.05, # shading_loss_pct (10)
-            json.dumps({'financial_key': 'financial_value'}), # financial_data (JSONB) (11)
-            datetime(2023, 1, 1, 11, 0, 0) # calc_created_at (12)
+            'calc-1', # calculation_id (9)
+            10000.0, # annual_kwh (10)
+            0.05, # shading_loss_pct (11)
+            json.dumps({'financial_key': 'financial_value'}), # financial_data (JSONB) (12)
+            datetime(2023, 1, 1, 11, 0, 0) # calc_created_at (13)
         )
 
         response = self.app.get('/api/data/export/12345678-1234-5678-9012-123456789012')
@@ -211,6 +326,13 @@ class TestApp(unittest.TestCase):
         self.assertEqual(data['project_id'], '12345678-1234-5678-9012-123456789012')
         self.assertIn('calculation_data', data)
         self.assertIn('export_timestamp', data)
+        self.assertEqual(data['calculation_data']['annual_kwh'], 10000.0)
+        self.assertEqual(data['metadata'], json.dumps({'key': 'value'}))
+
+        # A project without calculations exports no calculation data
+        mock_cursor.fetchone.return_value = mock_cursor.fetchone.return_value[:9] + (None,) * 5
+        data = json.loads(self.app.get('/api/data/export/12345678-1234-5678-9012-123456789012').data)
+        self.assertIsNone(data['calculation_data'])
 
     @patch('app.get_db_connection')
     def test_export_project_data_not_found(self, mock_get_db_connection):
@@ -226,23 +348,26 @@ class TestApp(unittest.TestCase):
         data = json.loads(response.data)
         self.assertIn('Project not found', data['error'])
 
-    @patch('app.cache.delete')
-    def test_clear_pdf_cache_success(self, mock_cache_delete):
+    def test_clear_pdf_cache_success(self):
         """Test successful clearing of specific PDF cache"""
+        key = ArtifactStore.key('12345678-1234-5678-9012-123456789012', 'calc-1', 'detailed', True, 't')
+        self.artifact_store.put('12345678-1234-5678-9012-123456789012', key, b'pdf')
         response = self.app.post('/api/cache/clear/12345678-1234-5678-9012-123456789012')
         self.assertEqual(response.status_code, 200)
         data = json.loads(response.data)
         self.assertIn('Cache cleared', data['message'])
-        mock_cache_delete.assert_called_once_with('pdf_12345678-1234-5678-9012-123456789012')
+        self.assertEqual(data['artifacts'], 1)
+        self.assertIsNone(self.artifact_store.get('12345678-1234-5678-9012-123456789012', key))
 
-    @patch('app.cache.clear')
-    def test_clear_all_cache_success(self, mock_cache_clear):
+    def test_clear_all_cache_success(self):
         """Test successful clearing of all PDF caches"""
+        self.artifact_store.put('a', ArtifactStore.key('a', 'c', 'detailed', True, 't'), b'pdf')
+        self.artifact_store.put('b', ArtifactStore.key('b', 'c', 'detailed', True, 't'), b'pdf')
         response = self.app.post('/api/cache/clear-all')
         self.assertEqual(response.status_code, 200)
         data = json.loads(response.data)
         self.assertIn('All PDF caches cleared', data['message'])
-        mock_cache_clear.assert_called_once()
+        self.assertEqual(data['artifacts'], 2)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from artifact_store import ArtifactStore, template_hash
+
+PROJECT = '12345678-1234-5678-9012-123456789012'
+
+
+class TestArtifactStore(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+        self.store = ArtifactStore(self.root)
+
+    def test_key_covers_every_rendering_input(self):
+        base = (PROJECT, 'calc-1', 'detailed', True, template_hash('<html>', 'body {}'))
+        keys = {
+            ArtifactStore.key(*base),
+            ArtifactStore.key(PROJECT, 'calc-2', 'detailed', True, base[4]),
+            ArtifactStore.key(PROJECT, 'calc-1', 'summary', True, base[4]),
+            ArtifactStore.key(PROJECT, 'calc-1', 'detailed', False, base[4]),
+            ArtifactStore.key(PROJECT, 'calc-1', 'detailed', True, template_hash('<html>', 'body {color: red}')),
+        }
+        self.assertEqual(len(keys), 5)
+        self.assertEqual(ArtifactStore.key(*base), ArtifactStore.key(*base))
+
+    def test_put_then_get(self):
+        key = ArtifactStore.key(PROJECT, 'calc-1', 'detailed', True, 't')
+        self.assertIsNone(self.store.get(PROJECT, key))
+        path = self.store.put(PROJECT, key, b'%PDF-1.7 report')
+        self.assertEqual(self.store.get(PROJECT, key), path)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'%PDF-1.7 report')
+        # No temporary files are left behind
+        self.assertEqual([name for name in os.listdir(os.path.dirname(path)) if name.endswith('.tmp')], [])
+
+    def test_new_calculation_replaces_older_reports(self):
+        old = ArtifactStore.key(PROJECT, 'calc-1', 'detailed', True, 't')
+        sibling = ArtifactStore.key(PROJECT, 'calc-2', 'summary', True, 't')
+        self.store.put(PROJECT, old, b'old')
+        self.store.put(PROJECT, sibling, b'summary')
+        self.store.put(PROJECT, ArtifactStore.key(PROJECT, 'calc-2', 'detailed', True, 't'), b'new')
+        self.assertIsNone(self.store.get(PROJECT, old))
+        self.assertIsNotNone(self.store.get(PROJECT, sibling))
+        self.assertEqual(self.store.stats()['artifacts'], 2)
+
+    def test_open_report_survives_a_prune(self):
+        old = ArtifactStore.key(PROJECT, 'calc-1', 'detailed', True, 't')
+        self.store.put(PROJECT, old, b'old report')
+        with self.store.open(PROJECT, old) as report:
+            self.store.put(PROJECT, ArtifactStore.key(PROJECT, 'calc-2', 'detailed', True, 't'), b'new')
+            self.assertIsNone(self.store.open(PROJECT, old))
+            self.assertEqual(report.read(), b'old report')
+
+    def test_prune_skips_reports_being_rendered(self):
+        old = ArtifactStore.key(PROJECT, 'calc-1', 'detailed', True, 't')
+        new = ArtifactStore.key(PROJECT, 'calc-2', 'detailed', True, 't')
+        self.store.put(PROJECT, old, b'old')
+        with self.store.rendering(PROJECT, old):
+            self.store.put(PROJECT, new, b'new')
+            self.assertIsNotNone(self.store.get(PROJECT, old))
+        # Renders waiting on a pruned lock file take the lock on its replacement
+        self.store.put(PROJECT, new, b'new')
+        self.assertIsNone(self.store.get(PROJECT, old))
+        with self.store.rendering(PROJECT, old):
+            self.assertTrue(os.path.exists(self.store.path(PROJECT, old) + '.lock'))
+
+    def test_delete_and_clear(self):
+        self.store.put(PROJECT, ArtifactStore.key(PROJECT, 'c', 'detailed', True, 't'), b'a')
+        self.store.put('other', ArtifactStore.key('other', 'c', 'detailed', True, 't'), b'b')
+        self.assertEqual(self.store.delete_project(PROJECT), 1)
+        self.assertEqual(self.store.delete_project(PROJECT), 0)
+        self.assertEqual(self.store.clear(), 1)
+        self.assertEqual(self.store.stats()['artifacts'], 0)
+
+    def test_concurrent_misses_render_once(self):
+        key = ArtifactStore.key(PROJECT, 'calc-1', 'detailed', True, 't')
+        renders = []
+
+        def download():
+            with self.store.rendering(PROJECT, key):
+                if self.store.get(PROJECT, key) is None:
+                    renders.append(1)
+                    self.store.put(PROJECT, key, b'pdf')
+
+        threads = [threading.Thread(target=download) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(renders), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
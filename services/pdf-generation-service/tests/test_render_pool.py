@@ -0,0 +1,115 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from render_pool import RenderError, RenderPool, RenderPoolSaturated, RenderTimeout, StylesheetCache
+
+
+def echo_renderer(preload):
+    """Stands in for WeasyPrint: 'sleep:<seconds>' blocks, 'fail' raises, anything else is echoed."""
+    stylesheets = StylesheetCache(str.upper)
+    for sources in preload:
+        stylesheets.get(sources)
+
+    def render(html, sources):
+        if html.startswith('sleep:'):
+            time.sleep(float(html.split(':')[1]))
+        if html == 'fail':
+            raise ValueError('bad markup')
+        sheets = stylesheets.get(sources)
+        # Prefixed with how many stylesheet sets this worker has parsed
+        return f"{stylesheets.parsed}:{''.join(sheets)}{html}".encode('utf-8')
+
+    return render
+
+
+def broken_renderer(preload):
+    raise ImportError('no pango')
+
+
+class TestRenderPool(unittest.TestCase):
+
+    def pool(self, **kwargs):
+        pool = RenderPool(preload=[('css:',)], renderer_factory=echo_renderer, **kwargs)
+        self.addCleanup(pool.stop)
+        return pool
+
+    def test_renders_in_worker_processes(self):
+        pool = self.pool(workers=2)
+        self.assertEqual(pool.render('<p>a</p>', ['css:']), b'1:CSS:<p>a</p>')
+        self.assertEqual(pool.render('<p>b</p>', ['css:']), b'1:CSS:<p>b</p>')
+        stats = pool.stats()
+        self.assertEqual(stats['rendered'], 2)
+        self.assertEqual(stats['idle'], 2)
+        self.assertEqual(stats['busy'], 0)
+
+    def test_render_errors_keep_the_worker(self):
+        pool = self.pool(workers=1)
+        with self.assertRaises(RenderError):
+            pool.render('fail')
+        self.assertEqual(pool.render('ok'), b'2:ok')
+        self.assertEqual(pool.stats()['restarts'], 0)
+
+    def test_timeout_replaces_the_worker(self):
+        pool = self.pool(workers=1, timeout=0.5)
+        pool.render('warm')
+        with self.assertRaises(RenderTimeout):
+            pool.render('sleep:30')
+        self.assertEqual(pool.render('after', ['css:']), b'1:CSS:after')
+        stats = pool.stats()
+        self.assertEqual((stats['timeouts'], stats['restarts']), (1, 1))
+
+    def test_failed_respawn_is_retried_on_next_render(self):
+        pool = self.pool(workers=1, timeout=0.5)
+        pool.render('warm')
+        spawn = pool._spawn
+        pool._spawn = mock.Mock(side_effect=OSError('fork failed'))
+        with self.assertRaises(RenderTimeout):
+            pool.render('sleep:30')
+        # The dead worker is not queued again; its slot waits for a respawn
+        self.assertEqual((pool.stats()['idle'], pool.stats()['missing'], pool.stats()['busy']), (0, 1, 0))
+        with self.assertRaisesRegex(RenderError, 'fork failed'):
+            pool.render('next')
+        self.assertEqual(pool.stats()['missing'], 1)
+        pool._spawn = spawn
+        self.assertEqual(pool.render('after', ['css:']), b'1:CSS:after')
+        self.assertEqual((pool.stats()['idle'], pool.stats()['missing'], pool.stats()['busy']), (1, 0, 0))
+
+    def test_saturated_pool_rejects_with_retry_after(self):
+        pool = self.pool(workers=1, queue_size=1, queue_timeout=0.2)
+        pool.render('warm')
+        busy = threading.Thread(target=pool.render, args=('sleep:1.5',))
+        busy.start()
+        self.addCleanup(busy.join)
+        time.sleep(0.2)
+        # One request may wait, but not past the queue timeout
+        with self.assertRaises(RenderPoolSaturated) as waited:
+            pool.render('queued')
+        self.assertGreaterEqual(waited.exception.retry_after, 1)
+        self.assertEqual(pool.stats()['rejected'], 1)
+
+    def test_worker_that_cannot_start(self):
+        pool = RenderPool(workers=1, renderer_factory=broken_renderer)
+        self.addCleanup(pool.stop)
+        with self.assertRaisesRegex(RenderError, 'no pango'):
+            pool.render('<p>a</p>')
+
+
+class TestStylesheetCache(unittest.TestCase):
+
+    def test_each_set_is_parsed_once(self):
+        parsed = []
+        cache = StylesheetCache(lambda source: parsed.append(source) or source.upper(), max_sets=2)
+        self.assertEqual(cache.get(['a', 'b']), ['A', 'B'])
+        self.assertEqual(cache.get(('a', 'b')), ['A', 'B'])
+        self.assertEqual(parsed, ['a', 'b'])
+        # An edited stylesheet is a new set; the oldest set is dropped past max_sets
+        cache.get(['a', 'b2'])
+        cache.get(['a', 'b3'])
+        cache.get(['a', 'b'])
+        self.assertEqual(cache.parsed, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from report_templates import TEMPLATE_DIR, ReportTemplates
+
+
+class TestReportTemplates(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.clock = time.time()
+        self.addCleanup(shutil.rmtree, self.dir, True)
+        self.write('report_template.html', '<h1>{{ report.project_name }}</h1>')
+        self.write('report_template.css', 'h1 { color: green; }')
+        self.write('report_page.css', '@page { size: A4; }')
+        self.templates = ReportTemplates(self.dir, bytecode_dir=os.path.join(self.dir, 'bytecode'))
+
+    def write(self, name, source):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as f:
+            f.write(source)
+        # Every write gets a later mtime, even on coarse-grained filesystems
+        self.clock += 10
+        os.utime(path, (self.clock, self.clock))
+
+    def test_template_names(self):
+        self.assertEqual(self.templates.template_name('detailed'), 'report_template.html')
+        self.assertEqual(self.templates.template_name('unknown'), 'report_template.html')
+        # A missing summary template falls back to the detailed one
+        with self.assertLogs('report_templates', 'WARNING'):
+            self.assertEqual(self.templates.template_name('summary'), 'report_template.html')
+        self.write('report_template_summary.html', '<p>{{ report.project_name }}</p>')
+        self.assertEqual(self.templates.template_name('summary'), 'report_template_summary.html')
+
+    def test_stylesheets_in_cascade_order(self):
+        self.assertEqual(self.templates.stylesheets('report_template.html'),
+                         ('@page { size: A4; }', 'h1 { color: green; }'))
+        self.write('report_template_summary.html', '<p></p>')
+        self.assertEqual(self.templates.stylesheets('report_template_summary.html'), ('@page { size: A4; }',))
+
+    def test_edits_are_picked_up(self):
+        self.assertEqual(self.templates.render('report_template.html', {'project_name': 'A'}), '<h1>A</h1>')
+        digest = self.templates.digest('report_template.html')
+        self.assertEqual(self.templates.digest('report_template.html'), digest)
+
+        self.write('report_template.css', 'h1 { color: red; }')
+        self.assertEqual(self.templates.stylesheets('report_template.html')[1], 'h1 { color: red; }')
+        css_digest = self.templates.digest('report_template.html')
+        self.assertNotEqual(css_digest, digest)
+
+        self.write('report_template.html', '<h2>{{ report.project_name }}</h2>')
+        self.assertEqual(self.templates.render('report_template.html', {'project_name': 'A'}), '<h2>A</h2>')
+        self.assertNotEqual(self.templates.digest('report_template.html'), css_digest)
+
+    def test_bytecode_is_cached_for_new_workers(self):
+        self.templates.template('report_template.html')
+        self.assertTrue(os.listdir(os.path.join(self.dir, 'bytecode')))
+        fresh = ReportTemplates(self.dir, bytecode_dir=os.path.join(self.dir, 'bytecode'))
+        self.assertEqual(fresh.render('report_template.html', {'project_name': 'B'}), '<h1>B</h1>')
+
+    def test_shipped_templates_keep_styles_in_stylesheets(self):
+        templates = ReportTemplates(TEMPLATE_DIR, bytecode_dir=None)
+        for format_type in ('detailed', 'summary'):
+            name = templates.template_name(format_type)
+            self.assertNotIn('<style', templates.env.loader.get_source(templates.env, name)[0])
+            self.assertEqual(len(templates.stylesheets(name)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import threading
+import unittest
+
+from warmup import ReportWarmup
+
+
+class TestReportWarmup(unittest.TestCase):
+
+    def test_renders_each_submitted_project(self):
+        done = threading.Event()
+        rendered = []
+
+        def render(project_id):
+            rendered.append(project_id)
+            if len(rendered) == 2:
+                done.set()
+
+        warmup = ReportWarmup(render)
+        self.addCleanup(warmup.stop)
+        warmup.start()
+        self.assertTrue(warmup.submit('a'))
+        self.assertTrue(warmup.submit('b'))
+        self.assertTrue(done.wait(5))
+        self.assertEqual(rendered, ['a', 'b'])
+
+    def test_pending_project_is_not_queued_twice(self):
+        release = threading.Event()
+        warmup = ReportWarmup(lambda project_id: release.wait(5))
+        self.assertTrue(warmup.submit('a'))
+        # Stripe redelivers webhooks; the duplicate notification is ignored
+        self.assertFalse(warmup.submit('a'))
+        self.assertEqual(warmup.stats()['pending'], 1)
+
+    def test_full_queue_drops_to_render_on_download(self):
+        warmup = ReportWarmup(lambda project_id: None, queue_size=1)
+        self.assertTrue(warmup.submit('a'))
+        self.assertFalse(warmup.submit('b'))
+        self.assertEqual(warmup.stats()['dropped'], 1)
+
+    def test_failures_are_counted_and_cleared(self):
+        done = threading.Event()
+
+        def render(project_id):
+            done.set()
+            raise RuntimeError("render failed")
+
+        warmup = ReportWarmup(render)
+        self.addCleanup(warmup.stop)
+        warmup.start()
+        warmup.submit('a')
+        self.assertTrue(done.wait(5))
+        for _ in range(100):
+            if warmup.stats()['pending'] == 0:
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual(warmup.stats()['failed'], 1)
+        # A failed project can be queued again
+        self.assertTrue(warmup.submit('a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+"""Background pre-rendering of reports for newly paid projects.
+
+The payment service sends ``NOTIFY <REPORT_WARMUP_CHANNEL>, '<project_id>'``
+in the transaction that marks a project paid. :class:`ReportWarmup`
+listens on that channel on its own autocommit connection (``LISTEN``
+cannot share a pooled one) and queues each project for a small pool of
+render threads, which store the reports in the artifact store before the
+customer asks for them.
+
+Notifications sent while no listener is connected are not replayed; those
+projects are rendered on their first download, as before. A project
+already queued or rendering is not queued again, so Stripe's redelivered
+webhooks cost nothing.
+"""
+import logging
+import os
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+from psycopg2 import sql
+
+REPORT_WARMUP_CHANNEL = os.getenv('REPORT_WARMUP_CHANNEL', 'report_warmup')
+PDF_WARMUP_WORKERS = int(os.getenv('PDF_WARMUP_WORKERS', '1'))
+PDF_WARMUP_QUEUE = int(os.getenv('PDF_WARMUP_QUEUE', '256'))
+LISTEN_POLL_SECONDS = 5
+RECONNECT_MAX_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+
+class ReportWarmup:
+    """Queue of projects whose reports ``render(project_id)`` should store ahead of time."""
+
+    def __init__(self, render, dsn=None, channel=REPORT_WARMUP_CHANNEL, workers=PDF_WARMUP_WORKERS,
+                 queue_size=PDF_WARMUP_QUEUE):
+        self.render = render
+        self.dsn = dsn
+        self.channel = channel
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self.notified = 0
+        self.rendered = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def start(self):
+        """Start the render threads, and the listener when there is a ``dsn``; idempotent."""
+        with self._lock:
+            if self._threads:
+                return
+            targets = [self._work] * self.workers
+            if self.dsn:
+                targets.append(self._listen)
+            self._threads = [threading.Thread(target=target, name='report-warmup', daemon=True) for target in targets]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+        for _ in range(self.workers):
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                pass
+
+    def submit(self, project_id):
+        """Queue a project; False if it is already pending or the queue is full."""
+        with self._lock:
+            if project_id in self._pending:
+                return False
+            try:
+                self._queue.put_nowait(project_id)
+            except queue.Full:
+                self.dropped += 1
+                logger.warning(f"Report warm-up queue full; {project_id} will render on first download")
+                return False
+            self._pending.add(project_id)
+        return True
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "pending": len(self._pending),
+            "notified": self.notified,
+            "rendered": self.rendered,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "listening": any(thread.is_alive() for thread in self._threads[self.workers:]),
+        }
+
+    def _work(self):
+        while not self._stop.is_set():
+            project_id = self._queue.get()
+            if project_id is None:
+                return
+            start = time.perf_counter()
+            try:
+                self.render(project_id)
+                self.rendered += 1
+                logger.info(f"Pre-rendered reports for project {project_id} in {time.perf_counter() - start:.2f}s")
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Report warm-up failed for project {project_id}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(project_id)
+
+    def _listen(self):
+        backoff = 1
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+                logger.info(f"Listening for paid projects on '{self.channel}'")
+                backoff = 1
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], LISTEN_POLL_SECONDS) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self.notified += 1
+                        self.submit(notify.payload)
+            except psycopg2.Error as e:
+                logger.error(f"Report warm-up listener lost its connection: {e}; retrying in {backoff}s")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, RECONNECT_MAX_SECONDS)
+            finally:
+                if conn is not None:
+                    conn.close()